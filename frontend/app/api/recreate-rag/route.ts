@@ -3,10 +3,75 @@ import { spawn } from 'child_process';
 import { join, dirname } from 'path';
 import { existsSync } from 'fs';
 
+// Resident ingestion service (src/ingestion_service.py)
+const INGEST_SERVICE_URL = process.env.INGEST_SERVICE_URL || 'http://127.0.0.1:8765';
+const JOB_POLL_INTERVAL_MS = 500;
+const JOB_TIMEOUT_MS = 10 * 60 * 1000;
+
+type IngestionJob = {
+  id: string;
+  kind: string;
+  state: 'queued' | 'running' | 'succeeded' | 'failed';
+  stage: string | null;
+  done: number;
+  total: number;
+  version: string | null;
+  error: string | null;
+};
+
+// Queue an incremental ingestion job and wait until it has finished.
+// Returns null when the service is not running.
+async function runIngestionJob(): Promise<IngestionJob | null> {
+  let response: Response;
+  try {
+    response = await fetch(`${INGEST_SERVICE_URL}/jobs`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ kind: 'update' }),
+    });
+  } catch {
+    return null;
+  }
+  let job: IngestionJob = await response.json();
+  if (!response.ok) {
+    throw new Error(`Ingestion service rejected the job: ${JSON.stringify(job)}`);
+  }
+  console.log('Queued ingestion job:', job.id);
+
+  const deadline = Date.now() + JOB_TIMEOUT_MS;
+  while (job.state === 'queued' || job.state === 'running') {
+    if (Date.now() > deadline) {
+      throw new Error(`Ingestion job ${job.id} did not finish in time`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    job = await (await fetch(`${INGEST_SERVICE_URL}/jobs/${job.id}`)).json();
+  }
+  return job;
+}
+
 export async function POST() {
   try {
     console.log('Starting RAG recreation process...');
-    
+
+    const job = await runIngestionJob();
+    if (job) {
+      if (job.state === 'succeeded') {
+        console.log('Ingestion job completed:', job.id, job.version);
+        return NextResponse.json({
+          success: true,
+          message: 'Knowledge base updated successfully',
+          job,
+        });
+      }
+      console.error('Ingestion job failed:', job.error);
+      return NextResponse.json(
+        { error: 'Failed to update knowledge base', details: job.error, job },
+        { status: 500 }
+      );
+    }
+
+    // Ingestion service not running: fall back to a one-off rebuild
+    console.warn('Ingestion service unavailable at', INGEST_SERVICE_URL, '- running recreate_rag.py');
     const scriptPath = join(process.cwd(), '..', 'src', 'recreate_rag.py');
     console.log('Script path:', scriptPath);
     
@@ -58,7 +123,8 @@ export async function POST() {
 
     if (result.code === 0) {
       console.log('RAG recreation completed successfully');
-      return NextResponse.json({ 
+      return NextResponse.json({
+        success: true,
         message: 'Knowledge base updated successfully',
         output: result.stdout 
       });
@@ -14,13 +14,21 @@ from livekit.agents import (
     cli,
     metrics,
     AutoSubscribe,
+    ChatContext,
+    ChatMessage,
 )
 from livekit.agents.voice import MetricsCollectedEvent
 from livekit.plugins import google, noise_cancellation
 from google.genai import types
 
 
-from prompts import AGENT_INSTRUCTIONS, SESSION_INSTRUCTIONS
+from prompts import (
+    AGENT_INSTRUCTIONS,
+    EMERGENCY_NUMBERS,
+    RAG_FILLER_INSTRUCTIONS,
+    SESSION_INSTRUCTIONS,
+    STILL_RUNNING_FALLBACK,
+)
 from livekit.agents.llm import function_tool
 
 
@@ -29,10 +37,17 @@ logger = logging.getLogger("agent")
 load_dotenv(".env.local")
 
 # Imports for RAG with Livekit
-from livekit_rag import livekit_rag
+from answer_stream import collect_answer
+from livekit_rag import livekit_rag_stream, retrieved_passages
+from deadlines import ToolDeadlines, format_late_results
+from response_cache import response_cache
+from retrieval import aembed_query
+from semantic_cache import semantic_cache
+from index_registry import registry
 
 # Imports for RAG with LlamaIndex
 from llamaindex_rag import setup_combined_agent
+from agent_budget import run_traced
 
 # Import for AutoGen Operator
 from autogen_operator import run_operator_task, search_therapists_near, book_therapy_appointment, get_crisis_help
@@ -43,12 +58,31 @@ from browser import run_browser_automation
 # Import shared data store
 from shared_data import shared_data
 
-workflow_agent, index, file_tools = setup_combined_agent()
+# Optional automatic ingestion of new uploads (WATCH_DATA_DIR=1)
+from data_watcher import start_auto_ingest, watch_enabled
+from llamaindex_rag import DATA_DIR, PERSIST_DIR
 
 
 class Assistant(Agent):
     def __init__(self) -> None:
         super().__init__(instructions=AGENT_INSTRUCTIONS)
+        # slow tools answer with a partial result and finish in the background
+        self._deadlines = ToolDeadlines()
+
+    async def on_user_turn_completed(
+        self, turn_ctx: ChatContext, new_message: ChatMessage
+    ) -> None:
+        # hand over results that finished after their tool had already answered
+        late = self._deadlines.take_late_results()
+        if late:
+            turn_ctx.add_message(role="assistant", content=format_late_results(late))
+
+    async def _within_budget(self, context: RunContext, name: str, work, fallback):
+        """Run a tool's work under its budget and the deadline of the current turn."""
+        # the handle's id, not id(handle): addresses of finished turns are
+        # reused, and a new turn must not inherit an old turn's start time
+        turn = context.speech_handle.id
+        return await self._deadlines.run(name, work, fallback, turn=turn)
 
     # all functions annotated with @function_tool will be passed to the LLM when this
     # agent is active
@@ -63,7 +97,24 @@ class Assistant(Agent):
         """
 
         try:
-            response = await livekit_rag(query)
+            session = context.session
+
+            # The Gemini realtime session has no separate TTS (session.tts is
+            # None), so the answer can't be read out while it streams: the
+            # model only speaks once the tool returns. The stream is collected
+            # and a filler covers the wait instead.
+            def say_filler():
+                try:
+                    session.generate_reply(instructions=RAG_FILLER_INSTRUCTIONS)
+                except Exception as e:
+                    logger.warning(f"Could not say a filler: {e}")
+
+            response = await self._within_budget(
+                context,
+                "LiveKit_RAG_tool",
+                collect_answer(livekit_rag_stream(query), say_filler),
+                lambda: retrieved_passages(query),
+            )
             logger.info(f"Livekit RAG Response: {response}")
             return str(response)
 
@@ -81,9 +132,34 @@ class Assistant(Agent):
         """
 
         try:
-            response = await workflow_agent.run(query)
-            logger.info(f"Workflow Response: {response}")
-            return str(response)
+            # the handle before the agent: if a new version is published in
+            # between, the answer is cached under the older revision, which the
+            # caches drop, never the other way round
+            handle = registry.get(PERSIST_DIR, DATA_DIR)
+            workflow_agent, _, _ = setup_combined_agent()
+
+            async def run_workflow():
+                # the query embedding counts against the budget too
+                embedding = await aembed_query(handle.index, query)
+                cached = semantic_cache.lookup(
+                    query, embedding, handle.revision, "workflow"
+                )
+                if cached is not None:
+                    return cached
+                # bounded steps and tool calls; the steps taken are logged
+                response, _ = await run_traced(workflow_agent, query)
+                logger.info(f"Workflow Response: {response}")
+                semantic_cache.add(
+                    query, embedding, handle.revision, str(response), "workflow"
+                )
+                return str(response)
+
+            return await self._within_budget(
+                context,
+                "Llamaindex_RAG_tool",
+                run_workflow(),
+                lambda: retrieved_passages(query),
+            )
 
         except Exception as e:
             logger.error(f"Error during workflow execution: {e}")
@@ -106,7 +182,12 @@ class Assistant(Agent):
         """
         try:
             logger.info(f"Running AutoGen operator for task: {task}")
-            response = await run_operator_task(task)
+            response = await self._within_budget(
+                context,
+                "autogen_operator_tool",
+                run_operator_task(task),
+                STILL_RUNNING_FALLBACK,
+            )
             return str(response)
         except Exception as e:
             logger.error(f"AutoGen operator failed: {e}")
@@ -136,10 +217,15 @@ class Assistant(Agent):
             logger.info(f"Starting browser automation task: {task}")
             
             # Call the browser automation function from browser.py
-            result = await run_browser_automation(
-                task=task,
-                max_steps=max_steps,
-                headless=headless
+            result = await self._within_budget(
+                context,
+                "browser_automation_tool",
+                run_browser_automation(
+                    task=task,
+                    max_steps=max_steps,
+                    headless=headless
+                ),
+                STILL_RUNNING_FALLBACK,
             )
             
             logger.info(f"Browser automation completed successfully")
@@ -165,7 +251,12 @@ class Assistant(Agent):
         """
         try:
             logger.info(f"Executing web automation task: {task}")
-            response = await run_operator_task(task)
+            response = await self._within_budget(
+                context,
+                "web_automation_tool",
+                run_operator_task(task),
+                STILL_RUNNING_FALLBACK,
+            )
             return str(response)
         except Exception as e:
             logger.error(f"Web automation failed: {e}")
@@ -200,11 +291,20 @@ Would you like me to open our therapist directory or search external databases?
             """
             
             # Also try the external search as backup
-            try:
-                external_response = await search_therapists_near(location, specialty)
-                return f"{internal_directory_response}\n\n**External Search Results**: {external_response}"
-            except:
-                return internal_directory_response
+            async def with_external_results():
+                try:
+                    external_response = await search_therapists_near(location, specialty)
+                    return f"{internal_directory_response}\n\n**External Search Results**: {external_response}"
+                except:
+                    return internal_directory_response
+
+            # the directory answer alone is fine if the external search is slow
+            return await self._within_budget(
+                context,
+                "find_therapists_tool",
+                with_external_results(),
+                internal_directory_response,
+            )
                 
         except Exception as e:
             logger.error(f"Therapist search failed: {e}")
@@ -221,18 +321,17 @@ Would you like me to open our therapist directory or search external databases?
         """
         try:
             logger.info(f"Finding crisis resources in {location}")
-            response = await get_crisis_help(location)
+            response = await self._within_budget(
+                context,
+                "emergency_resources_tool",
+                get_crisis_help(location),
+                f"I'm still looking up crisis resources in {location}. Right now, "
+                f"please remember these numbers:\n\n{EMERGENCY_NUMBERS}",
+            )
             return str(response)
         except Exception as e:
             logger.error(f"Crisis resource search failed: {e}")
-            return f"""I'm having trouble finding specific crisis resources right now. Please remember these important numbers:
-            
-            🚨 EMERGENCY SERVICES:
-            - National Suicide Prevention Lifeline: 988
-            - Crisis Text Line: Text HOME to 741741
-            - Emergency Services: 911
-            
-            If you're in immediate danger, please call 911 or go to your nearest emergency room."""
+            return f"I'm having trouble finding specific crisis resources right now. Please remember these important numbers:\n\n{EMERGENCY_NUMBERS}"
 
     @function_tool
     async def get_dashboard_data(self, context: RunContext):
@@ -340,8 +439,17 @@ You're doing great! Keep up the consistent effort to maintain and improve these
 
 
 def prewarm(proc: JobProcess):
-    # No need for VAD prewarming with Gemini Live API
-    pass
+    # No need for VAD prewarming with Gemini Live API.
+    # Load the index and build the workflow agent before the first session, not
+    # at import: parse worker processes re-import this module. Tools look the
+    # agent up on every call, so hot-swapped index versions are picked up
+    setup_combined_agent()
+
+    # Ingest files dropped into src/data without a manual rebuild. One watcher
+    # per worker process, outliving its jobs; version_lock makes the updates
+    # of the shared index from several processes run one after the other
+    if watch_enabled():
+        start_auto_ingest(PERSIST_DIR, DATA_DIR)
 
 
 async def entrypoint(ctx: JobContext):
@@ -374,6 +482,8 @@ async def entrypoint(ctx: JobContext):
     async def log_usage():
         summary = usage_collector.get_summary()
         logger.info(f"Usage: {summary}")
+        response_cache.log_stats()
+        semantic_cache.log_stats()
 
     # Shutdown callbacks are triggered when the session is over
     ctx.add_shutdown_callback(log_usage)
@@ -0,0 +1,122 @@
+"""
+Step and tool-call budgets, parallel tool calls and tracing for FunctionAgent.
+
+The workflow agent behind ``Llamaindex_RAG_tool`` answers comparison questions
+by calling ``search_documents`` / ``summarize_document`` once per document. Each
+agent step is a full LLM round-trip, so tools requested one step at a time cost N
+round-trips. ``BudgetedFunctionAgent`` runs all the tool calls of one step
+concurrently (up to ``AGENT_TOOL_WORKERS``), asks the model to request
+independent calls together, and answers with what it has once
+``AGENT_MAX_TOOL_CALLS`` tools have run. ``run_traced`` also caps the number of
+steps at ``AGENT_MAX_STEPS`` and records the steps taken.
+"""
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from llama_index.core.agent.workflow import FunctionAgent
+from llama_index.core.agent.workflow.workflow_events import (
+    AgentOutput,
+    ToolCall,
+    ToolCallResult,
+)
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.tools import ToolOutput
+from llama_index.core.workflow import Context, step
+
+logger = logging.getLogger("agent_budget")
+
+AGENT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", "6"))
+AGENT_MAX_TOOL_CALLS = int(os.getenv("AGENT_MAX_TOOL_CALLS", "12"))
+AGENT_TOOL_WORKERS = int(os.getenv("AGENT_TOOL_WORKERS", "8"))
+
+PARALLEL_TOOLS_PROMPT = """
+When several tool calls do not depend on each other's results (for example one
+call per document when comparing documents), request all of them in the same
+step instead of one after another.
+"""
+
+BUDGET_EXHAUSTED = (
+    "Tool call budget reached; this tool was not run. "
+    "Answer now with the information you already have."
+)
+
+
+class BudgetedFunctionAgent(FunctionAgent):
+    """FunctionAgent running one step's tool calls at once, within a budget."""
+
+    max_tool_calls: int = Field(
+        default=AGENT_MAX_TOOL_CALLS,
+        description="Tool calls allowed per run; later calls are refused.",
+    )
+
+    @step(num_workers=AGENT_TOOL_WORKERS)
+    async def call_tool(self, ctx: Context, ev: ToolCall) -> ToolCallResult:
+        async with ctx.store.edit_state() as state:
+            calls = state.get("budget_tool_calls", 0) + 1
+            state["budget_tool_calls"] = calls
+        if calls > self.max_tool_calls:
+            logger.info(f"Refused {ev.tool_name}: {self.max_tool_calls} calls used")
+            result = ToolCallResult(
+                tool_name=ev.tool_name,
+                tool_kwargs=ev.tool_kwargs,
+                tool_id=ev.tool_id,
+                tool_output=ToolOutput(
+                    content=BUDGET_EXHAUSTED,
+                    tool_name=ev.tool_name,
+                    raw_input=ev.tool_kwargs,
+                    raw_output=None,
+                    is_error=True,
+                ),
+                return_direct=False,
+            )
+            ctx.write_event_to_stream(result)
+            return result
+        return await super().call_tool(ctx, ev)
+
+
+@dataclass
+class AgentStep:
+    """One event of an agent run, ``at_ms`` after it started."""
+
+    at_ms: float
+    kind: str
+    detail: str
+
+
+def format_trace(trace: List[AgentStep]) -> str:
+    return "\n".join(f"{s.at_ms:8.0f} ms  {s.kind:<11} {s.detail}" for s in trace)
+
+
+async def run_traced(
+    agent: FunctionAgent, query: str, max_steps: int = AGENT_MAX_STEPS
+) -> Tuple[str, List[AgentStep]]:
+    """Run ``agent`` on ``query`` for at most ``max_steps`` LLM steps.
+
+    Past the limit the agent answers with what it has instead of failing.
+    Returns the answer and the steps taken.
+    """
+    start = time.perf_counter()
+    trace: List[AgentStep] = []
+
+    def record(kind: str, detail: str) -> None:
+        trace.append(AgentStep((time.perf_counter() - start) * 1000, kind, detail))
+
+    handler = agent.run(
+        user_msg=query, max_iterations=max_steps, early_stopping_method="generate"
+    )
+    async for ev in handler.stream_events():
+        if isinstance(ev, ToolCallResult):
+            status = "error" if ev.tool_output.is_error else "ok"
+            record("tool_result", f"{ev.tool_name} ({status})")
+        elif isinstance(ev, ToolCall):
+            record("tool_call", f"{ev.tool_name}({ev.tool_kwargs})")
+        elif isinstance(ev, AgentOutput):
+            requested = [t.tool_name for t in ev.tool_calls]
+            record("llm_step", f"requested {requested}" if requested else "answered")
+    response = await handler
+    logger.info(f"Agent run for {query!r}:\n{format_trace(trace)}")
+    return str(response), trace
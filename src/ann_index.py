@@ -0,0 +1,132 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour index over the vector store.
+
+Rows are clustered with spherical k-means into roughly sqrt(n) lists. A query
+scores the centroids first and then only the rows of the ``nprobe`` closest
+lists, so it reads a few percent of the matrix instead of all of it. ``nprobe``
+is the recall-vs-latency knob: more lists probed means higher recall and more
+rows scored.
+
+Centroids are trained when the store is persisted; rows added afterwards are
+assigned to their nearest centroid as they are inserted, and the index is
+retrained once the corpus has grown well past what it was trained on.
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger("ann_index")
+
+CENTROIDS_FNAME = "ivf_centroids.npy"
+LISTS_FNAME = "ivf_lists.npy"
+
+# Below this many vectors every query is an exact scan
+ANN_MIN_VECTORS = int(os.getenv("ANN_MIN_VECTORS", "20000"))
+# Lists probed per query; raise for recall, lower for latency
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+
+# Retrain once the corpus has grown to this multiple of the training size
+RETRAIN_GROWTH = 2.0
+KMEANS_ITERATIONS = 10
+# Training rows sampled per list
+SAMPLE_PER_LIST = 32
+_ASSIGN_ROWS = 8192
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+
+class IVFIndex:
+    """Centroids plus the list each row of the vector store belongs to."""
+
+    def __init__(self, centroids: np.ndarray, lists: np.ndarray, trained_rows: int):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.lists = np.asarray(lists, dtype=np.int32)
+        self.trained_rows = trained_rows
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def train(
+        cls,
+        n_rows: int,
+        gather: Callable[[np.ndarray], np.ndarray],
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """Cluster n_rows L2-normalised rows, read through gather(row_numbers)."""
+        nlist = max(1, int(np.sqrt(n_rows)))
+        rng = np.random.default_rng(seed)
+        sample_size = min(n_rows, nlist * SAMPLE_PER_LIST)
+        sample = gather(np.sort(rng.choice(n_rows, sample_size, replace=False)))
+
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assign = _nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            # re-seed empty lists with random sample rows
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+
+        lists = np.empty(n_rows, dtype=np.int32)
+        for start in range(0, n_rows, _ASSIGN_ROWS):
+            rows = np.arange(start, min(start + _ASSIGN_ROWS, n_rows))
+            lists[rows] = _nearest(gather(rows), centroids)
+        logger.info(f"Trained IVF index: {nlist} lists over {n_rows} vectors")
+        return cls(centroids, lists, n_rows)
+
+    def needs_retrain(self, n_rows: int) -> bool:
+        return n_rows > RETRAIN_GROWTH * self.trained_rows
+
+    def extend(self, vectors: np.ndarray) -> None:
+        """Assign newly inserted (normalised) rows to their nearest list."""
+        self.lists = np.concatenate([self.lists, _nearest(vectors, self.centroids)])
+
+    def probe(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        """Row numbers in the nprobe lists closest to a normalised query."""
+        nprobe = min(max(1, nprobe), self.nlist)
+        scores = self.centroids @ q
+        probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return np.flatnonzero(np.isin(self.lists, probes))
+
+    def persist(self, persist_dir: Path, rows: np.ndarray) -> None:
+        """Write the centroids and the lists of the given rows, in that order."""
+        for fname, array in (
+            (CENTROIDS_FNAME, self.centroids),
+            (LISTS_FNAME, self.lists[rows]),
+        ):
+            tmp = persist_dir / (fname + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, persist_dir / fname)
+
+    @classmethod
+    def from_persist_dir(
+        cls, persist_dir: Path, trained_rows: int
+    ) -> Optional["IVFIndex"]:
+        persist_dir = Path(persist_dir)
+        if not (persist_dir / CENTROIDS_FNAME).exists():
+            return None
+        return cls(
+            np.load(persist_dir / CENTROIDS_FNAME),
+            np.load(persist_dir / LISTS_FNAME),
+            trained_rows,
+        )
+
+    @staticmethod
+    def remove(persist_dir: Path) -> None:
+        for fname in (CENTROIDS_FNAME, LISTS_FNAME):
+            path = Path(persist_dir) / fname
+            if path.exists():
+                path.unlink()
@@ -0,0 +1,129 @@
+"""
+Streamed knowledge-base answers for the voice agent.
+
+``answer_stream`` yields the answer to a question as the LLM writes it, after
+checking the response and semantic caches, and logs the time to the first
+token and to the complete answer. ``shared_answer_stream`` coalesces identical
+questions asked at the same time in several sessions: one producer per
+normalized question and index revision, followed by every caller. Crisis
+questions are never cached nor shared.
+
+``collect_answer`` joins a stream for callers that cannot speak it as it
+arrives, calling back when the first chunk is slow so the agent can say it is
+still looking.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Optional
+
+from llama_index.core.schema import QueryBundle
+
+from coalescing import in_flight
+from index_registry import IndexHandle
+from query_engines import query_engines
+from response_cache import normalize_query, response_cache
+from retrieval import RETRIEVAL_MODE, aembed_query, aretrieve_with_mode
+from semantic_cache import is_guarded, semantic_cache
+
+logger = logging.getLogger("answer_stream")
+
+# Seconds without a first answer token before the agent tells the user it is
+# still looking
+RAG_FILLER_DELAY = float(os.getenv("RAG_FILLER_DELAY", "1.0"))
+
+
+class AnswerTiming:
+    """Time to first token and total time of one answer, logged when it ends."""
+
+    def __init__(self, query: str):
+        self.query = query
+        self.start = time.perf_counter()
+        self.first_token: Optional[float] = None
+
+    def token(self) -> None:
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+
+    def log(self, source: str) -> None:
+        end = time.perf_counter()
+        ttft = ((self.first_token or end) - self.start) * 1000
+        logger.info(
+            f"Answered {self.query!r} from {source}: first token after "
+            f"{ttft:.0f} ms, complete after {(end - self.start) * 1000:.0f} ms"
+        )
+
+
+async def answer_stream(handle: IndexHandle, query: str) -> AsyncIterator[str]:
+    """Yield the answer to ``query`` from ``handle`` as the LLM generates it.
+
+    Cached answers are yielded in one piece.
+    """
+    logger.info(f"Querying info for {query}")
+    timing = AnswerTiming(query)
+    # crisis questions always get a fresh answer
+    guarded = is_guarded(query)
+    if not guarded:
+        cached = response_cache.get(query, handle.revision, mode=RETRIEVAL_MODE)
+        if cached is not None:
+            timing.token()
+            yield cached
+            timing.log("the response cache")
+            return
+
+    index = handle.index
+    # the embedding serves both the semantic cache and vector retrieval
+    embedding = await aembed_query(index, query)
+    cached = semantic_cache.lookup(query, embedding, handle.revision, "livekit_rag")
+    if cached is not None:
+        timing.token()
+        yield cached
+        timing.log("the semantic cache")
+        return
+
+    query_engine = query_engines.query_engine(index, use_async=True, streaming=True)
+    # hybrid BM25 + vector retrieval by default, keyword-only if embedding stalls
+    query_bundle = QueryBundle(query, embedding=embedding)
+    mode = RETRIEVAL_MODE if embedding is not None else "bm25"
+    nodes, mode = await aretrieve_with_mode(index, query_bundle, mode=mode)
+    res = await query_engine.asynthesize(query_bundle, nodes)
+    parts = []
+    async for delta in res.async_response_gen():
+        timing.token()
+        parts.append(delta)
+        yield delta
+    timing.log(f"{mode} retrieval")
+
+    answer = "".join(parts)
+    # keyword-only answers after a failed embedding or a failed hybrid or vector
+    # retrieval are not worth keeping
+    if not guarded and mode == RETRIEVAL_MODE:
+        response_cache.put(query, handle.revision, answer, mode=RETRIEVAL_MODE)
+        semantic_cache.add(query, embedding, handle.revision, answer, "livekit_rag")
+
+
+def shared_answer_stream(handle: IndexHandle, query: str) -> AsyncIterator[str]:
+    """``answer_stream``, shared by concurrent callers asking the same question."""
+    if is_guarded(query):
+        return answer_stream(handle, query)
+    key = (normalize_query(query), handle.revision)
+    return in_flight.stream(key, lambda: answer_stream(handle, query))
+
+
+async def collect_answer(
+    chunks: AsyncIterator[str],
+    on_slow_start: Callable[[], Any],
+    delay: float = RAG_FILLER_DELAY,
+) -> str:
+    """Join a streamed answer, calling ``on_slow_start`` if it starts late."""
+    timer = asyncio.get_running_loop().call_later(delay, on_slow_start)
+    parts = []
+    try:
+        async for chunk in chunks:
+            timer.cancel()
+            parts.append(chunk)
+    finally:
+        timer.cancel()
+    return "".join(parts)
@@ -0,0 +1,211 @@
+"""
+Document cleaning before chunks are embedded.
+
+Two stages:
+
+- Boilerplate stripping, per file: text is normalized, and lines that repeat on
+  most pages of a file (running headers and footers, "Page 3 of 12", legal
+  disclaimers) are removed before the file is chunked.
+- Chunk deduplication, across the corpus: exact duplicates are found by hashing
+  the normalized chunk text, near-duplicates (re-uploaded versions of the same
+  handout, slides repeated with a small change) with MinHash signatures and LSH
+  banding. Duplicates are not embedded or stored again: ingestion makes the
+  chunk that was kept shared by every file it appears in (see ingestion).
+
+How much was removed is counted in ``CleaningStats``.
+"""
+
+import hashlib
+import os
+import re
+import unicodedata
+import zlib
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from llama_index.core.utils import get_tokenizer
+
+CLEANING_ENABLED = os.getenv("CLEAN_DOCUMENTS", "1").lower() not in ("0", "false", "no")
+
+# A line is boilerplate if it appears on at least this share of a file's pages...
+BOILERPLATE_PAGE_RATIO = 0.5
+# ...and the file has at least this many pages
+BOILERPLATE_MIN_PAGES = 3
+
+# Estimated Jaccard similarity above which two chunks count as near-duplicates
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+NUM_PERM = 128
+LSH_BANDS = 16  # 16 bands x 8 rows: candidates from roughly 0.7 similarity
+SHINGLE_WORDS = 5
+
+_WHITESPACE = re.compile(r"[^\S\n]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_HYPHEN_BREAK = re.compile(r"(\w)-\n(\w)")
+_DIGITS = re.compile(r"\d+")
+_WORD = re.compile(r"\w+")
+
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_rng = np.random.RandomState(1)
+# multiply-shift hash family; fixed seed so signatures are comparable across runs
+_PERM_A = _rng.randint(1, 2**31, size=NUM_PERM).astype(np.uint64) * 2 + 1
+_PERM_B = _rng.randint(0, 2**31, size=NUM_PERM).astype(np.uint64)
+
+
+@dataclass
+class CleaningStats:
+    """What the cleaning stages removed."""
+
+    boilerplate_lines: int = 0
+    boilerplate_tokens: int = 0
+    exact_duplicates: int = 0
+    near_duplicates: int = 0
+    duplicate_tokens: int = 0
+
+    @property
+    def chunks_removed(self) -> int:
+        return self.exact_duplicates + self.near_duplicates
+
+    @property
+    def tokens_removed(self) -> int:
+        return self.boilerplate_tokens + self.duplicate_tokens
+
+    def merge(self, other: "CleaningStats") -> None:
+        for name in vars(other):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer()(text))
+
+
+def normalize_text(text: str) -> str:
+    """Normalize unicode and whitespace and re-join words hyphenated across lines."""
+    text = unicodedata.normalize("NFKC", text)
+    text = "".join(c for c in text if c in "\n\t" or unicodedata.category(c)[0] != "C")
+    text = _HYPHEN_BREAK.sub(r"\1\2", text)
+    lines = [_WHITESPACE.sub(" ", line).strip() for line in text.split("\n")]
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+def _line_key(line: str) -> str:
+    # page numbers and dates differ from page to page; compare the rest
+    return _DIGITS.sub("#", line.lower())
+
+
+class BoilerplateFilter:
+    """Finds lines repeated across the pages of one file and strips them."""
+
+    def __init__(self, page_texts: Iterable[str]):
+        counts: Counter = Counter()
+        pages = 0
+        for text in page_texts:
+            pages += 1
+            counts.update(
+                {_line_key(line) for line in normalize_text(text).split("\n") if line}
+            )
+        self.repeated: Set[str] = set()
+        if pages >= BOILERPLATE_MIN_PAGES:
+            min_count = max(2, int(pages * BOILERPLATE_PAGE_RATIO))
+            self.repeated = {key for key, n in counts.items() if n >= min_count}
+
+    def clean(self, text: str, stats: Optional[CleaningStats] = None) -> str:
+        kept = []
+        for line in normalize_text(text).split("\n"):
+            if line and _line_key(line) in self.repeated:
+                if stats is not None:
+                    stats.boilerplate_lines += 1
+                    stats.boilerplate_tokens += count_tokens(line)
+                continue
+            kept.append(line)
+        return _BLANK_LINES.sub("\n\n", "\n".join(kept)).strip()
+
+
+def _dedup_key(text: str) -> str:
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """MinHash signature over word shingles, or None if the text is too short."""
+    words = text.split()
+    if len(words) < SHINGLE_WORDS:
+        return None
+    shingles = {
+        " ".join(words[i : i + SHINGLE_WORDS])
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    }
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode("utf-8")) for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    # (a * x + b) mod 2^64, top 32 bits; uint64 arithmetic wraps by design
+    with np.errstate(over="ignore"):
+        permuted = (np.outer(_PERM_A, hashes) + _PERM_B[:, None]) >> np.uint64(32)
+    return (permuted & _MAX_HASH).min(axis=1)
+
+
+class ChunkDeduplicator:
+    """Exact and MinHash/LSH near-duplicate detection over a set of chunks.
+
+    Chunks are numbered in the order they are recorded; a duplicate is reported
+    as the number of the chunk it duplicates.
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self.rows = NUM_PERM // LSH_BANDS
+        self._count = 0
+        self._exact: Dict[str, int] = {}
+        self._signatures: Dict[int, np.ndarray] = {}
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+
+    def _band_keys(self, signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(LSH_BANDS):
+            yield band, signature[band * self.rows : (band + 1) * self.rows].tobytes()
+
+    def _near_match(self, signature: np.ndarray) -> Optional[int]:
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self._buckets.get(key, ()))
+        for i in sorted(candidates):
+            if np.mean(self._signatures[i] == signature) >= self.threshold:
+                return i
+        return None
+
+    def check(
+        self, text: str, stats: Optional[CleaningStats] = None
+    ) -> Optional[int]:
+        """Return the number of the chunk ``text`` duplicates, or None if it is new.
+
+        A new chunk is recorded under the next number.
+        """
+        key = _dedup_key(text)
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        duplicate_of = self._exact.get(digest)
+        near = False
+        signature = None
+        if duplicate_of is None:
+            signature = minhash(key)
+            if signature is not None:
+                duplicate_of = self._near_match(signature)
+                near = duplicate_of is not None
+
+        if duplicate_of is None:
+            number = self._count
+            self._count += 1
+            self._exact[digest] = number
+            if signature is not None:
+                self._signatures[number] = signature
+                for band_key in self._band_keys(signature):
+                    self._buckets[band_key].append(number)
+            return None
+
+        if stats is not None:
+            if near:
+                stats.near_duplicates += 1
+            else:
+                stats.exact_duplicates += 1
+            stats.duplicate_tokens += count_tokens(text)
+        return duplicate_of
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Request coalescing for knowledge-base queries across sessions.
+
+One agent worker process hosts many voice sessions, and users often ask the
+same thing at the same time. Two helpers cut the embedding and LLM calls:
+
+- ``SingleFlight`` runs one coroutine (or one streamed answer) per key at a
+  time: callers asking for a key that is already in flight await the same task,
+  or follow the same stream from its first chunk, instead of starting their
+  own. ``livekit_rag`` keys it by normalized question and index revision, so
+  identical questions share one retrieval and one LLM synthesis.
+- ``QueryEmbeddingBatcher`` collects the query embeddings requested within
+  ``QUERY_BATCH_WINDOW_MS`` milliseconds and sends them as a single embedding
+  call, at most ``QUERY_BATCH_SIZE`` queries at a time.
+
+Run this module for a throughput benchmark against a simulated embedding API:
+
+    python src/coalescing.py
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+
+from embedding_cache import CachedEmbedding
+
+logger = logging.getLogger("coalescing")
+
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "32"))
+
+
+class _Broadcast:
+    """Chunks of one stream, replayed to every follower from the start."""
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional["asyncio.Task[None]"] = None
+        self._changed = asyncio.Event()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def pump(self, chunks: AsyncIterator[Any]) -> None:
+        try:
+            async for chunk in chunks:
+                self.chunks.append(chunk)
+                self._wake()
+        except BaseException as e:
+            self.error = e
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            self.done = True
+            self._wake()
+
+    async def follow(self) -> AsyncIterator[Any]:
+        i = 0
+        while True:
+            while i < len(self.chunks):
+                yield self.chunks[i]
+                i += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """Share one in-flight task among concurrent callers with the same key."""
+
+    def __init__(self):
+        self.started = 0
+        self.shared = 0
+        self._tasks: Dict[Tuple[int, Hashable], "asyncio.Task[Any]"] = {}
+        self._streams: Dict[Tuple[int, Hashable], _Broadcast] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        flight = (id(loop), key)
+        task = self._tasks.get(flight)
+        if task is None:
+            self.started += 1
+            task = loop.create_task(fn())
+            self._tasks[flight] = task
+            task.add_done_callback(lambda _: self._tasks.pop(flight, None))
+        else:
+            self.shared += 1
+        # one caller giving up (e.g. an interrupted turn) must not cancel the others
+        return await asyncio.shield(task)
+
+    async def stream(
+        self, key: Hashable, fn: Callable[[], AsyncIterator[Any]]
+    ) -> AsyncIterator[Any]:
+        """Yield the chunks of ``fn()``, sharing one producer per key.
+
+        Callers joining late first get the chunks already produced. A caller
+        that stops reading does not stop the producer.
+        """
+        loop = asyncio.get_running_loop()
+        flight = (id(loop), key)
+        broadcast = self._streams.get(flight)
+        if broadcast is None:
+            self.started += 1
+            broadcast = self._streams[flight] = _Broadcast()
+            broadcast.task = loop.create_task(broadcast.pump(fn()))
+            broadcast.task.add_done_callback(
+                lambda _: self._streams.pop(flight, None)
+            )
+        else:
+            self.shared += 1
+        async for chunk in broadcast.follow():
+            yield chunk
+
+
+async def aembed_queries(
+    embed_model: BaseEmbedding, queries: Sequence[str]
+) -> List[Embedding]:
+    """Query embeddings for ``queries``, in one API call where the model allows."""
+    inner = embed_model
+    if isinstance(embed_model, CachedEmbedding):
+        inner = embed_model.inner
+    if hasattr(inner, "_aembed_texts"):
+        # Google GenAI embeds a list of texts per request; keep the query task type
+        return await inner._aembed_texts(list(queries), task_type="RETRIEVAL_QUERY")
+    return list(
+        await asyncio.gather(*(embed_model.aget_query_embedding(q) for q in queries))
+    )
+
+
+class QueryEmbeddingBatcher:
+    """Batch query embeddings requested within a short window into one call."""
+
+    def __init__(
+        self,
+        window: float = QUERY_BATCH_WINDOW_MS / 1000,
+        max_batch: int = QUERY_BATCH_SIZE,
+    ):
+        self.window = window
+        self.max_batch = max_batch
+        self.calls = 0
+        self.queries = 0
+        self._pending: Dict[
+            Tuple[int, int], Tuple[BaseEmbedding, List[Tuple[str, asyncio.Future]]]
+        ] = {}
+
+    async def embed(self, embed_model: BaseEmbedding, query: str) -> Embedding:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (id(loop), id(embed_model))
+        if key not in self._pending:
+            self._pending[key] = (embed_model, [])
+            loop.call_later(self.window, self._flush, key)
+        waiters = self._pending[key][1]
+        waiters.append((query, future))
+        if len(waiters) >= self.max_batch:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key: Tuple[int, int]) -> None:
+        # the timer of a batch flushed early finds a newer batch or nothing
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            asyncio.get_running_loop().create_task(self._run(*pending))
+
+    async def _run(
+        self, embed_model: BaseEmbedding, waiters: List[Tuple[str, asyncio.Future]]
+    ) -> None:
+        waiters = [(query, future) for query, future in waiters if not future.done()]
+        if not waiters:
+            return
+        queries = list(dict.fromkeys(query for query, _ in waiters))
+        self.calls += 1
+        self.queries += len(waiters)
+        try:
+            vectors = dict(zip(queries, await aembed_queries(embed_model, queries)))
+        except Exception as e:
+            for _, future in waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for query, future in waiters:
+            if not future.done():
+                future.set_result(vectors[query])
+        if len(waiters) > 1:
+            logger.debug(f"Embedded {len(waiters)} queries in one call")
+
+
+# Global instances to share across modules
+in_flight = SingleFlight()
+query_embeddings = QueryEmbeddingBatcher()
+
+
+def main() -> None:
+    from llama_index.core.embeddings import MockEmbedding
+
+    class SimulatedAPI(MockEmbedding):
+        """50 ms per request and at most 4 requests at once, any batch size."""
+
+        async def _aembed_texts(self, texts, task_type=None):
+            async with limit:
+                await asyncio.sleep(0.05)
+            return [self._get_vector() for _ in texts]
+
+        async def _aget_query_embedding(self, query):
+            return (await self._aembed_texts([query]))[0]
+
+    limit: asyncio.Semaphore
+    queries = [f"question {i % 150}" for i in range(200)]
+
+    async def run(embed: Callable[[str], Awaitable[Embedding]]) -> Tuple[float, float]:
+        latencies = []
+
+        async def one(query: str, delay: float) -> None:
+            await asyncio.sleep(delay)
+            start = time.perf_counter()
+            await embed(query)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        # 200 queries arriving over 100 ms
+        await asyncio.gather(*(one(q, i * 0.0005) for i, q in enumerate(queries)))
+        elapsed = time.perf_counter() - start
+        return len(queries) / elapsed, sorted(latencies)[len(latencies) // 2] * 1000
+
+    async def bench() -> None:
+        nonlocal limit
+        model = SimulatedAPI(embed_dim=8)
+        limit = asyncio.Semaphore(4)
+        direct = await run(model.aget_query_embedding)
+        limit = asyncio.Semaphore(4)
+        batcher = QueryEmbeddingBatcher()
+        batched = await run(lambda q: batcher.embed(model, q))
+        print(f"{len(queries)} concurrent query embeddings:")
+        print(f"  one call each  {direct[0]:7.0f} queries/s  p50 {direct[1]:6.1f} ms")
+        print(
+            f"  batched        {batched[0]:7.0f} queries/s  p50 {batched[1]:6.1f} ms"
+            f"  ({batcher.calls} calls)"
+        )
+
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
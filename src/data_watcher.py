@@ -0,0 +1,159 @@
+"""
+Data-directory watcher for automatic incremental ingestion.
+
+Watches ``src/data`` and, once file events have been quiet for a debounce
+period, hands the set of changed paths (created, modified or deleted) to a
+callback, typically one that ingests just those files. Uses ``watchfiles``
+(inotify / FSEvents) when it is installed and falls back to polling the
+directory otherwise. Directory scans run in a thread so the asyncio loop of the
+agent worker or ingestion service is never blocked.
+
+Enable with WATCH_DATA_DIR=1 in the ingestion service (preferred) or the agent
+worker.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from index_versions import update_version
+from ingestion import list_data_files
+
+logger = logging.getLogger("data_watcher")
+
+try:
+    from watchfiles import awatch
+
+    WATCHFILES_AVAILABLE = True
+except ImportError:
+    WATCHFILES_AVAILABLE = False
+
+# Seconds without new events before a batch of changes is ingested
+DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", "2"))
+# Seconds between directory scans when watchfiles is not installed
+POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "2"))
+
+ChangeCallback = Callable[[Set[Path]], Awaitable[None]]
+
+
+def watch_enabled() -> bool:
+    """Whether WATCH_DATA_DIR asks for automatic ingestion."""
+    return os.getenv("WATCH_DATA_DIR", "").lower() in ("1", "true", "yes")
+
+
+def _is_data_file(data_dir: Path, path: Path) -> bool:
+    # same rules as ingestion.list_data_files: top-level, non-hidden files
+    return path.parent == data_dir and not path.name.startswith(".")
+
+
+def snapshot(data_dir: Path) -> Dict[Path, Tuple[float, int]]:
+    """mtime and size of every data file, for change detection by polling."""
+    result = {}
+    for path in list_data_files(data_dir):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        result[path] = (stat.st_mtime, stat.st_size)
+    return result
+
+
+def changed_paths(
+    before: Dict[Path, Tuple[float, int]], after: Dict[Path, Tuple[float, int]]
+) -> Set[Path]:
+    """Paths that were added, removed or modified between two snapshots."""
+    return {
+        path
+        for path in before.keys() | after.keys()
+        if before.get(path) != after.get(path)
+    }
+
+
+async def _poll(data_dir: Path, events: "asyncio.Queue[Path]", interval: float) -> None:
+    previous = await asyncio.to_thread(snapshot, data_dir)
+    while True:
+        await asyncio.sleep(interval)
+        current = await asyncio.to_thread(snapshot, data_dir)
+        for path in changed_paths(previous, current):
+            events.put_nowait(path)
+        previous = current
+
+
+async def _watchfiles(data_dir: Path, events: "asyncio.Queue[Path]") -> None:
+    async for changes in awatch(data_dir, recursive=False):
+        for _, raw_path in changes:
+            path = Path(raw_path)
+            if _is_data_file(data_dir, path):
+                events.put_nowait(path)
+
+
+async def watch_data_dir(
+    data_dir: Path,
+    on_change: ChangeCallback,
+    debounce: float = DEBOUNCE_SECONDS,
+    poll_interval: float = POLL_INTERVAL,
+    use_watchfiles: Optional[bool] = None,
+) -> None:
+    """Call ``on_change`` with each debounced batch of changed paths, forever."""
+    data_dir = Path(os.path.abspath(data_dir))
+    data_dir.mkdir(parents=True, exist_ok=True)
+    if use_watchfiles is None:
+        use_watchfiles = WATCHFILES_AVAILABLE
+
+    events: "asyncio.Queue[Path]" = asyncio.Queue()
+    if use_watchfiles:
+        producer = asyncio.create_task(_watchfiles(data_dir, events))
+    else:
+        producer = asyncio.create_task(_poll(data_dir, events, poll_interval))
+    logger.info(
+        f"Watching {data_dir} ({'watchfiles' if use_watchfiles else 'polling'})"
+    )
+
+    try:
+        while True:
+            pending = {await events.get()}
+            # keep collecting until the directory has been quiet for `debounce`
+            while True:
+                try:
+                    pending.add(await asyncio.wait_for(events.get(), debounce))
+                except asyncio.TimeoutError:
+                    break
+            logger.info(f"Data directory changed: {sorted(p.name for p in pending)}")
+            try:
+                await on_change(pending)
+            except Exception as e:
+                logger.error(f"Error ingesting changed files: {e}")
+    finally:
+        producer.cancel()
+
+
+_auto_ingest_thread: Optional[threading.Thread] = None
+_auto_ingest_lock = threading.Lock()
+
+
+def start_auto_ingest(persist_dir: Path, data_dir: Path) -> threading.Thread:
+    """Watch data_dir and publish an updated index version for each batch of changes.
+
+    The watcher runs in a daemon thread with its own event loop, so it outlives
+    the jobs of an agent worker process; calling it again returns the running
+    thread, so each process runs one watcher.
+    """
+    global _auto_ingest_thread
+    with _auto_ingest_lock:
+        if _auto_ingest_thread is not None and _auto_ingest_thread.is_alive():
+            return _auto_ingest_thread
+
+        async def ingest(paths: Set[Path]) -> None:
+            await asyncio.to_thread(update_version, persist_dir, data_dir, None, paths)
+
+        def run() -> None:
+            asyncio.run(watch_data_dir(data_dir, ingest))
+
+        _auto_ingest_thread = threading.Thread(
+            target=run, name="auto-ingest", daemon=True
+        )
+        _auto_ingest_thread.start()
+        return _auto_ingest_thread
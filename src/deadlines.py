@@ -0,0 +1,129 @@
+"""
+Latency budgets for agent tools.
+
+A slow Gemini, RAG or browser call must not stall a voice turn. Every tool runs
+under its own budget (``TOOL_BUDGETS``, ``TOOL_BUDGET_SECONDS`` for the rest),
+and all the tools called in one turn share ``TURN_DEADLINE_SECONDS``. When the
+time is up the tool answers with the best partial result it has (retrieved
+passages without synthesis, a static fallback...), while the full result keeps
+computing in the background. Results that finish late are handed to the next
+tool call or the next user turn, so the agent can still tell the user.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Awaitable, Callable, Hashable, List, Optional, Set, Tuple, Union
+
+logger = logging.getLogger("deadlines")
+
+TOOL_BUDGET_SECONDS = float(os.getenv("TOOL_BUDGET_SECONDS", "8"))
+TURN_DEADLINE_SECONDS = float(os.getenv("TURN_DEADLINE_SECONDS", "12"))
+
+# Seconds each tool may take before answering with a partial result
+TOOL_BUDGETS = {
+    "LiveKit_RAG_tool": 4.0,
+    "Llamaindex_RAG_tool": 8.0,
+    "emergency_resources_tool": 4.0,
+    "find_therapists_tool": 6.0,
+    "autogen_operator_tool": 10.0,
+    "web_automation_tool": 10.0,
+    "browser_automation_tool": 10.0,
+}
+
+# Turns remembered for their start time; older ones count as new turns
+_MAX_TURNS = 64
+
+Fallback = Union[str, Callable[[], Awaitable[str]]]
+
+
+def tool_budget(name: str) -> float:
+    """The budget of tool ``name``, overridable with ``TOOL_BUDGET_<NAME>``."""
+    default = TOOL_BUDGETS.get(name, TOOL_BUDGET_SECONDS)
+    return float(os.getenv(f"TOOL_BUDGET_{name.upper()}", default))
+
+
+def format_late_results(results: List[Tuple[str, str]]) -> str:
+    lines = ["Results of earlier requests that finished after you answered:"]
+    lines += [f"[{name}] {result}" for name, result in results]
+    return "\n".join(lines)
+
+
+class ToolDeadlines:
+    """Runs tool work under per-tool budgets and a per-turn deadline."""
+
+    def __init__(self, turn_deadline: float = TURN_DEADLINE_SECONDS):
+        self.turn_deadline = turn_deadline
+        self.timeouts = 0
+        self._turns: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._late: List[Tuple[str, str]] = []
+        self._background: Set[asyncio.Future] = set()
+
+    def remaining(self, turn: Optional[Hashable], budget: float) -> float:
+        """Seconds a tool called in ``turn`` may take, at most ``budget``.
+
+        ``turn`` must identify the turn for good (e.g. the speech handle's id),
+        since the first call of a turn fixes its start time.
+        """
+        if turn is None:
+            return budget
+        now = time.monotonic()
+        started = self._turns.setdefault(turn, now)
+        while len(self._turns) > _MAX_TURNS:
+            self._turns.popitem(last=False)
+        return max(0.0, min(budget, started + self.turn_deadline - now))
+
+    async def run(
+        self,
+        name: str,
+        work: Awaitable[str],
+        fallback: Fallback,
+        turn: Optional[Hashable] = None,
+        budget: Optional[float] = None,
+    ) -> str:
+        """Result of ``work``, or of ``fallback`` if it does not finish in time.
+
+        Late results of earlier calls are prepended to the answer.
+        """
+        timeout = self.remaining(turn, tool_budget(name) if budget is None else budget)
+        task = asyncio.ensure_future(work)
+        try:
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+        except asyncio.CancelledError:
+            # the turn was interrupted; keep the work for the next one
+            self._continue(name, task)
+            raise
+        if task in done:
+            result = task.result()
+        else:
+            self.timeouts += 1
+            logger.warning(
+                f"{name} did not finish within {timeout:.1f}s, "
+                "answering with a partial result"
+            )
+            self._continue(name, task)
+            result = fallback if isinstance(fallback, str) else await fallback()
+        late = self.take_late_results()
+        return f"{format_late_results(late)}\n\n{result}" if late else result
+
+    def _continue(self, name: str, task: asyncio.Future) -> None:
+        self._background.add(task)
+        task.add_done_callback(partial(self._finish_late, name))
+
+    def _finish_late(self, name: str, task: asyncio.Future) -> None:
+        self._background.discard(task)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.error(f"{name} failed in the background: {task.exception()}")
+            return
+        logger.info(f"{name} finished in the background")
+        self._late.append((name, str(task.result())))
+
+    def take_late_results(self) -> List[Tuple[str, str]]:
+        """Results finished in the background since the last call."""
+        late, self._late = self._late, []
+        return late
@@ -0,0 +1,230 @@
+"""
+Persisted per-document summaries for the document summary tools.
+
+At ingest time every document is split into sections of consecutive nodes, each
+section is summarized once, and the section summaries are combined into a
+document summary. The results are stored next to the index in
+``doc_summaries.json``, keyed by file name and invalidated by the file's content
+hash from the ingestion manifest.
+
+The summary tools then answer "summarize X" instantly from the cache, and
+follow-up questions are answered with a refine pass over the cached section
+summaries instead of pushing the whole document through the LLM again.
+"""
+
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Sequence
+
+from llama_index.core import VectorStoreIndex, get_response_synthesizer
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore, TextNode
+
+from embedding_pipeline import ProgressCallback
+from ingestion import IngestionManifest
+
+logger = logging.getLogger("doc_summaries")
+
+SUMMARIES_FNAME = "doc_summaries.json"
+
+# Rough size of one section; a section is summarized with a single LLM call
+SECTION_CHARS = 12000
+
+SECTION_PROMPT = (
+    "Summarize this section of the document, keeping key facts, techniques "
+    "and recommendations."
+)
+DOCUMENT_PROMPT = (
+    "Write a concise overall summary of the document from these section summaries."
+)
+
+
+@dataclass
+class DocumentSummary:
+    """Cached summaries for one ingested file."""
+
+    content_hash: str
+    summary: str
+    sections: List[str] = field(default_factory=list)
+
+
+def split_sections(nodes: Sequence[BaseNode]) -> List[List[BaseNode]]:
+    """Group consecutive nodes into sections of roughly SECTION_CHARS."""
+    sections: List[List[BaseNode]] = []
+    current: List[BaseNode] = []
+    size = 0
+    for node in nodes:
+        length = len(node.get_content(metadata_mode=MetadataMode.NONE))
+        if current and size + length > SECTION_CHARS:
+            sections.append(current)
+            current, size = [], 0
+        current.append(node)
+        size += length
+    if current:
+        sections.append(current)
+    return sections
+
+
+def _text_nodes(texts: Sequence[str]) -> List[NodeWithScore]:
+    return [NodeWithScore(node=TextNode(text=text)) for text in texts]
+
+
+def summarize_document(nodes: Sequence[BaseNode], content_hash: str) -> DocumentSummary:
+    """Summarize each section of a document, then the document as a whole."""
+    synthesizer = get_response_synthesizer(response_mode="tree_summarize")
+    sections = [
+        str(
+            synthesizer.synthesize(
+                SECTION_PROMPT, nodes=[NodeWithScore(node=n) for n in section]
+            )
+        )
+        for section in split_sections(nodes)
+    ]
+    if len(sections) == 1:
+        summary = sections[0]
+    else:
+        summary = str(synthesizer.synthesize(DOCUMENT_PROMPT, nodes=_text_nodes(sections)))
+    return DocumentSummary(content_hash=content_hash, summary=summary, sections=sections)
+
+
+async def answer_from_summaries(question: str, summary: DocumentSummary) -> str:
+    """Answer a follow-up question by refining over the cached section summaries."""
+    synthesizer = get_response_synthesizer(response_mode="refine")
+    texts = summary.sections or [summary.summary]
+    return str(await synthesizer.asynthesize(question, nodes=_text_nodes(texts)))
+
+
+class SummaryStore:
+    """doc_summaries.json: file name -> DocumentSummary."""
+
+    def __init__(self, persist_dir: Path):
+        self.persist_dir = Path(persist_dir)
+        self._summaries: Dict[str, DocumentSummary] = {}
+        self._lock = threading.Lock()
+        path = self.persist_dir / SUMMARIES_FNAME
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                raw = json.load(f)
+            self._summaries = {
+                key: DocumentSummary(**value) for key, value in raw.items()
+            }
+
+    def get(self, file_name: str, content_hash: str) -> Optional[DocumentSummary]:
+        """Return the cached summary if it was made from the current file contents."""
+        summary = self._summaries.get(file_name)
+        if summary is None or summary.content_hash != content_hash:
+            return None
+        return summary
+
+    @property
+    def summaries(self) -> Dict[str, DocumentSummary]:
+        """Every stored summary by file name, current or not."""
+        return dict(self._summaries)
+
+    def put(self, file_name: str, summary: DocumentSummary) -> None:
+        self._summaries[file_name] = summary
+
+    def get_or_create(
+        self, file_name: str, content_hash: str, nodes: Sequence[BaseNode]
+    ) -> DocumentSummary:
+        """Return the cached summary, generating it if missing.
+
+        Used at query time, where persist_dir is the published version, so a
+        generated summary is only kept in memory; ingestion stores summaries
+        in the next version (see index_versions.summarize_version).
+        """
+        summary = self.get(file_name, content_hash)
+        if summary is not None:
+            return summary
+        with self._lock:
+            summary = self.get(file_name, content_hash)
+            if summary is None:
+                logger.info(f"Summarizing {file_name} ({len(nodes)} nodes)")
+                summary = summarize_document(nodes, content_hash)
+                self._summaries[file_name] = summary
+            return summary
+
+    def prune(self, keep: Sequence[str]) -> int:
+        """Drop summaries for files that are no longer ingested."""
+        keep = set(keep)
+        stale = [key for key in self._summaries if key not in keep]
+        for key in stale:
+            del self._summaries[key]
+        return len(stale)
+
+    def persist(self) -> None:
+        self.persist_dir.mkdir(parents=True, exist_ok=True)
+        path = self.persist_dir / SUMMARIES_FNAME
+        tmp_path = path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {key: asdict(value) for key, value in sorted(self._summaries.items())},
+                f,
+                indent=2,
+            )
+        os.replace(tmp_path, path)
+
+
+def summarize_missing(
+    index: VectorStoreIndex,
+    persist_dir: Path,
+    progress: Optional[ProgressCallback] = None,
+) -> Dict[str, DocumentSummary]:
+    """Summarize every file ingested in persist_dir whose summary is missing or stale.
+
+    Nothing is written, so this can run on a published version; see add_summaries.
+    """
+    manifest = IngestionManifest.load(persist_dir) or IngestionManifest()
+    store = SummaryStore(persist_dir)
+    missing = [
+        (file_name, entry)
+        for file_name, entry in sorted(manifest.entries.items())
+        if store.get(file_name, entry.content_hash) is None
+    ]
+    summaries: Dict[str, DocumentSummary] = {}
+    for done, (file_name, entry) in enumerate(missing):
+        if progress is not None:
+            progress("summarizing", done, len(missing))
+        nodes = index.docstore.get_nodes(entry.node_ids)
+        logger.info(f"Summarizing {file_name} ({len(nodes)} nodes)")
+        summaries[file_name] = summarize_document(nodes, entry.content_hash)
+    return summaries
+
+
+def add_summaries(persist_dir: Path, summaries: Mapping[str, DocumentSummary]) -> int:
+    """Store the summaries that match the files ingested in persist_dir.
+
+    Summaries of files that changed since they were made are skipped, as are
+    files that already have a current one; summaries of files no longer ingested
+    are dropped. Returns the number of documents that got a new summary.
+    """
+    manifest = IngestionManifest.load(persist_dir) or IngestionManifest()
+    store = SummaryStore(persist_dir)
+    added = 0
+    for file_name, summary in summaries.items():
+        entry = manifest.entries.get(file_name)
+        if entry is None or entry.content_hash != summary.content_hash:
+            continue
+        if store.get(file_name, entry.content_hash) is None:
+            store.put(file_name, summary)
+            added += 1
+    removed = store.prune(list(manifest.entries))
+    if added or removed:
+        store.persist()
+    logger.info(f"Document summaries: {added} added, {removed} removed")
+    return added
+
+
+def refresh_summaries(
+    index: VectorStoreIndex,
+    persist_dir: Path,
+    progress: Optional[ProgressCallback] = None,
+) -> int:
+    """Summarize every ingested file whose summary is missing or stale, in place.
+
+    Returns the number of documents that were (re)summarized.
+    """
+    return add_summaries(persist_dir, summarize_missing(index, persist_dir, progress))
@@ -0,0 +1,97 @@
+"""
+Streaming document loader for ingestion.
+
+``SimpleDirectoryReader(...).load_data()`` materializes every document of every
+file before anything is chunked. Here a file is turned into documents and then
+chunks lazily: PDFs are read one page at a time, and each page is split into
+nodes as soon as it is extracted, so only the page being processed is held in
+memory. Other file types go through SimpleDirectoryReader one file at a time.
+
+Documents carry the same ids, metadata and excluded metadata keys that
+SimpleDirectoryReader(filename_as_id=True) produces. Before chunking, their text
+is normalized and stripped of boilerplate repeated across pages (see
+clean_document).
+"""
+
+import logging
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from llama_index.core import Settings, SimpleDirectoryReader
+from llama_index.core.readers.file.base import default_file_metadata_func
+from llama_index.core.schema import BaseNode, Document
+
+from clean_document import CLEANING_ENABLED, BoilerplateFilter, CleaningStats
+
+logger = logging.getLogger("document_loader")
+
+try:
+    import pypdf
+
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+# Metadata SimpleDirectoryReader keeps out of embedding and LLM text
+_EXCLUDED_METADATA_KEYS = [
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+]
+
+
+def _iter_pdf_pages(path: Path) -> Iterator[Document]:
+    file_metadata = default_file_metadata_func(str(path))
+    with open(path, "rb") as f:
+        pdf = pypdf.PdfReader(f)
+        for page in range(len(pdf.pages)):
+            # same metadata (and key order) as llama_index's PDFReader
+            metadata = {
+                "page_label": pdf.page_labels[page],
+                "file_name": path.name,
+            }
+            metadata.update(file_metadata)
+            yield Document(
+                id_=f"{path!s}_part_{page}",
+                text=pdf.pages[page].extract_text(),
+                metadata=metadata,
+                excluded_embed_metadata_keys=list(_EXCLUDED_METADATA_KEYS),
+                excluded_llm_metadata_keys=list(_EXCLUDED_METADATA_KEYS),
+            )
+
+
+def iter_documents(path: Path) -> Iterator[Document]:
+    """Yield the documents of one file, page by page for PDFs."""
+    path = Path(path)
+    if path.suffix.lower() == ".pdf" and PYPDF_AVAILABLE:
+        yield from _iter_pdf_pages(path)
+        return
+    reader = SimpleDirectoryReader(input_files=[path], filename_as_id=True)
+    for documents in reader.iter_data():
+        yield from documents
+
+
+def iter_nodes(
+    path: Path, stats: Optional[CleaningStats] = None
+) -> Iterator[BaseNode]:
+    """Yield the chunks of one file, splitting each document as soon as it is read."""
+    path = Path(path)
+    documents: Iterable[Document]
+    if not CLEANING_ENABLED:
+        documents = iter_documents(path)
+    elif path.suffix.lower() == ".pdf" and PYPDF_AVAILABLE:
+        # two streaming passes: find the lines repeated across pages, then strip them
+        boilerplate = BoilerplateFilter(d.text for d in iter_documents(path))
+        documents = iter_documents(path)
+    else:
+        # other readers return a file's documents all at once anyway
+        documents = list(iter_documents(path))
+        boilerplate = BoilerplateFilter(d.text for d in documents)
+
+    for document in documents:
+        if CLEANING_ENABLED:
+            document.set_content(boilerplate.clean(document.text, stats))
+        yield from Settings.node_parser.get_nodes_from_documents([document])
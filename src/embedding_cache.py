@@ -0,0 +1,210 @@
+"""
+Persistent on-disk embedding cache.
+
+CachedEmbedding wraps any LlamaIndex embedding model and is installed as
+Settings.embed_model. Document chunk embeddings are stored in a local SQLite
+database keyed by (model name, sha256 of the chunk text), so rebuilds, restarts
+and per-file tools only call the embedding API for text it has never seen.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from pydantic import PrivateAttr
+
+logger = logging.getLogger("embedding_cache")
+
+THIS_DIR = Path(__file__).parent
+DEFAULT_CACHE_PATH = THIS_DIR / ".cache" / "embeddings.sqlite3"
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_CHUNK = 500
+
+
+def text_hash(text: str) -> str:
+    """Return the cache key for a chunk of text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCacheStore:
+    """SQLite table of float32 vectors keyed by (model, text hash)."""
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+        self.entries, self.bytes_stored = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, Embedding]:
+        """Return the cached vectors for whichever hashes are present."""
+        found: Dict[str, Embedding] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            for start in range(0, len(unique), _LOOKUP_CHUNK):
+                chunk = unique[start : start + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *chunk],
+                )
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, model: str, items: Dict[str, Embedding]) -> None:
+        """Store vectors for hashes that are not cached yet."""
+        if not items:
+            return
+        rows = [
+            (model, key, array("f", vector).tobytes()) for key, vector in items.items()
+        ]
+        with self._lock:
+            for row in rows:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO embeddings (model, text_hash, vector) "
+                    "VALUES (?, ?, ?)",
+                    row,
+                )
+                if cursor.rowcount:
+                    self.entries += 1
+                    self.bytes_stored += len(row[2])
+            self._conn.commit()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model that serves repeated chunk text from the on-disk cache.
+
+    Only document (text) embeddings are cached; query embeddings are passed
+    straight through to the wrapped model.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _store: EmbeddingCacheStore = PrivateAttr()
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        cache_path: Optional[Path] = None,
+        store: Optional[EmbeddingCacheStore] = None,
+        **kwargs,
+    ):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._inner = embed_model
+        self._store = store or EmbeddingCacheStore(cache_path or DEFAULT_CACHE_PATH)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """Cumulative lookups for this process plus the size of the cache on disk."""
+        lookups = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "entries": self._store.entries,
+            "bytes": self._store.bytes_stored,
+        }
+
+    def log_stats(self, level: int = logging.INFO) -> None:
+        stats = self.stats
+        logger.log(
+            level,
+            f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"(hit rate {stats['hit_rate']:.1%}), {stats['entries']} vectors, "
+            f"{stats['bytes'] / 1024 / 1024:.2f} MiB stored"
+        )
+
+    def _lookup(self, texts: List[str]):
+        hashes = [text_hash(t) for t in texts]
+        cached = self._store.get_many(self.model_name, hashes)
+        missing: Dict[str, str] = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        self._hits += sum(1 for key in hashes if key in cached)
+        self._misses += len(missing)
+        return hashes, cached, missing
+
+    def _merge(
+        self,
+        hashes: List[str],
+        cached: Dict[str, Embedding],
+        missing: Dict[str, str],
+        new_vectors: List[Embedding],
+    ) -> List[Embedding]:
+        fresh = dict(zip(missing, new_vectors))
+        self._store.put_many(self.model_name, fresh)
+        if fresh:
+            self.log_stats(logging.DEBUG)
+        cached.update(fresh)
+        return [cached[key] for key in hashes]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._inner._get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._inner._aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        hashes, cached, missing = self._lookup(texts)
+        new_vectors = (
+            self._inner._get_text_embeddings(list(missing.values())) if missing else []
+        )
+        return self._merge(hashes, cached, missing, new_vectors)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        hashes, cached, missing = self._lookup(texts)
+        new_vectors = (
+            await self._inner._aget_text_embeddings(list(missing.values()))
+            if missing
+            else []
+        )
+        return self._merge(hashes, cached, missing, new_vectors)
+
+
+def log_cache_stats(embed_model: BaseEmbedding) -> None:
+    """Log hit rate and stored bytes if embed_model is backed by the cache."""
+    if isinstance(embed_model, CachedEmbedding):
+        embed_model.log_stats()
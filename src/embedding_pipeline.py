@@ -0,0 +1,205 @@
+"""
+Batched, bounded-concurrency embedding stage for ingestion.
+
+Nodes are grouped into fixed-size batches and up to ``max_in_flight`` batch
+requests are kept outstanding against the embedding API. Requests are paced by
+an adaptive token bucket: a 429 / quota error halves the request rate and the
+batch is retried after a backoff, while successful requests slowly raise the rate
+back towards its ceiling.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence
+
+from llama_index.core import Settings
+from llama_index.core.async_utils import asyncio_run
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import BaseNode, MetadataMode
+
+logger = logging.getLogger("embedding_pipeline")
+
+_RATE_LIMIT_MARKERS = ("429", "resource_exhausted", "rate limit", "quota")
+
+# progress(stage, done, total), e.g. ("embedding", 640, 2000)
+ProgressCallback = Callable[[str, int, int], None]
+
+
+@dataclass
+class EmbeddingPipelineConfig:
+    """Tuning knobs for the ingestion embedding stage."""
+
+    batch_size: int = 64
+    max_in_flight: int = 4
+    requests_per_second: float = 5.0
+    min_requests_per_second: float = 0.2
+    max_retries: int = 8
+    backoff_seconds: float = 1.0
+    max_backoff_seconds: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingPipelineConfig":
+        """Build a config, overriding defaults from EMBED_* environment variables."""
+        config = cls()
+        config.batch_size = int(os.getenv("EMBED_BATCH_SIZE", config.batch_size))
+        config.max_in_flight = int(
+            os.getenv("EMBED_MAX_IN_FLIGHT", config.max_in_flight)
+        )
+        config.requests_per_second = float(
+            os.getenv("EMBED_REQUESTS_PER_SECOND", config.requests_per_second)
+        )
+        return config
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Return True for 429 / quota-exhausted errors from any embedding client."""
+    for attr in ("code", "status_code", "status"):
+        if getattr(error, attr, None) == 429:
+            return True
+    message = str(error).lower()
+    return any(marker in message for marker in _RATE_LIMIT_MARKERS)
+
+
+class AdaptiveTokenBucket:
+    """Token bucket whose refill rate backs off on throttling (AIMD)."""
+
+    def __init__(self, rate: float, min_rate: float, burst: Optional[float] = None):
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def on_throttle(self) -> None:
+        """Halve the rate and drain the bucket after a 429."""
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._tokens = 0.0
+
+    def on_success(self) -> None:
+        """Creep the rate back up by 5% of the ceiling per successful request."""
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+@dataclass
+class EmbeddingPipelineStats:
+    """Throughput and throttling counters for one pipeline run."""
+
+    chunks: int = 0
+    batches: int = 0
+    throttled: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+
+async def aembed_nodes(
+    nodes: Sequence[BaseNode],
+    embed_model: Optional[BaseEmbedding] = None,
+    config: Optional[EmbeddingPipelineConfig] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> EmbeddingPipelineStats:
+    """Fill in ``node.embedding`` for every node that does not have one yet."""
+    embed_model = embed_model or Settings.embed_model
+    config = config or EmbeddingPipelineConfig.from_env()
+    stats = EmbeddingPipelineStats()
+
+    todo = [node for node in nodes if node.embedding is None]
+    if not todo:
+        return stats
+
+    queue: "asyncio.Queue[tuple]" = asyncio.Queue()
+    for start in range(0, len(todo), config.batch_size):
+        queue.put_nowait((todo[start : start + config.batch_size], 0))
+    bucket = AdaptiveTokenBucket(
+        config.requests_per_second,
+        config.min_requests_per_second,
+        burst=config.max_in_flight,
+    )
+
+    async def worker() -> None:
+        while True:
+            try:
+                batch, attempt = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await bucket.acquire()
+            texts = [n.get_content(metadata_mode=MetadataMode.EMBED) for n in batch]
+            try:
+                vectors = await embed_model._aget_text_embeddings(texts)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= config.max_retries:
+                    raise
+                bucket.on_throttle()
+                stats.throttled += 1
+                delay = min(
+                    config.max_backoff_seconds, config.backoff_seconds * 2**attempt
+                )
+                logger.warning(
+                    f"Embedding request throttled ({e}); retrying in {delay:.1f}s "
+                    f"at {bucket.rate:.2f} req/s"
+                )
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                queue.put_nowait((batch, attempt + 1))
+                continue
+            for node, vector in zip(batch, vectors):
+                node.embedding = vector
+            bucket.on_success()
+            stats.batches += 1
+            stats.chunks += len(batch)
+            if progress is not None:
+                progress("embedding", stats.chunks, len(todo))
+
+    started = time.perf_counter()
+    workers = [
+        asyncio.create_task(worker())
+        for _ in range(min(config.max_in_flight, queue.qsize()))
+    ]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+    stats.elapsed = time.perf_counter() - started
+
+    logger.info(
+        f"Embedded {stats.chunks} chunks in {stats.batches} batches "
+        f"({stats.chunks_per_second:.1f} chunks/s, {stats.throttled} throttled retries)"
+    )
+    return stats
+
+
+def embed_nodes(
+    nodes: Sequence[BaseNode],
+    embed_model: Optional[BaseEmbedding] = None,
+    config: Optional[EmbeddingPipelineConfig] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> EmbeddingPipelineStats:
+    """Synchronous wrapper around aembed_nodes, safe to call inside a running loop."""
+    return asyncio_run(
+        aembed_nodes(nodes, embed_model=embed_model, config=config, progress=progress)
+    )
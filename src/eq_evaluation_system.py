@@ -58,7 +58,7 @@ class MindCureEQEvaluator:
     
     def __init__(self):
         """Initialize the EQ evaluator with test scenarios"""
-        self.workflow_agent, self.index, self.file_tools = setup_combined_agent()
+        self.workflow_agent, self.index, self.file_catalog = setup_combined_agent()
         self.results: List[EQTestResult] = []
         
         # Test scenarios based on research paper methodology
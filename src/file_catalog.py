@@ -0,0 +1,136 @@
+"""
+Compact catalog of the files in the knowledge base, for the document agent.
+
+The agent used to get a vector and a summary tool per file, so the tool schema
+sent to the LLM on every step grew with the corpus. It now has a fixed set of
+tools that take an optional file name, and finds file names in this catalog:
+one short line per file (name, pages, chunks and the start of its summary),
+searchable by keywords and paged, so neither the prompt nor a listing grows
+with the number of files.
+"""
+
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Set
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import MetadataMode
+
+from doc_summaries import SummaryStore
+from ingestion import IngestionManifest
+from keyword_index import STOP_WORDS
+
+# Files listed per catalog lookup, and characters of description per file
+CATALOG_PAGE_SIZE = 20
+DESCRIPTION_CHARS = 160
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _words(text: str) -> Set[str]:
+    return set(_WORD.findall(text.lower())) - STOP_WORDS
+
+
+def _shorten(text: str, limit: int = DESCRIPTION_CHARS) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[: limit - 3].rsplit(" ", 1)[0] + "..."
+
+
+@dataclass
+class CatalogEntry:
+    file_name: str
+    pages: int
+    chunks: int
+    description: str
+
+    def line(self) -> str:
+        size = f"{self.pages} pages" if self.pages else f"{self.chunks} chunks"
+        return f"- {self.file_name} ({size}): {self.description}"
+
+
+class FileCatalog:
+    """The ingested files, resolvable from loose references and searchable."""
+
+    def __init__(self, entries: List[CatalogEntry]):
+        self.entries = sorted(entries, key=lambda e: e.file_name.lower())
+        self._by_name = {e.file_name: e for e in self.entries}
+        self._name_words = {
+            e.file_name: _words(Path(e.file_name).stem) for e in self.entries
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @classmethod
+    def build(
+        cls,
+        index: VectorStoreIndex,
+        manifest: IngestionManifest,
+        summaries: SummaryStore,
+    ) -> "FileCatalog":
+        """Catalog every file of ``manifest`` from its nodes and cached summary."""
+        entries = []
+        for file_name, entry in manifest.entries.items():
+            nodes = index.docstore.get_nodes(entry.node_ids, raise_error=False)
+            nodes = [n for n in nodes if n is not None]
+            pages = {n.metadata.get("page_label") for n in nodes} - {None}
+            summary = summaries.get(file_name, entry.content_hash)
+            if summary is not None:
+                description = summary.summary
+            elif nodes:
+                description = nodes[0].get_content(metadata_mode=MetadataMode.NONE)
+            else:
+                description = ""
+            entries.append(
+                CatalogEntry(file_name, len(pages), len(nodes), _shorten(description))
+            )
+        return cls(entries)
+
+    def resolve(self, reference: str) -> Optional[str]:
+        """The file name ``reference`` points to, e.g. "LongLoRA" for longlora.pdf."""
+        if reference in self._by_name:
+            return reference
+        wanted = reference.strip().lower()
+        for name in self._by_name:
+            if wanted in (name.lower(), Path(name).stem.lower()):
+                return name
+        words = _words(reference)
+        scores = {
+            name: len(words & name_words) / len(name_words)
+            for name, name_words in self._name_words.items()
+            if name_words
+        }
+        best = max(scores.values(), default=0)
+        matches = [name for name, score in scores.items() if score == best]
+        return matches[0] if best > 0 and len(matches) == 1 else None
+
+    def search(
+        self, query: Optional[str] = None, limit: int = CATALOG_PAGE_SIZE
+    ) -> List[CatalogEntry]:
+        """Files whose name or description match ``query``, best first."""
+        if not query:
+            return self.entries[:limit]
+        words = _words(query)
+        scored = []
+        for entry in self.entries:
+            score = 2 * len(words & self._name_words[entry.file_name])
+            score += len(words & _words(entry.description))
+            if score:
+                scored.append((-score, entry.file_name, entry))
+        return [entry for _, _, entry in sorted(scored)[:limit]]
+
+    def describe(self, query: Optional[str] = None) -> str:
+        """A listing of the files matching ``query``, for the agent."""
+        if not self.entries:
+            return "The knowledge base has no documents yet."
+        entries = self.search(query, limit=len(self.entries))
+        if not entries:
+            return f"No documents match {query!r}; try other keywords."
+        shown = entries[:CATALOG_PAGE_SIZE]
+        lines = [entry.line() for entry in shown]
+        if len(entries) > len(shown):
+            lines.append(
+                f"... and {len(entries) - len(shown)} more; use more specific keywords."
+            )
+        return "\n".join(lines)
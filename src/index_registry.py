@@ -0,0 +1,245 @@
+"""
+Process-wide registry of persisted indexes.
+
+livekit_rag, llamaindex_rag and the EQ evaluator all query the same
+query-engine-storage directory. The registry loads each persisted index once per
+process and hands out the same shared instance to every caller, together with a
+version number that increases whenever the index is reloaded or updated, so
+anything derived from an index (query engines, agents, caches) can tell when it
+is stale.
+
+Handles are read-only: ``IndexRegistry.update`` ingests changes into a new
+on-disk version (see index_versions), publishes it and loads it, so readers in
+this and every other process only ever see complete versions.
+
+Rebuilds by another process (recreate_rag) publish a new on-disk version, see
+index_versions. ``IndexRegistry.watch`` notices the switch, either by polling or
+immediately on SIGHUP, and loads the new version in the background while callers
+keep being served from the old one until the new handle is published.
+"""
+
+import logging
+import os
+import signal
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from llama_index.core import VectorStoreIndex, load_index_from_storage
+
+from index_versions import (
+    current_version_dir,
+    new_version_dir,
+    publish_version,
+    summarize_version,
+    update_version,
+    version_lock,
+)
+from ingestion import IngestionStats, build_index
+from query_engines import query_engines
+from vector_store import load_storage_context
+
+logger = logging.getLogger("index_registry")
+
+THIS_DIR = Path(__file__).parent
+DATA_DIR = THIS_DIR / "data"
+PERSIST_DIR = THIS_DIR / "query-engine-storage"
+
+# Seconds between checks for a newly published index version
+WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "2"))
+
+
+def _key(persist_dir: Path) -> Path:
+    # absolute but not resolved: persist_dir is a symlink that moves between versions
+    return Path(os.path.abspath(persist_dir))
+
+
+@dataclass(frozen=True)
+class IndexHandle:
+    """A shared index together with the version it was published as."""
+
+    index: VectorStoreIndex
+    version: int
+    persist_dir: Path
+    data_dir: Path
+    # the version directory the index was actually loaded from
+    storage_dir: Path
+    # identifies the on-disk content behind the index, stable across processes
+    # and restarts (unlike ``version``), e.g. for keying persisted caches
+    revision: str = ""
+
+
+class IndexRegistry:
+    """Loads each persisted index once and shares it across the process."""
+
+    def __init__(self):
+        self._handles: Dict[Path, IndexHandle] = {}
+        self._lock = threading.RLock()
+        self._watchers: Dict[Path, threading.Event] = {}
+
+    def get(
+        self, persist_dir: Path = PERSIST_DIR, data_dir: Path = DATA_DIR
+    ) -> IndexHandle:
+        """Return the shared handle, loading (or building) the index on first use."""
+        persist_dir = _key(persist_dir)
+        handle = self._handles.get(persist_dir)
+        if handle is not None:
+            return handle
+        with self._lock:
+            handle = self._handles.get(persist_dir)
+            if handle is None:
+                handle = self._publish(
+                    *self._load(persist_dir, Path(data_dir)), persist_dir, data_dir
+                )
+            return handle
+
+    def version(self, persist_dir: Path = PERSIST_DIR) -> Optional[int]:
+        """Current version of a loaded index, or None if it has not been loaded."""
+        handle = self._handles.get(_key(persist_dir))
+        return handle.version if handle else None
+
+    def update(
+        self,
+        persist_dir: Path = PERSIST_DIR,
+        data_dir: Path = DATA_DIR,
+        paths: Optional[Iterable[Path]] = None,
+    ) -> IngestionStats:
+        """Ingest data_dir (or only ``paths``) into a new version and swap it in.
+
+        The version being served is never written to; when something changed,
+        the updated copy is published and loaded, which bumps the version. New
+        documents are summarized after that and the version with their
+        summaries is loaded in turn.
+        """
+        persist_dir = _key(persist_dir)
+        with self._lock:
+            version_dir, stats = update_version(
+                persist_dir, Path(data_dir), paths=paths, summarize=False
+            )
+            if version_dir is not None:
+                self.reload(persist_dir, data_dir)
+        if summarize_version(persist_dir) is not None:
+            self.reload(persist_dir, data_dir)
+        return stats
+
+    def reload(
+        self, persist_dir: Path = PERSIST_DIR, data_dir: Path = DATA_DIR
+    ) -> IndexHandle:
+        """Re-read a persisted index from disk, e.g. after another process rebuilt it.
+
+        The new index is loaded before it is published, so callers keep getting
+        the previous handle until the new one is ready.
+        """
+        persist_dir = _key(persist_dir)
+        with self._lock:
+            return self._publish(
+                *self._load(persist_dir, Path(data_dir)), persist_dir, data_dir
+            )
+
+    def reload_if_changed(self, persist_dir: Path = PERSIST_DIR) -> bool:
+        """Reload a loaded index if a different on-disk version has been published."""
+        handle = self._handles.get(_key(persist_dir))
+        if handle is None:
+            return False
+        current = current_version_dir(handle.persist_dir)
+        if current is None or current == handle.storage_dir:
+            return False
+        logger.info(f"New index version {current.name} published, reloading")
+        self.reload(handle.persist_dir, handle.data_dir)
+        return True
+
+    def watch(
+        self,
+        persist_dir: Path = PERSIST_DIR,
+        data_dir: Path = DATA_DIR,
+        interval: float = WATCH_INTERVAL,
+    ) -> None:
+        """Reload the index in a background thread whenever a new version is published.
+
+        The directory is polled every ``interval`` seconds; sending the process
+        SIGHUP triggers a check right away. Calling watch again is a no-op.
+        """
+        persist_dir = _key(persist_dir)
+        with self._lock:
+            if persist_dir in self._watchers:
+                return
+            self.get(persist_dir, data_dir)
+            wake = self._watchers[persist_dir] = threading.Event()
+
+        def run() -> None:
+            while True:
+                wake.wait(interval)
+                wake.clear()
+                try:
+                    self.reload_if_changed(persist_dir)
+                except Exception as e:
+                    logger.error(f"Error reloading index {persist_dir}: {e}")
+
+        threading.Thread(
+            target=run, name=f"index-watch-{persist_dir.name}", daemon=True
+        ).start()
+        _install_sighup_handler(self)
+
+    def _wake_watchers(self, *_) -> None:
+        for wake in list(self._watchers.values()):
+            wake.set()
+
+    def _publish(
+        self,
+        index: VectorStoreIndex,
+        storage_dir: Path,
+        persist_dir: Path,
+        data_dir: Path,
+    ) -> IndexHandle:
+        previous = self._handles.get(persist_dir)
+        handle = IndexHandle(
+            index=index,
+            version=previous.version + 1 if previous else 1,
+            persist_dir=persist_dir,
+            data_dir=Path(data_dir),
+            storage_dir=storage_dir,
+            revision=storage_dir.name,
+        )
+        self._handles[persist_dir] = handle
+        if previous is not None and previous.index is not index:
+            # engines built on the replaced index must not outlive it
+            query_engines.invalidate(previous.index)
+        logger.info(
+            f"Published index {persist_dir} ({storage_dir.name}) as version {handle.version}"
+        )
+        return handle
+
+    @staticmethod
+    def _load(persist_dir: Path, data_dir: Path) -> Tuple[VectorStoreIndex, Path]:
+        storage_dir = current_version_dir(persist_dir)
+        if storage_dir is None:
+            with version_lock(persist_dir):
+                # another process may have built it while we waited for the lock
+                storage_dir = current_version_dir(persist_dir)
+                if storage_dir is None:
+                    logger.info(
+                        f"No index at {persist_dir}, building one from {data_dir}"
+                    )
+                    data_dir.mkdir(parents=True, exist_ok=True)
+                    storage_dir = new_version_dir(persist_dir)
+                    index = build_index(data_dir, storage_dir)
+                    publish_version(persist_dir, storage_dir)
+                    return index, storage_dir
+        # Load from the resolved version directory so a concurrent publish
+        # cannot mix files from two versions
+        logger.info(f"Loading persisted index from {storage_dir}")
+        return load_index_from_storage(load_storage_context(storage_dir)), storage_dir
+
+
+def _install_sighup_handler(registry: IndexRegistry) -> None:
+    # signal handlers can only be installed from the main thread
+    if not hasattr(signal, "SIGHUP"):
+        return
+    if threading.current_thread() is not threading.main_thread():
+        return
+    signal.signal(signal.SIGHUP, registry._wake_watchers)
+
+
+# Global instance to share across modules
+registry = IndexRegistry()
@@ -0,0 +1,275 @@
+"""
+Versioned on-disk layout for persisted indexes.
+
+``query-engine-storage`` is a symlink to one directory under
+``query-engine-storage.versions/``. Full rebuilds are written to a fresh version
+directory and published by atomically replacing the symlink, so a process that
+opens the index always reads one complete version: never a missing directory and
+never a half-written one. Old versions are kept for a while because running
+workers keep serving from the version they loaded until they have reloaded.
+
+``rebuild_version`` and ``update_version`` are the two ways a new version is
+made: a full rebuild from the data directory, or a copy of the current version
+brought up to date incrementally. A published version is never written to
+again. Both hold ``version_lock`` from reading the current version until the
+new one is published, so updates from several processes (ingestion service,
+recreate_rag, agent workers) are applied one after the other instead of
+publishing over each other.
+
+The copy shares every file that is only ever replaced (vectors, docstore
+segments, manifest, ...) with the current version through hard links; only the
+small JSON stores that llama_index rewrites in place are copied.
+
+New documents are published as soon as they are searchable. Their summaries
+are made afterwards, without holding the lock, and published as a follow-up
+version by ``summarize_version``; a summarization failure is logged and never
+fails ingestion.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from llama_index.core import load_index_from_storage
+
+from doc_summaries import SummaryStore, add_summaries, summarize_missing
+from embedding_pipeline import ProgressCallback
+from ingestion import IngestionStats, build_index_with_stats, incremental_update
+from segmented_docstore import link_or_copy
+from vector_store import load_storage_context, migrate_vector_store
+
+logger = logging.getLogger("index_versions")
+
+try:
+    import fcntl
+
+    FCNTL_AVAILABLE = True
+except ImportError:
+    # Windows: no cross-process lock, run a single process that ingests
+    FCNTL_AVAILABLE = False
+
+VERSIONS_SUFFIX = ".versions"
+LOCK_FNAME = ".publish.lock"
+
+# Current version plus the most recent previous ones, for workers still reloading
+KEEP_VERSIONS = 3
+
+# llama_index JSON stores (index_store.json, graph_store.json, ...) are rewritten
+# in place, so a staged version gets its own copy instead of a hard link
+IN_PLACE_SUFFIX = "store.json"
+
+
+def versions_dir(persist_dir: Path) -> Path:
+    """Directory holding every version of persist_dir."""
+    persist_dir = Path(os.path.abspath(persist_dir))
+    return persist_dir.with_name(persist_dir.name + VERSIONS_SUFFIX)
+
+
+def new_version_dir(persist_dir: Path) -> Path:
+    """Create an empty staging directory for the next version of persist_dir."""
+    root = versions_dir(persist_dir)
+    root.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix=time.strftime("%Y%m%d-%H%M%S-"), dir=root))
+
+
+def stage_version(current_dir: Path, version_dir: Path) -> None:
+    """Fill the staging directory version_dir with the files of current_dir."""
+    for path in current_dir.iterdir():
+        target = version_dir / path.name
+        if path.is_dir():
+            shutil.copytree(path, target, dirs_exist_ok=True)
+        elif path.name.endswith(IN_PLACE_SUFFIX):
+            shutil.copy2(path, target)
+        else:
+            link_or_copy(path, target)
+
+
+@contextmanager
+def version_lock(persist_dir: Path) -> Iterator[None]:
+    """Serialize making and publishing versions of persist_dir across processes."""
+    root = versions_dir(persist_dir)
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / LOCK_FNAME, "a") as lock_file:
+        if FCNTL_AVAILABLE:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def current_version_dir(persist_dir: Path) -> Optional[Path]:
+    """The directory persist_dir currently points at, or None if nothing is published."""
+    if not os.path.exists(persist_dir):
+        return None
+    return Path(os.path.realpath(persist_dir))
+
+
+def publish_version(persist_dir: Path, version_dir: Path) -> None:
+    """Atomically point persist_dir at version_dir."""
+    persist_dir = Path(os.path.abspath(persist_dir))
+    if persist_dir.exists() and not persist_dir.is_symlink():
+        # Storage from before versioning is a plain directory, which a symlink
+        # cannot replace atomically; adopt it as a version first (one time only)
+        legacy_dir = versions_dir(persist_dir) / f"legacy-{time.strftime('%Y%m%d-%H%M%S')}"
+        legacy_dir.parent.mkdir(parents=True, exist_ok=True)
+        os.rename(persist_dir, legacy_dir)
+        logger.info(f"Moved unversioned storage {persist_dir} to {legacy_dir}")
+
+    link_tmp = persist_dir.with_name(f".{persist_dir.name}.{os.getpid()}.tmp")
+    if link_tmp.is_symlink():
+        link_tmp.unlink()
+    os.symlink(os.path.relpath(version_dir, persist_dir.parent), link_tmp)
+    os.replace(link_tmp, persist_dir)
+    logger.info(f"Published {version_dir.name} as {persist_dir}")
+
+
+def prune_versions(persist_dir: Path, keep: int = KEEP_VERSIONS) -> List[Path]:
+    """Delete all but the current and the newest ``keep - 1`` other versions."""
+    root = versions_dir(persist_dir)
+    if not root.exists():
+        return []
+    current = current_version_dir(persist_dir)
+    others = sorted(
+        (p for p in root.iterdir() if p.is_dir() and p != current),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    removed = others[max(keep - 1, 0) :]
+    for version_dir in removed:
+        # Workers still serving this version keep their memory-mapped vectors
+        # open, so deleting the files does not break in-flight queries
+        shutil.rmtree(version_dir, ignore_errors=True)
+        logger.info(f"Removed old index version {version_dir.name}")
+    return removed
+
+
+def rebuild_version(
+    persist_dir: Path,
+    data_dir: Path,
+    progress: Optional[ProgressCallback] = None,
+    summarize: bool = True,
+) -> Path:
+    """Build the index from scratch into a new version and publish it.
+
+    Summaries of unchanged documents are carried over from the current version,
+    the others are made afterwards unless ``summarize`` is False (see
+    summarize_version). A failed build is discarded and the current version
+    stays published. Returns the last version published.
+    """
+    with version_lock(persist_dir):
+        version_dir, _ = _rebuild_version(persist_dir, data_dir, progress)
+    if summarize:
+        return summarize_version(persist_dir, progress) or version_dir
+    return version_dir
+
+
+def _rebuild_version(
+    persist_dir: Path, data_dir: Path, progress: Optional[ProgressCallback] = None
+) -> Tuple[Path, IngestionStats]:
+    version_dir = new_version_dir(persist_dir)
+    try:
+        _, stats = build_index_with_stats(data_dir, version_dir, progress)
+        current_dir = current_version_dir(persist_dir)
+        if current_dir is not None:
+            add_summaries(version_dir, SummaryStore(current_dir).summaries)
+    except BaseException:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    publish_version(persist_dir, version_dir)
+    prune_versions(persist_dir)
+    return version_dir, stats
+
+
+def update_version(
+    persist_dir: Path,
+    data_dir: Path,
+    progress: Optional[ProgressCallback] = None,
+    paths: Optional[Iterable[Path]] = None,
+    summarize: bool = True,
+) -> Tuple[Optional[Path], IngestionStats]:
+    """Incrementally ingest data_dir into a copy of the current version and publish it.
+
+    Only new and changed files are embedded; ``paths`` narrows the check to the
+    given files. A legacy JSON vector store is converted in the copy. Documents
+    without a summary are summarized after the update is published, unless
+    ``summarize`` is False (see summarize_version). Returns the last version
+    published, or None when nothing changed and no version was published.
+    """
+    with version_lock(persist_dir):
+        version_dir, stats = _update_version(persist_dir, data_dir, progress, paths)
+    if summarize:
+        version_dir = summarize_version(persist_dir, progress) or version_dir
+    return version_dir, stats
+
+
+def _update_version(
+    persist_dir: Path,
+    data_dir: Path,
+    progress: Optional[ProgressCallback] = None,
+    paths: Optional[Iterable[Path]] = None,
+) -> Tuple[Optional[Path], IngestionStats]:
+    current_dir = current_version_dir(persist_dir)
+    if current_dir is None:
+        return _rebuild_version(persist_dir, data_dir, progress)
+
+    version_dir = new_version_dir(persist_dir)
+    try:
+        stage_version(current_dir, version_dir)
+        migrated = migrate_vector_store(version_dir)
+        index = load_index_from_storage(load_storage_context(version_dir))
+        stats = incremental_update(index, data_dir, version_dir, progress, paths)
+    except BaseException:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    if not stats.changed and not migrated:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        return None, stats
+    publish_version(persist_dir, version_dir)
+    prune_versions(persist_dir)
+    return version_dir, stats
+
+
+def summarize_version(
+    persist_dir: Path, progress: Optional[ProgressCallback] = None
+) -> Optional[Path]:
+    """Publish a copy of the current version with its missing document summaries.
+
+    The documents are summarized from the published version without holding
+    the version lock, so updates published meanwhile are not held up; the
+    summaries still matching a file are then added to whatever version is
+    current by then. Errors while summarizing are logged and leave the current
+    version as it is. Returns the published version, or None.
+    """
+    base_dir = current_version_dir(persist_dir)
+    if base_dir is None:
+        return None
+    try:
+        index = load_index_from_storage(load_storage_context(base_dir))
+        summaries = summarize_missing(index, base_dir, progress)
+    except Exception as e:
+        logger.error(f"Could not summarize documents of {base_dir.name}: {e}")
+        return None
+    if not summaries:
+        return None
+
+    with version_lock(persist_dir):
+        version_dir = new_version_dir(persist_dir)
+        try:
+            stage_version(current_version_dir(persist_dir), version_dir)
+            added = add_summaries(version_dir, summaries)
+        except BaseException:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            raise
+        if not added:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            return None
+        publish_version(persist_dir, version_dir)
+        prune_versions(persist_dir)
+    return version_dir
@@ -0,0 +1,436 @@
+"""
+Incremental ingestion for the persistent knowledge-base index.
+
+An ingestion manifest is kept next to the persisted index. It records, for every
+file in the data directory, its content hash, mtime and the node ids it produced,
+so that only new or changed files are parsed and embedded on each update and the
+nodes of changed or deleted files are replaced instead of duplicated. A node can
+be listed by several files when they contain the same chunk.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from clean_document import CLEANING_ENABLED, ChunkDeduplicator, CleaningStats
+from embedding_cache import log_cache_stats
+from embedding_pipeline import ProgressCallback, embed_nodes
+from parse_cache import parse_cache
+from vector_store import new_storage_context
+
+logger = logging.getLogger("ingestion")
+
+MANIFEST_FNAME = "ingestion_manifest.json"
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# Memory ceiling for chunks waiting to be embedded; inserted nodes go to disk
+# (docstore segments, spilled vectors and keywords), see ingest_paths
+MAX_BUFFER_BYTES = int(os.getenv("INGEST_BUFFER_MB", "64")) * 1024 * 1024
+# Metadata listing every file a node's chunk appears in; see ingest_paths
+FILE_NAMES_KEY = "file_names"
+
+# Per-node overhead on top of its text, dominated by the embedding as a list of
+# Python floats (~32 bytes per dimension at 768 dimensions)
+NODE_OVERHEAD_BYTES = 32 * 1024
+
+
+def file_content_hash(path: Path) -> str:
+    """Return the sha256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def list_data_files(data_dir: Path) -> List[Path]:
+    """List the files SimpleDirectoryReader would load from the data directory."""
+    if not data_dir.exists():
+        return []
+    return sorted(
+        p for p in data_dir.iterdir() if p.is_file() and not p.name.startswith(".")
+    )
+
+
+@dataclass
+class ManifestEntry:
+    """What the index currently holds for one source file."""
+
+    content_hash: str
+    mtime: float
+    size: int
+    node_ids: List[str] = field(default_factory=list)
+
+
+class IngestionManifest:
+    """Maps data-directory file names to the state they were ingested in."""
+
+    def __init__(self, entries: Optional[Dict[str, ManifestEntry]] = None):
+        self.entries: Dict[str, ManifestEntry] = entries or {}
+
+    @classmethod
+    def load(cls, persist_dir: Path) -> Optional["IngestionManifest"]:
+        """Load the manifest stored in persist_dir, or None if there is none."""
+        manifest_path = Path(persist_dir) / MANIFEST_FNAME
+        if not manifest_path.exists():
+            return None
+        with open(manifest_path, encoding="utf-8") as f:
+            raw = json.load(f)
+        return cls(
+            {key: ManifestEntry(**value) for key, value in raw["files"].items()}
+        )
+
+    def persist(self, persist_dir: Path) -> None:
+        """Write the manifest atomically next to the persisted index."""
+        persist_dir = Path(persist_dir)
+        persist_dir.mkdir(parents=True, exist_ok=True)
+        manifest_path = persist_dir / MANIFEST_FNAME
+        tmp_path = manifest_path.with_suffix(".json.tmp")
+        payload = {
+            "files": {key: vars(entry) for key, entry in sorted(self.entries.items())}
+        }
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+    def is_current(self, key: str, path: Path) -> bool:
+        """Check whether the file at path matches what was ingested under key.
+
+        mtime and size are compared first so unchanged files are never re-hashed;
+        a touched file whose bytes are identical is still treated as current.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        stat = path.stat()
+        if stat.st_mtime == entry.mtime and stat.st_size == entry.size:
+            return True
+        if stat.st_size != entry.size or file_content_hash(path) != entry.content_hash:
+            return False
+        entry.mtime = stat.st_mtime
+        return True
+
+    @classmethod
+    def from_index(
+        cls, index: VectorStoreIndex, data_dir: Path
+    ) -> "IngestionManifest":
+        """Adopt the nodes of an index that was built before manifests existed.
+
+        Nodes are matched to files through the file_name metadata that
+        SimpleDirectoryReader attaches, and the files are recorded as they are
+        now, so the first incremental update does not re-embed the corpus.
+        """
+        manifest = cls()
+        node_ids_by_name: Dict[str, List[str]] = {}
+        for node_id in index.index_struct.nodes_dict.values():
+            node = index.docstore.get_node(node_id, raise_error=False)
+            if node is None:
+                continue
+            file_name = node.metadata.get("file_name")
+            if file_name:
+                node_ids_by_name.setdefault(file_name, []).append(node_id)
+
+        for path in list_data_files(data_dir):
+            node_ids = node_ids_by_name.get(path.name)
+            if node_ids:
+                stat = path.stat()
+                manifest.entries[path.name] = ManifestEntry(
+                    content_hash=file_content_hash(path),
+                    mtime=stat.st_mtime,
+                    size=stat.st_size,
+                    node_ids=node_ids,
+                )
+        logger.info(
+            f"Adopted {len(manifest.entries)} previously ingested files into a new manifest"
+        )
+        return manifest
+
+
+@dataclass
+class IngestionStats:
+    """Counts reported by an incremental ingestion run."""
+
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    nodes_inserted: int = 0
+    nodes_deleted: int = 0
+    cleaning: CleaningStats = field(default_factory=CleaningStats)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
+
+
+def _node_size(node: BaseNode) -> int:
+    """Rough in-memory footprint of a buffered node, including its embedding."""
+    return len(node.get_content()) + NODE_OVERHEAD_BYTES
+
+
+def _node_owners(manifest: IngestionManifest) -> Dict[str, List[str]]:
+    """The files holding each node id, in file name order."""
+    owners: Dict[str, List[str]] = {}
+    for key in sorted(manifest.entries):
+        for node_id in manifest.entries[key].node_ids:
+            owners.setdefault(node_id, []).append(key)
+    return owners
+
+
+def _update_file_names(
+    index: VectorStoreIndex, owners: Dict[str, List[str]], node_ids: Iterable[str]
+) -> None:
+    """Record on each node the files that hold it.
+
+    Nodes are re-inserted with their stored embedding, so nothing is embedded
+    again. A node whose ``file_name`` is no longer among them moves to the first.
+    """
+    nodes = []
+    for node in index.docstore.get_nodes(sorted(node_ids), raise_error=False):
+        if node is None:
+            continue
+        files = owners[node.node_id]
+        if node.metadata.get(FILE_NAMES_KEY) == files:
+            continue
+        node.metadata[FILE_NAMES_KEY] = files
+        if node.metadata.get("file_name") not in files:
+            node.metadata["file_name"] = files[0]
+        if FILE_NAMES_KEY not in node.excluded_embed_metadata_keys:
+            node.excluded_embed_metadata_keys.append(FILE_NAMES_KEY)
+        node.embedding = index.vector_store.get(node.node_id)
+        nodes.append(node)
+    if nodes:
+        index.insert_nodes(nodes)
+        logger.info(f"Updated the files of {len(nodes)} shared nodes")
+
+
+def ingest_paths(
+    index: VectorStoreIndex,
+    manifest: IngestionManifest,
+    paths: Iterable[Path],
+    progress: Optional[ProgressCallback] = None,
+) -> IngestionStats:
+    """Bring the index in line with the given data-directory paths.
+
+    New and changed files are parsed in parallel (or read back from the parse
+    cache) and streamed through chunks -> embedding batches -> index writes:
+    chunks are buffered until the buffer reaches MAX_BUFFER_BYTES, then embedded
+    together through the batched embedding pipeline and inserted. Inserted nodes
+    do not stay in memory either when the index has a directory to persist to:
+    their text is appended to docstore segments there (see segmented_docstore)
+    and the vector store spills vectors and keyword postings there every
+    SPILL_BYTES (see vector_store). Only per-node bookkeeping (ids, metadata,
+    segment offsets) grows with the run. Once all new nodes are in, the previous
+    nodes of changed files are replaced. Paths that no longer exist have their
+    nodes removed.
+
+    With cleaning enabled, a chunk that duplicates one already in the index (or
+    earlier in the run) is not embedded again: the file's manifest entry lists
+    the existing node, which is shared, and ``file_names`` on the node lists
+    every file holding it, for the file-scoped tools. A shared node is only
+    deleted with the last file holding it.
+    """
+    stats = IngestionStats()
+    buffer: List[BaseNode] = []
+    buffer_bytes = 0
+    ingested = []
+
+    def flush() -> None:
+        nonlocal buffer, buffer_bytes
+        if not buffer:
+            return
+        offset = stats.nodes_inserted
+
+        def embed_progress(stage: str, done: int, total: int) -> None:
+            progress(stage, offset + done, offset + total)
+
+        embed_nodes(buffer, progress=embed_progress if progress else None)
+        index.insert_nodes(buffer)
+        stats.nodes_inserted += len(buffer)
+        buffer, buffer_bytes = [], 0
+
+    to_parse = []
+    # node ids the removed and changed files no longer hold
+    released: List[str] = []
+    for path in paths:
+        path = Path(path)
+        key = path.name
+        entry = manifest.entries.get(key)
+
+        if not path.exists():
+            if entry is not None:
+                released.extend(entry.node_ids)
+                del manifest.entries[key]
+                stats.removed += 1
+                logger.info(f"Removed {key} from the index")
+            continue
+
+        if manifest.is_current(key, path):
+            stats.unchanged += 1
+            continue
+
+        to_parse.append((path, entry, path.stat(), file_content_hash(path)))
+
+    dedup = ChunkDeduplicator() if CLEANING_ENABLED and to_parse else None
+    # node id of every chunk recorded by dedup, by its number
+    kept: List[str] = []
+    if dedup is not None:
+        # Copies of chunks other files already hold are shared, not embedded again
+        parsing = {path.name for path, _, _, _ in to_parse}
+        for key, entry in manifest.entries.items():
+            if key in parsing:
+                continue
+            for node in index.docstore.get_nodes(entry.node_ids, raise_error=False):
+                if node is None:
+                    continue
+                text = node.get_content(metadata_mode=MetadataMode.NONE)
+                if dedup.check(text) is None:
+                    kept.append(node.node_id)
+    shared: Set[str] = set()
+
+    # Parsing fans out to a process pool; unchanged content comes from the cache
+    parsed = parse_cache.parse([(path, h) for path, _, _, h in to_parse], stats.cleaning)
+    for done, ((path, entry, stat, content_hash), (_, nodes)) in enumerate(
+        zip(to_parse, parsed)
+    ):
+        if progress is not None:
+            progress("parsing", done, len(to_parse))
+        key = path.name
+        node_ids: List[str] = []
+        own: Set[str] = set()
+        for node in nodes:
+            if dedup is not None:
+                text = node.get_content(metadata_mode=MetadataMode.NONE)
+                duplicate = dedup.check(text, stats.cleaning)
+                if duplicate is not None:
+                    node_id = kept[duplicate]
+                    if node_id not in own:
+                        # a copy of another file's chunk: share that node
+                        own.add(node_id)
+                        node_ids.append(node_id)
+                        shared.add(node_id)
+                    continue
+                kept.append(node.node_id)
+            own.add(node.node_id)
+            node.metadata[FILE_NAMES_KEY] = [key]
+            node.excluded_embed_metadata_keys.append(FILE_NAMES_KEY)
+            node_ids.append(node.node_id)
+            buffer.append(node)
+            buffer_bytes += _node_size(node)
+            if buffer_bytes >= MAX_BUFFER_BYTES:
+                flush()
+        ingested.append((key, entry, stat, content_hash, node_ids))
+    flush()
+
+    for key, entry, stat, content_hash, node_ids in ingested:
+        if entry is not None:
+            # nodes read back from the parse cache keep their ids; those were
+            # just re-inserted and must stay
+            released.extend(set(entry.node_ids) - set(node_ids))
+            stats.updated += 1
+            logger.info(f"Re-ingested changed file {key} ({len(node_ids)} nodes)")
+        else:
+            stats.added += 1
+            logger.info(f"Ingested new file {key} ({len(node_ids)} nodes)")
+
+        manifest.entries[key] = ManifestEntry(
+            content_hash=content_hash,
+            mtime=stat.st_mtime,
+            size=stat.st_size,
+            node_ids=node_ids,
+        )
+
+    # Nodes still held by another file stay, they only lose this file's name
+    owners = _node_owners(manifest)
+    stale = sorted({node_id for node_id in released if node_id not in owners})
+    index.delete_nodes(stale, delete_from_docstore=True)
+    stats.nodes_deleted += len(stale)
+    _update_file_names(index, owners, shared | (set(released) - set(stale)))
+
+    cleaning = stats.cleaning
+    if cleaning.chunks_removed or cleaning.boilerplate_lines:
+        logger.info(
+            f"Cleaning removed {cleaning.chunks_removed} duplicate chunks "
+            f"({cleaning.exact_duplicates} exact, {cleaning.near_duplicates} near) "
+            f"and {cleaning.boilerplate_lines} boilerplate lines, "
+            f"{cleaning.tokens_removed} tokens in total"
+        )
+    return stats
+
+
+def incremental_update(
+    index: VectorStoreIndex,
+    data_dir: Path,
+    persist_dir: Path,
+    progress: Optional[ProgressCallback] = None,
+    paths: Optional[Iterable[Path]] = None,
+) -> IngestionStats:
+    """Sync the index with the data directory and persist index and manifest.
+
+    When ``paths`` is given (e.g. by the data-directory watcher) only those files
+    are looked at; paths that no longer exist have their nodes removed.
+    """
+    data_dir = Path(data_dir)
+    manifest = IngestionManifest.load(persist_dir)
+    if manifest is None:
+        manifest = IngestionManifest.from_index(index, data_dir)
+
+    if paths is None:
+        current_paths = list_data_files(data_dir)
+        current_names = {p.name for p in current_paths}
+        gone_paths = [
+            data_dir / key for key in manifest.entries if key not in current_names
+        ]
+        paths = current_paths + gone_paths
+    else:
+        paths = sorted({data_dir / Path(p).name for p in paths})
+
+    stats = ingest_paths(index, manifest, paths, progress)
+
+    if stats.changed:
+        index.storage_context.persist(persist_dir=persist_dir)
+    manifest.persist(persist_dir)
+    logger.info(
+        f"Incremental ingestion: {stats.added} added, {stats.updated} updated, "
+        f"{stats.removed} removed, {stats.unchanged} unchanged "
+        f"({stats.nodes_inserted} nodes embedded, {stats.nodes_deleted} deleted)"
+    )
+    log_cache_stats(Settings.embed_model)
+    return stats
+
+
+def build_index(
+    data_dir: Path,
+    persist_dir: Path,
+    progress: Optional[ProgressCallback] = None,
+) -> VectorStoreIndex:
+    """Build a fresh index from the data directory and persist it with a manifest."""
+    return build_index_with_stats(data_dir, persist_dir, progress)[0]
+
+
+def build_index_with_stats(
+    data_dir: Path,
+    persist_dir: Path,
+    progress: Optional[ProgressCallback] = None,
+) -> Tuple[VectorStoreIndex, IngestionStats]:
+    """Like build_index, also returning what was ingested."""
+    index = VectorStoreIndex(
+        nodes=[], storage_context=new_storage_context(persist_dir)
+    )
+    manifest = IngestionManifest()
+    stats = ingest_paths(index, manifest, list_data_files(Path(data_dir)), progress)
+    index.storage_context.persist(persist_dir=persist_dir)
+    manifest.persist(persist_dir)
+    logger.info(
+        f"Built index from {stats.added} files ({stats.nodes_inserted} nodes) "
+        f"and persisted to {persist_dir}"
+    )
+    log_cache_stats(Settings.embed_model)
+    return index, stats
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Resident ingestion service.
+
+Keeps llama_index, the embedding client and the embedding cache warm in one
+long-lived process and ingests uploads through a job queue, instead of the
+frontend spawning ``recreate_rag.py`` (cold imports plus a full rebuild) for
+every upload.
+
+Jobs run one at a time. A request that arrives while another job is still
+queued is folded into that job, so a burst of uploads results in a single
+ingestion run; a request that arrives while a job is running queues one more
+run, which picks up files that landed mid-run. Every successful job publishes a
+new index version (see index_versions), which running agents hot-swap to.
+
+HTTP API (127.0.0.1:8765 by default, or a Unix socket via INGEST_SERVICE_SOCKET):
+
+    POST /jobs            {"kind": "update" | "rebuild"}  -> 202, job (400 if
+                          the body is not such an object)
+    GET  /jobs            recent jobs, newest first
+    GET  /jobs/{id}       job state and progress
+    GET  /health          liveness and the published index version
+
+With WATCH_DATA_DIR=1 the service also watches the data directory (see
+data_watcher) and queues an update job for just the changed files.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+from data_watcher import watch_data_dir, watch_enabled
+from index_versions import current_version_dir, rebuild_version, update_version
+
+logger = logging.getLogger("ingestion_service")
+
+THIS_DIR = Path(__file__).parent
+DATA_DIR = THIS_DIR / "data"
+PERSIST_DIR = THIS_DIR / "query-engine-storage"
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+JOB_KINDS = ("update", "rebuild")
+
+# Finished jobs kept around for status queries
+JOB_HISTORY = 50
+
+
+@dataclass
+class IngestionJob:
+    """One queued or finished ingestion run and its progress."""
+
+    id: str
+    kind: str
+    state: str = "queued"  # queued, running, succeeded or failed
+    submitted_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # number of requests coalesced into this job
+    requests: int = 1
+    stage: Optional[str] = None
+    done: int = 0
+    total: int = 0
+    version: Optional[str] = None
+    stats: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    # data files to look at; None means the whole data directory
+    paths: Optional[List[str]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class IngestionService:
+    """Single-worker job queue that coalesces back-to-back ingestion requests."""
+
+    def __init__(self, persist_dir: Path = PERSIST_DIR, data_dir: Path = DATA_DIR):
+        self.persist_dir = Path(persist_dir)
+        self.data_dir = Path(data_dir)
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._pending: Optional[IngestionJob] = None
+        # created by run() so it belongs to the loop that serves the API
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def submit(
+        self, kind: str = "update", paths: Optional[Iterable[Path]] = None
+    ) -> IngestionJob:
+        """Queue an ingestion run, or fold the request into the one already queued."""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind {kind!r}, expected one of {JOB_KINDS}")
+        names = sorted({Path(p).name for p in paths}) if paths is not None else None
+        job = self._pending
+        if job is not None:
+            job.requests += 1
+            if kind == "rebuild":
+                # a rebuild covers everything an update would do
+                job.kind = "rebuild"
+            if names is None or job.paths is None:
+                job.paths = None
+            else:
+                job.paths = sorted(set(job.paths) | set(names))
+            logger.info(f"Coalesced {kind} request into queued job {job.id}")
+            return job
+
+        job = IngestionJob(
+            id=uuid.uuid4().hex[:12], kind=kind, submitted_at=time.time(), paths=names
+        )
+        self._pending = job
+        self.jobs[job.id] = job
+        while len(self.jobs) > JOB_HISTORY:
+            self.jobs.popitem(last=False)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        logger.info(f"Queued {kind} job {job.id}")
+        return job
+
+    async def run(self) -> None:
+        """Process queued jobs forever."""
+        self._wakeup = asyncio.Event()
+        if self._pending is not None:
+            self._wakeup.set()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.run_next()
+
+    async def run_next(self) -> Optional[IngestionJob]:
+        """Run the queued job, if any; requests arriving meanwhile queue a new one."""
+        job, self._pending = self._pending, None
+        if job is None:
+            return None
+        job.state = "running"
+        job.started_at = time.time()
+
+        def progress(stage: str, done: int, total: int) -> None:
+            job.stage, job.done, job.total = stage, done, total
+
+        try:
+            # ingestion is blocking (parsing, persisting); keep the API responsive
+            await asyncio.to_thread(self._execute, job, progress)
+            job.state = "succeeded"
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            job.state = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.stage = None
+        logger.info(
+            f"Job {job.id} ({job.kind}) {job.state} in "
+            f"{job.finished_at - job.started_at:.1f}s"
+        )
+        return job
+
+    def _execute(self, job: IngestionJob, progress) -> None:
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        if job.kind == "rebuild":
+            version_dir = rebuild_version(self.persist_dir, self.data_dir, progress)
+        else:
+            paths = (
+                [self.data_dir / name for name in job.paths]
+                if job.paths is not None
+                else None
+            )
+            version_dir, stats = update_version(
+                self.persist_dir, self.data_dir, progress, paths
+            )
+            job.stats = asdict(stats)
+        job.version = version_dir.name if version_dir is not None else None
+
+    def current_version(self) -> Optional[str]:
+        current = current_version_dir(self.persist_dir)
+        return current.name if current is not None else None
+
+
+def create_app(service: IngestionService, watch: bool = False) -> web.Application:
+    """aiohttp application exposing the service's job queue.
+
+    With ``watch`` the data directory is watched and changed files are queued.
+    """
+
+    async def submit_job(request: web.Request) -> web.Response:
+        try:
+            body = await request.json() if request.can_read_body else {}
+        except json.JSONDecodeError:
+            return web.json_response({"error": "Body is not valid JSON"}, status=400)
+        if not isinstance(body, dict):
+            return web.json_response({"error": "Body must be an object"}, status=400)
+        try:
+            job = service.submit(body.get("kind", "update"))
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        return web.json_response(job.to_dict(), status=202)
+
+    async def list_jobs(request: web.Request) -> web.Response:
+        return web.json_response(
+            [job.to_dict() for job in reversed(service.jobs.values())]
+        )
+
+    async def get_job(request: web.Request) -> web.Response:
+        job = service.jobs.get(request.match_info["job_id"])
+        if job is None:
+            return web.json_response({"error": "Unknown job"}, status=404)
+        return web.json_response(job.to_dict())
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response(
+            {"status": "healthy", "version": service.current_version()}
+        )
+
+    workers = []
+
+    async def queue_changes(paths: Set[Path]) -> None:
+        service.submit("update", paths)
+
+    async def start_worker(app: web.Application) -> None:
+        workers.append(asyncio.create_task(service.run()))
+        if watch:
+            workers.append(
+                asyncio.create_task(watch_data_dir(service.data_dir, queue_changes))
+            )
+
+    async def stop_worker(app: web.Application) -> None:
+        for task in workers:
+            task.cancel()
+
+    app = web.Application()
+    app.router.add_post("/jobs", submit_job)
+    app.router.add_get("/jobs", list_jobs)
+    app.router.add_get("/jobs/{job_id}", get_job)
+    app.router.add_get("/health", health)
+    app.on_startup.append(start_worker)
+    app.on_cleanup.append(stop_worker)
+    return app
+
+
+def configure_settings() -> None:
+    """Configure the same Gemini models and embedding cache as the agent."""
+    from llama_index.core import Settings
+    from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+    from llama_index.llms.google_genai import GoogleGenAI
+
+    from embedding_cache import CachedEmbedding
+
+    Settings.llm = GoogleGenAI(
+        model="models/gemini-1.5-flash",
+        api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=0.7,
+    )
+    Settings.embed_model = CachedEmbedding(
+        GoogleGenAIEmbedding(
+            model="models/text-embedding-004",
+            api_key=os.getenv("GOOGLE_API_KEY"),
+        )
+    )
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv(THIS_DIR.parent / ".env.local")
+    configure_settings()
+
+    service = IngestionService()
+    # catch up on anything uploaded while the service was down
+    service.submit("update")
+
+    app = create_app(service, watch=watch_enabled())
+    socket_path = os.getenv("INGEST_SERVICE_SOCKET")
+    if socket_path:
+        web.run_app(app, path=socket_path)
+    else:
+        web.run_app(
+            app,
+            host=os.getenv("INGEST_SERVICE_HOST", DEFAULT_HOST),
+            port=int(os.getenv("INGEST_SERVICE_PORT", DEFAULT_PORT)),
+        )
+
+
+if __name__ == "__main__":
+    main()
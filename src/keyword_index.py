@@ -0,0 +1,294 @@
+"""
+BM25 keyword index over the chunks of the vector store.
+
+Dense retrieval misses or under-ranks queries that hinge on an exact term (a
+medication, a hotline, an exercise name). The vector store therefore keeps an
+inverted index of every chunk it stores, row-aligned with its vectors, so
+deletions are shared through the store's tombstones and rows are compacted
+together.
+
+Postings loaded from disk are held as compressed sparse rows (per term: rows
+and term frequencies) in ``keywords.npz``; chunks added afterwards go into an
+in-memory delta until the store is persisted again. While a large batch is
+ingested, ``spill`` moves the delta to memory-mapped files next to the store,
+merging them as they accumulate so only a few are open at once.
+"""
+
+import math
+import os
+import re
+import uuid
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+KEYWORDS_FNAME = "keywords.npz"
+SPILL_PREFIX = "spill-"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"\w+")
+STOP_WORDS = frozenset(
+    "a an and are as at be but by can do for from has have how i if in is it its "
+    "me my of on or so that the their them they this to was we what when where "
+    "which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOP_WORDS]
+
+
+class _Postings:
+    """Compressed sparse rows: per term, the rows containing it and their tfs."""
+
+    def __init__(
+        self,
+        terms: Sequence[str],
+        indptr: np.ndarray,
+        rows: np.ndarray,
+        tfs: np.ndarray,
+        paths: Sequence[Path] = (),
+    ):
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        self.indptr = indptr
+        self.rows = rows
+        self.tfs = tfs
+        # files backing a spilled part
+        self.paths = list(paths)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def get(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return None
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        return self.rows[start:end], self.tfs[start:end]
+
+    @classmethod
+    def spill(
+        cls,
+        spill_dir: Path,
+        postings: Iterable[Tuple[str, np.ndarray, np.ndarray]],
+        size: int,
+    ) -> "_Postings":
+        """Write ``size`` postings, (term, rows, tfs) in term order, to spill_dir.
+
+        The files are memory-mapped by the returned part.
+        """
+        name = Path(spill_dir) / f"{SPILL_PREFIX}{uuid.uuid4().hex[:16]}.keywords"
+        paths = [Path(f"{name}-{key}.npy") for key in ("rows", "tfs", "indptr")]
+        rows = np.lib.format.open_memmap(
+            paths[0], mode="w+", dtype=np.int32, shape=(size,)
+        )
+        tfs = np.lib.format.open_memmap(
+            paths[1], mode="w+", dtype=np.uint16, shape=(size,)
+        )
+        terms, indptr = [], [0]
+        for term, term_rows, term_tfs in postings:
+            start, end = indptr[-1], indptr[-1] + len(term_rows)
+            rows[start:end] = term_rows
+            tfs[start:end] = term_tfs
+            terms.append(term)
+            indptr.append(end)
+        rows.flush()
+        tfs.flush()
+        del rows, tfs
+        np.save(paths[2], np.asarray(indptr, dtype=np.int64))
+        return cls(
+            terms,
+            np.load(paths[2]),
+            np.load(paths[0], mmap_mode="r"),
+            np.load(paths[1], mmap_mode="r"),
+            paths,
+        )
+
+    def remove(self) -> None:
+        for path in self.paths:
+            if path.exists():
+                path.unlink()
+
+
+class KeywordIndex:
+    """Inverted index with BM25 scoring over row numbers of the vector store."""
+
+    def __init__(self):
+        self.vocabulary: Dict[str, int] = {}
+        self.doc_len = np.zeros(0, dtype=np.int32)
+        # False when loaded from a store persisted before keywords were indexed
+        self.complete = True
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._rows = np.zeros(0, dtype=np.int32)
+        self._tfs = np.zeros(0, dtype=np.uint16)
+        self._delta: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        # delta postings moved to disk by spill, oldest first
+        self._spilled: List[_Postings] = []
+
+    def add(self, start_row: int, texts: Sequence[str]) -> None:
+        """Index the texts of rows start_row, start_row + 1, ..."""
+        lengths = np.zeros(len(texts), dtype=np.int32)
+        for offset, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[offset] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                self._delta[term].append((start_row + offset, min(tf, 65535)))
+        self.doc_len = np.concatenate([self.doc_len, lengths])
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        rows, tfs = [], []
+        term_id = self.vocabulary.get(term)
+        if term_id is not None:
+            start, end = self._indptr[term_id], self._indptr[term_id + 1]
+            rows.append(self._rows[start:end])
+            tfs.append(self._tfs[start:end])
+        for part in self._spilled:
+            found = part.get(term)
+            if found is not None:
+                rows.append(found[0])
+                tfs.append(found[1])
+        if term in self._delta:
+            delta = np.asarray(self._delta[term], dtype=np.int64)
+            rows.append(delta[:, 0])
+            tfs.append(delta[:, 1])
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        all_rows = np.concatenate(rows).astype(np.int64)
+        return all_rows, np.concatenate(tfs).astype(np.float32)
+
+    def scores(self, query: str, alive: np.ndarray) -> np.ndarray:
+        """BM25 score of every row for the query; dead rows score 0."""
+        scores = np.zeros(len(self.doc_len), dtype=np.float32)
+        n_live = int(alive.sum())
+        if not n_live:
+            return scores
+        avg_len = max(float(self.doc_len[alive].mean()), 1.0)
+        for term in set(tokenize(query)):
+            rows, tfs = self.postings(term)
+            keep = alive[rows]
+            rows, tfs = rows[keep], tfs[keep]
+            if not len(rows):
+                continue
+            idf = math.log(1 + (n_live - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[rows] / avg_len)
+            scores[rows] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+        return scores
+
+    def persist(self, persist_dir: Path, live_rows: np.ndarray) -> None:
+        """Write the postings of live_rows, renumbered to their position in it."""
+        new_row = np.full(len(self.doc_len), -1, dtype=np.int64)
+        new_row[live_rows] = np.arange(len(live_rows))
+        terms, indptr, rows, tfs = [], [0], [], []
+        terms_seen = set(self.vocabulary) | set(self._delta)
+        for part in self._spilled:
+            terms_seen.update(part.vocabulary)
+        for term in sorted(terms_seen):
+            old_rows, term_tfs = self.postings(term)
+            mapped = new_row[old_rows]
+            keep = mapped >= 0
+            if not keep.any():
+                continue
+            order = np.argsort(mapped[keep])
+            terms.append(term)
+            rows.append(mapped[keep][order])
+            tfs.append(term_tfs[keep][order])
+            indptr.append(indptr[-1] + int(keep.sum()))
+
+        tmp = persist_dir / (KEYWORDS_FNAME + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                # terms never contain a newline, see _TOKEN
+                vocabulary=np.frombuffer("\n".join(terms).encode("utf-8"), np.uint8),
+                indptr=np.asarray(indptr, dtype=np.int64),
+                rows=np.concatenate(rows).astype(np.int32) if rows else self._rows,
+                tfs=np.concatenate(tfs).astype(np.uint16) if tfs else self._tfs,
+                doc_len=self.doc_len[live_rows],
+            )
+        os.replace(tmp, persist_dir / KEYWORDS_FNAME)
+
+    def spill(self, spill_dir: Path) -> None:
+        """Move the in-memory delta to memory-mapped files in spill_dir.
+
+        Spilled parts are merged while the newest is at least half the size of
+        the one before, so there are only logarithmically many.
+        """
+        if not self._delta:
+            return
+        self._spilled.append(
+            _Postings.spill(
+                spill_dir,
+                (
+                    (term, *np.asarray(self._delta[term], dtype=np.int64).T)
+                    for term in sorted(self._delta)
+                ),
+                sum(len(postings) for postings in self._delta.values()),
+            )
+        )
+        self._delta = defaultdict(list)
+        while (
+            len(self._spilled) > 1
+            and len(self._spilled[-2]) <= 2 * len(self._spilled[-1])
+        ):
+            older, newer = self._spilled[-2:]
+            merged = _Postings.spill(
+                spill_dir, _merged(older, newer), len(older) + len(newer)
+            )
+            older.remove()
+            newer.remove()
+            self._spilled[-2:] = [merged]
+
+    def remove_spilled(self) -> None:
+        """Delete the spill files, once the index has been persisted."""
+        for part in self._spilled:
+            part.remove()
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: Path, n_rows: int) -> "KeywordIndex":
+        """Load the keyword index of a store with n_rows rows.
+
+        A store persisted without one gets an empty index marked incomplete.
+        """
+        index = cls()
+        path = Path(persist_dir) / KEYWORDS_FNAME
+        if not path.exists():
+            index.doc_len = np.zeros(n_rows, dtype=np.int32)
+            index.complete = False
+            return index
+        with np.load(path) as data:
+            vocabulary = data["vocabulary"].tobytes().decode("utf-8")
+            terms = vocabulary.split("\n") if vocabulary else []
+            index.vocabulary = {term: i for i, term in enumerate(terms)}
+            index._indptr = data["indptr"]
+            index._rows = data["rows"]
+            index._tfs = data["tfs"]
+            index.doc_len = data["doc_len"]
+        return index
+
+
+def _merged(
+    older: _Postings, newer: _Postings
+) -> Iterable[Tuple[str, np.ndarray, np.ndarray]]:
+    for term in sorted(set(older.vocabulary) | set(newer.vocabulary)):
+        found = [p for p in (older.get(term), newer.get(term)) if p is not None]
+        yield (
+            term,
+            np.concatenate([rows for rows, _ in found]),
+            np.concatenate([tfs for _, tfs in found]),
+        )
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]], k: int = 60
+) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists; each id scores the sum of 1 / (k + rank)."""
+    fused: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking, start=1):
+            fused[node_id] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
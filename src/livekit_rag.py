@@ -1,14 +1,14 @@
 from dotenv import load_dotenv
-from llama_index.core import (
-    SimpleDirectoryReader,
-    StorageContext,
-    VectorStoreIndex,
-    load_index_from_storage,
-    Settings,
-)
+from llama_index.core import Settings
+from llama_index.core.schema import QueryBundle
 from llama_index.llms.google_genai import GoogleGenAI
 from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+from embedding_cache import CachedEmbedding
 from pathlib import Path
+from index_registry import IndexHandle, registry
+from answer_stream import shared_answer_stream
+from retrieval import aretrieve
+from typing import AsyncIterator, Optional
 import logging
 import os
 
@@ -25,9 +25,12 @@ Settings.llm = GoogleGenAI(
     temperature=0.7,
 )
 
-Settings.embed_model = GoogleGenAIEmbedding(
-    model="models/text-embedding-004",
-    api_key=os.getenv("GOOGLE_API_KEY"),
+# Chunk embeddings are cached on disk so rebuilds only embed text never seen before
+Settings.embed_model = CachedEmbedding(
+    GoogleGenAIEmbedding(
+        model="models/text-embedding-004",
+        api_key=os.getenv("GOOGLE_API_KEY"),
+    )
 )
 
 # RAG with Livekit
@@ -35,7 +38,6 @@ Settings.embed_model = GoogleGenAIEmbedding(
 THIS_DIR = Path(__file__).parent
 PERSIST_DIR = THIS_DIR / "query-engine-storage"
 
-
 # check if data directory exists
 if not (THIS_DIR / "data").exists():
     logger.error("Data directory does not exist")
@@ -44,23 +46,46 @@ if not (THIS_DIR / "data").exists():
     (THIS_DIR / "data").mkdir(parents=True, exist_ok=True)
 
 
-if not PERSIST_DIR.exists():
-    # load the documents and create the index
-    documents = SimpleDirectoryReader(THIS_DIR / "data").load_data()
-    index = VectorStoreIndex.from_documents(documents)
-    # store it for later
-    index.storage_context.persist(persist_dir=PERSIST_DIR)
-else:
-    # load the existing index
-    storage_context = StorageContext.from_defaults(persist_dir=PERSIST_DIR)
-    index = load_index_from_storage(storage_context)
 
+def current_handle() -> IndexHandle:
+    """The shared index handle, loaded (or built) on first use.
+
+    Nothing is loaded at import: parse worker processes re-import the entry
+    module, and must neither open the index nor wait for the version lock.
+    llamaindex_rag and the EQ evaluator get the same instance from the registry.
+    """
+    # Hot-swap to new index versions published by recreate_rag without restarting
+    registry.watch(PERSIST_DIR, THIS_DIR / "data")
+    return registry.get(PERSIST_DIR, THIS_DIR / "data")
+
+
+async def livekit_rag(query: str) -> str:
+    """The knowledge-base answer to ``query``, once it is complete."""
+    return "".join([chunk async for chunk in livekit_rag_stream(query)])
+
+
+def livekit_rag_stream(
+    query: str, handle: Optional[IndexHandle] = None
+) -> AsyncIterator[str]:
+    """Yield the answer to ``query`` as the LLM generates it.
 
-async def livekit_rag(query: str):
-    logger.info(f"Querying info for {query}")
-    query_engine = index.as_query_engine(use_async=True)
-    res = await query_engine.aquery(query)
-    return str(res)
+    The same question asked in several sessions at once is answered once, and
+    every caller gets the whole stream.
+    """
+    handle = handle or current_handle()
+    return shared_answer_stream(handle, query)
 
 
+async def retrieved_passages(query: str, top_k: int = 3) -> str:
+    """The passages best matching ``query``, without LLM synthesis.
 
+    Keyword retrieval needs no embedding call, so this returns in milliseconds.
+    """
+    index = current_handle().index
+    nodes = await aretrieve(
+        index, QueryBundle(query), mode="bm25", similarity_top_k=top_k
+    )
+    if not nodes:
+        return "No matching passages were found in the knowledge base yet."
+    passages = "\n\n".join(f"- {n.node.get_content().strip()}" for n in nodes)
+    return f"Relevant passages from the knowledge base (not summarized):\n{passages}"
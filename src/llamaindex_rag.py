@@ -1,16 +1,20 @@
 from pathlib import Path
 from dotenv import load_dotenv
-from llama_index.core import (
-    SimpleDirectoryReader,
-    VectorStoreIndex,
-    StorageContext,
-    load_index_from_storage,
-    Settings,
-)
+from llama_index.core import Settings
 from llama_index.llms.google_genai import GoogleGenAI
 from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
-from llama_index.core.agent.workflow import FunctionAgent
-from utils import get_doc_tools
+from embedding_cache import CachedEmbedding
+from utils import get_routed_tools
+from file_catalog import FileCatalog
+from index_registry import registry
+from ingestion import IngestionManifest
+from doc_summaries import SummaryStore
+from agent_budget import (
+    PARALLEL_TOOLS_PROMPT,
+    BudgetedFunctionAgent,
+    format_trace,
+    run_traced,
+)
 import logging
 import os
 
@@ -27,9 +31,12 @@ Settings.llm = GoogleGenAI(
     temperature=0.7,
 )
 
-Settings.embed_model = GoogleGenAIEmbedding(
-    model="models/text-embedding-004",
-    api_key=os.getenv("GOOGLE_API_KEY"),
+# Chunk embeddings are cached on disk so rebuilds only embed text never seen before
+Settings.embed_model = CachedEmbedding(
+    GoogleGenAIEmbedding(
+        model="models/text-embedding-004",
+        api_key=os.getenv("GOOGLE_API_KEY"),
+    )
 )
 
 # Configuration
@@ -39,136 +46,72 @@ PERSIST_DIR = THIS_DIR / "query-engine-storage"
 
 
 def setup_persistent_index():
-    """Set up or load the persistent vector index."""
-    if not PERSIST_DIR.exists():
-        logger.info("Creating new vector index...")
-
-        # Check if data directory exists and has files
-        if not DATA_DIR.exists():
-            logger.warning(
-                f"Data directory {DATA_DIR} does not exist. Creating empty index."
-            )
-            # Create an empty index
-            index = VectorStoreIndex.from_documents([])
-            index.storage_context.persist(persist_dir=PERSIST_DIR)
-            logger.info(f"Empty index created and persisted to {PERSIST_DIR}")
-            return index
-
-        # Check if data directory is empty
-        data_files = list(DATA_DIR.iterdir())
-        if not data_files:
-            logger.warning(f"Data directory {DATA_DIR} is empty. Creating empty index.")
-            # Create an empty index
-            index = VectorStoreIndex.from_documents([])
-            index.storage_context.persist(persist_dir=PERSIST_DIR)
-            logger.info(f"Empty index created and persisted to {PERSIST_DIR}")
-            return index
-
-        # Load documents and create index
-        documents = SimpleDirectoryReader(DATA_DIR).load_data()
-        index = VectorStoreIndex.from_documents(documents)
-        # Persist for later use
-        index.storage_context.persist(persist_dir=PERSIST_DIR)
-        logger.info(f"Index created and persisted to {PERSIST_DIR}")
-    else:
-        logger.info("Loading existing vector index...")
-        # Load existing index
-        storage_context = StorageContext.from_defaults(persist_dir=PERSIST_DIR)
-        index = load_index_from_storage(storage_context)
-        logger.info("Index loaded successfully")
-
-    return index
-
-
-def create_file_specific_tools():
-    """Create vector and summary tools for each file."""
-    file_to_tools_dict = {}
-
+    """Get the shared persistent vector index, building it on first use."""
     if not DATA_DIR.exists():
-        logger.warning(f"Data directory {DATA_DIR} does not exist")
-        return {}, []
+        logger.warning(f"Data directory {DATA_DIR} does not exist. Creating it.")
 
-    # Check if data directory is empty
-    data_files = list(DATA_DIR.iterdir())
-    if not data_files:
-        logger.warning(
-            f"Data directory {DATA_DIR} is empty. No file-specific tools will be created."
-        )
-        return {}, []
-
-    for file in DATA_DIR.iterdir():
-        if file.is_file():  # Only process files, not directories
-            logger.info(f"Getting tools for file: {file}")
-            try:
-                vector_tool, summary_tool = get_doc_tools(file, file.stem)
-                file_to_tools_dict[file] = [vector_tool, summary_tool]
-            except Exception as e:
-                logger.error(f"Error creating tools for {file}: {e}")
-
-    # Flatten tools list
-    initial_tools = [
-        tool for tools_list in file_to_tools_dict.values() for tool in tools_list
-    ]
-
-    logger.info(
-        f"Created {len(initial_tools)} tools from {len(file_to_tools_dict)} files"
-    )
-    return file_to_tools_dict, initial_tools
+    # The registry loads query-engine-storage once per process and shares it
+    # with livekit_rag and the EQ evaluator; watch swaps in rebuilt versions
+    registry.watch(PERSIST_DIR, DATA_DIR)
+    return registry.get(PERSIST_DIR, DATA_DIR).index
 
 
-def create_index_query_tool(index):
-    """Create a query tool from the persistent index."""
-    from llama_index.core.tools import QueryEngineTool
+def create_document_tools(index, storage_dir):
+    """Create the catalog, retrieval and summary tools over every ingested file."""
+    # The manifest records which nodes of the global index belong to each file;
+    # it and the summaries are read from the version the index was loaded from
+    manifest = IngestionManifest.load(storage_dir) or IngestionManifest()
+    summaries = SummaryStore(storage_dir)
+    catalog = FileCatalog.build(index, manifest, summaries)
+    if not len(catalog):
+        logger.warning(f"No files from {DATA_DIR} have been ingested yet")
 
-    query_engine = index.as_query_engine()
+    tools = get_routed_tools(index, catalog, manifest, summaries)
+    logger.info(f"Created {len(tools)} tools over {len(catalog)} files")
+    return catalog, tools
 
-    # Create a tool that can query the entire index
-    index_tool = QueryEngineTool.from_defaults(
-        query_engine=query_engine,
-        name="query_all_documents",
-        description="Query across all documents in the knowledge base. Use this for broad questions that might span multiple documents.",
-    )
 
-    return index_tool
+# Combined agents are built once per index version and shared by every caller
+_combined_agents = {}
 
 
 def setup_combined_agent():
-    """Set up the agent with both persistent index and file-specific tools (FunctionAgent)."""
+    """Set up the agent over the persistent index and its file catalog (FunctionAgent)."""
 
     # Step 1: Set up persistent index
-    index = setup_persistent_index()
+    setup_persistent_index()
+    handle = registry.get(PERSIST_DIR, DATA_DIR)
+    index, version = handle.index, handle.version
+    if version in _combined_agents:
+        return _combined_agents[version]
 
-    # Step 2: Create file-specific tools
-    file_to_tools_dict, file_specific_tools = create_file_specific_tools()
-
-    # Step 3: Create index query tool
-    index_tool = create_index_query_tool(index)
-
-    # Step 4: Combine all tools
-    all_tools = [index_tool] + file_specific_tools
+    # Step 2-4: One set of tools whatever the number of files; files are named
+    # through the catalog instead of having tools of their own
+    catalog, all_tools = create_document_tools(index, handle.storage_dir)
 
     # Step 5: Initialize LLM (uses the global Settings configuration)
     llm = Settings.llm
 
     # Step 6: Create enhanced system prompt
     system_prompt = """
-    You are an intelligent document analysis agent with access to multiple types of tools:
+    You are an intelligent document analysis agent with access to these tools:
     
-    1. A comprehensive query tool that searches across ALL documents
-    2. File-specific vector search tools for targeted document queries
-    3. File-specific summary tools for document overviews
+    1. 'search_documents' searches the knowledge base, optionally within one file and its pages
+    2. 'list_documents' lists the files in the knowledge base, optionally matching keywords
+    3. 'summarize_document' summarizes one file or answers a question about its summary
     
     Strategy for tool usage:
-    - Use the 'query_all_documents' tool for broad questions spanning multiple documents
-    - Use file-specific vector tools when you need precise information from a particular document
-    - Use summary tools to get overviews of specific documents
+    - Use 'search_documents' without a file for broad questions spanning multiple documents
+    - Pass a file_name to 'search_documents' when you need precise information from a particular document
+    - Use 'list_documents' when you are not sure which file a question refers to
+    - Use 'summarize_document' to get overviews of specific documents
     - You can combine results from multiple tools to provide comprehensive answers
     
     Always cite which documents or sources your information comes from.
-    """
+    """ + PARALLEL_TOOLS_PROMPT
 
-    # Step 7: Create Workflow Agent
-    workflow = FunctionAgent(
+    # Step 7: Create Workflow Agent; tool calls of one step run concurrently
+    workflow = BudgetedFunctionAgent(
         tools=all_tools,
         llm=llm,
         system_prompt=system_prompt,
@@ -176,43 +119,27 @@ def setup_combined_agent():
 
     logger.info(f"FunctionAgent created with {len(all_tools)} total tools")
 
-    return workflow, index, file_to_tools_dict
+    _combined_agents.clear()
+    _combined_agents[version] = workflow, index, catalog
+    return workflow, index, catalog
 
 
 def update_index_with_new_documents():
     """Update the persistent index when new documents are added."""
-    # Load existing index
-    storage_context = StorageContext.from_defaults(persist_dir=PERSIST_DIR)
-    index = load_index_from_storage(storage_context)
-
-    # Check if data directory exists and has files
+    # Check if data directory exists
     if not DATA_DIR.exists():
         logger.warning(
             f"Data directory {DATA_DIR} does not exist. No documents to update."
         )
-        return index
-
-    # Check if data directory is empty
-    data_files = list(DATA_DIR.iterdir())
-    if not data_files:
-        logger.warning(f"Data directory {DATA_DIR} is empty. No documents to update.")
-        return index
-
-    # Load new documents
-    documents = SimpleDirectoryReader(DATA_DIR).load_data()
+        return setup_persistent_index()
 
-    # Add new documents to existing index
-    for doc in documents:
-        index.insert(doc)
-
-    # Persist updated index
-    index.storage_context.persist(persist_dir=PERSIST_DIR)
+    # Only embed new or changed files; nodes of changed or deleted files are
+    # replaced. They are searchable as soon as they are embedded; their
+    # summaries follow in a second version, so summary tools answer instantly
+    registry.update(PERSIST_DIR, DATA_DIR)
 
     logger.info("Index updated with new documents")
-    return index
-
-
-
+    return setup_persistent_index()
 
 
 # Main execution
@@ -224,11 +151,11 @@ if __name__ == "__main__":
 
     # Option 1: Use FunctionAgent (workflow-based, async)
     logger.info("=== Setting up FunctionAgent (Workflow) ===")
-    workflow_agent, index, file_tools = setup_combined_agent()
+    workflow_agent, index, catalog = setup_combined_agent()
 
     logger.info(f"Workflow Agent: {workflow_agent}")
     logger.info(f"Index: {index}")
-    logger.info(f"File Tools: {file_tools}")
+    logger.info(f"File Catalog:\n{catalog.describe()}")
 
     logger.info("\nAgent is ready! Available tools:")
     for tool in workflow_agent.tools:
@@ -238,10 +165,12 @@ if __name__ == "__main__":
     async def run_workflow_examples():
         try:
             logger.info("\n--- Testing Workflow Agent ---")
-            response = await workflow_agent.run(
-                "Compare longlora, selfrag and metagpt papers and bring out the key differences and similarities."
+            response, trace = await run_traced(
+                workflow_agent,
+                "Compare longlora, selfrag and metagpt papers and bring out the key differences and similarities.",
             )
             logger.info(f"Workflow Response: {response}")
+            print(format_trace(trace))
 
         except Exception as e:
             logger.info(f"Error during workflow execution: {e}")
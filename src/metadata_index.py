@@ -0,0 +1,212 @@
+"""
+Inverted index over chunk metadata, for filtered vector queries.
+
+Per-file tools filter on ``file_names`` and ``page_label``; scanning every row's
+metadata for that costs time proportional to the whole corpus. This index maps
+field -> value -> sorted row numbers of the vector store for the fields chunks
+are commonly filtered on (file, page, document type and dates), so a filter
+resolves to its matching rows directly and only those are scored.
+
+``file_names`` is a list (a chunk shared by several files lists them all, see
+ingestion) and is indexed per element, for ``CONTAINS`` and ``ANY`` filters.
+Chunks ingested before it existed only have ``file_name``, which stands in.
+
+Filters on other fields, or with operators the index cannot answer, are still
+applied by scanning, but only over the rows the indexed filters left.
+"""
+
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from llama_index.core.vector_stores.types import (
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
+
+METADATA_INDEX_FNAME = "metadata_index.npz"
+
+INDEXED_FIELDS = (
+    "file_name",
+    "file_names",
+    "page_label",
+    "file_type",
+    "creation_date",
+    "last_modified_date",
+)
+
+# list-valued fields, and the scalar field standing in where one is missing
+LIST_FIELDS = {"file_names": "file_name"}
+
+_RANGE_OPERATORS = {
+    FilterOperator.GT: lambda value, bound: value > bound,
+    FilterOperator.GTE: lambda value, bound: value >= bound,
+    FilterOperator.LT: lambda value, bound: value < bound,
+    FilterOperator.LTE: lambda value, bound: value <= bound,
+}
+
+_EMPTY = np.zeros(0, dtype=np.int64)
+
+
+def _indexable(value: Any) -> bool:
+    return isinstance(value, (str, int, float, bool))
+
+
+class MetadataIndex:
+    """field -> value -> rows, over the rows of the vector store."""
+
+    def __init__(self, fields: Sequence[str] = INDEXED_FIELDS):
+        self.fields = tuple(fields)
+        # fields with a value that cannot be a dict key (e.g. a list) on some row
+        self.unindexable: Set[str] = set()
+        self._postings: Dict[str, Dict[Any, List[int]]] = {
+            field: defaultdict(list) for field in self.fields
+        }
+
+    def add(self, start_row: int, metadata: Sequence[Dict[str, Any]]) -> None:
+        """Index the metadata of rows start_row, start_row + 1, ..."""
+        for offset, meta in enumerate(metadata):
+            for field in self.fields:
+                if field in LIST_FIELDS:
+                    self._add_list(field, start_row + offset, meta)
+                    continue
+                if field not in meta:
+                    continue
+                value = meta[field]
+                if _indexable(value):
+                    self._postings[field][value].append(start_row + offset)
+                else:
+                    self.unindexable.add(field)
+
+    def _add_list(self, field: str, row: int, meta: Dict[str, Any]) -> None:
+        values = meta.get(field)
+        if values is None:
+            fallback = meta.get(LIST_FIELDS[field])
+            values = [] if fallback is None else [fallback]
+        if not isinstance(values, list) or not all(map(_indexable, values)):
+            self.unindexable.add(field)
+            return
+        for value in dict.fromkeys(values):
+            self._postings[field][value].append(row)
+
+    def rows(self, field: str, value: Any) -> np.ndarray:
+        postings = self._postings[field]
+        if not _indexable(value) or value not in postings:
+            return _EMPTY
+        return np.asarray(postings[value], dtype=np.int64)
+
+    def _union(self, field: str, values: Sequence[Any]) -> np.ndarray:
+        parts = [self.rows(field, value) for value in values]
+        return np.unique(np.concatenate(parts)) if parts else _EMPTY
+
+    def _match(self, filter_: MetadataFilter) -> Optional[np.ndarray]:
+        """Rows matching one filter, or None if the index cannot answer it."""
+        field = filter_.key
+        if field not in self.fields or field in self.unindexable:
+            return None
+        if field in LIST_FIELDS:
+            if filter_.operator == FilterOperator.CONTAINS:
+                return self.rows(field, filter_.value)
+            if filter_.operator == FilterOperator.ANY and isinstance(
+                filter_.value, list
+            ):
+                return self._union(field, filter_.value)
+            return None
+        if filter_.operator == FilterOperator.EQ:
+            return self.rows(field, filter_.value)
+        if filter_.operator == FilterOperator.IN and isinstance(filter_.value, list):
+            return self._union(field, filter_.value)
+        compare = _RANGE_OPERATORS.get(filter_.operator)
+        if compare is None:
+            return None
+        try:
+            values = [v for v in self._postings[field] if compare(v, filter_.value)]
+        except TypeError:
+            # mixed types; leave it to the scan, which reports it
+            return None
+        return self._union(field, values)
+
+    def candidates(self, filters: MetadataFilters) -> Tuple[Optional[np.ndarray], bool]:
+        """Sorted rows that may match ``filters``, and whether they all do.
+
+        Returns (None, False) when the index cannot narrow the rows at all.
+        Rows are not checked against deletions.
+        """
+        matches = []
+        for filter_ in filters.filters:
+            if isinstance(filter_, MetadataFilter):
+                matches.append(self._match(filter_))
+            else:
+                matches.append(None)
+        resolved = [rows for rows in matches if rows is not None]
+        exact = len(resolved) == len(matches)
+        condition = filters.condition or FilterCondition.AND
+
+        if condition == FilterCondition.AND and resolved:
+            rows = resolved[0]
+            for other in resolved[1:]:
+                rows = np.intersect1d(rows, other, assume_unique=True)
+            return rows, exact
+        if condition == FilterCondition.OR and exact and resolved:
+            return np.unique(np.concatenate(resolved)), True
+        return None, False
+
+    def persist(self, persist_dir: Path, metadata: Sequence[Dict[str, Any]]) -> None:
+        """Write the index of ``metadata``: the persisted rows' metadata, in order."""
+        index = MetadataIndex(self.fields)
+        index.add(0, metadata)
+        arrays = {"fields": _encode(list(index.fields))}
+        arrays["unindexable"] = _encode(sorted(index.unindexable))
+        for field, postings in index._postings.items():
+            values = list(postings)
+            arrays[f"{field}.values"] = _encode(values)
+            arrays[f"{field}.indptr"] = np.cumsum(
+                [0] + [len(postings[value]) for value in values], dtype=np.int64
+            )
+            arrays[f"{field}.rows"] = np.asarray(
+                [row for value in values for row in postings[value]], dtype=np.int32
+            )
+        tmp = persist_dir / (METADATA_INDEX_FNAME + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, persist_dir / METADATA_INDEX_FNAME)
+
+    @classmethod
+    def from_persist_dir(
+        cls, persist_dir: Path, metadata: Sequence[Dict[str, Any]]
+    ) -> "MetadataIndex":
+        """Load the index persisted with ``metadata``, or build it from that."""
+        path = Path(persist_dir) / METADATA_INDEX_FNAME
+        if not path.exists():
+            index = cls()
+            index.add(0, metadata)
+            return index
+        with np.load(path) as data:
+            if tuple(_decode(data["fields"])) != INDEXED_FIELDS:
+                # persisted with other fields, e.g. before file_names existed
+                index = cls()
+                index.add(0, metadata)
+                return index
+            index = cls(_decode(data["fields"]))
+            index.unindexable = set(_decode(data["unindexable"]))
+            for field in index.fields:
+                indptr = data[f"{field}.indptr"]
+                rows = data[f"{field}.rows"].tolist()
+                postings = index._postings[field]
+                for i, value in enumerate(_decode(data[f"{field}.values"])):
+                    postings[value] = rows[indptr[i] : indptr[i + 1]]
+        return index
+
+
+def _encode(values: List[Any]) -> np.ndarray:
+    # JSON keeps str, int, float and bool values distinct
+    return np.frombuffer(json.dumps(values).encode("utf-8"), dtype=np.uint8)
+
+
+def _decode(array: np.ndarray) -> List[Any]:
+    return json.loads(array.tobytes().decode("utf-8"))
@@ -0,0 +1,208 @@
+"""
+Parallel parsing with an on-disk parse cache.
+
+Parsing PDFs/DOCX and sentence splitting are CPU-bound, so files that need
+parsing are fanned out to a process pool sized to the machine. Each worker
+streams its file's chunks (see document_loader) straight into a cache file, one
+serialized node per line followed by the file's cleaning stats, and ingestion
+then streams the nodes back from that file, so neither side holds a whole parsed
+file in memory.
+
+Cache files are keyed by the file's content hash, its path, the node parser
+configuration and the cleaning settings. Restarts and rebuilds therefore skip
+parsing unchanged files entirely and get back identical chunks (same node ids
+and text), which also keeps the embedding cache hitting.
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence, Tuple, Type
+
+from llama_index.core import Settings
+from llama_index.core.node_parser import NodeParser
+from llama_index.core.readers.file.base import default_file_metadata_func
+from llama_index.core.schema import BaseNode
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+import clean_document
+from clean_document import CleaningStats
+from document_loader import iter_nodes
+
+logger = logging.getLogger("parse_cache")
+
+THIS_DIR = Path(__file__).parent
+DEFAULT_CACHE_DIR = THIS_DIR / ".cache" / "parsed"
+
+PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", "0")) or os.cpu_count() or 1
+
+# Below this many bytes to parse, starting worker processes costs more than it saves
+POOL_MIN_BYTES = 256 * 1024
+
+_STATS_KEY = "__cleaning_stats__"
+
+# Bump when document_loader changes how files are turned into nodes
+LOADER_VERSION = "1"
+
+
+def _parser_config(node_parser: NodeParser) -> Dict:
+    # what a worker process needs to rebuild the parser; callables don't pickle
+    return {
+        key: value
+        for key, value in node_parser.to_dict().items()
+        if key not in ("id_func", "class_name", "callback_manager")
+    }
+
+
+def _cleaning_config() -> Dict:
+    # boilerplate is stripped before chunking, so it is baked into cached nodes;
+    # chunk deduplication runs on the nodes read back and is not part of it
+    return {
+        "enabled": clean_document.CLEANING_ENABLED,
+        "boilerplate_page_ratio": clean_document.BOILERPLATE_PAGE_RATIO,
+        "boilerplate_min_pages": clean_document.BOILERPLATE_MIN_PAGES,
+    }
+
+
+def parser_signature(node_parser: NodeParser) -> str:
+    """Identify the parser and cleaning settings a cache entry was produced with."""
+    config = json.dumps(
+        [
+            LOADER_VERSION,
+            type(node_parser).__name__,
+            _parser_config(node_parser),
+            _cleaning_config(),
+        ],
+        sort_keys=True,
+    )
+    return hashlib.sha256(config.encode("utf-8")).hexdigest()[:16]
+
+
+def _parse_into_cache(
+    path: str,
+    cache_file: str,
+    parser_cls: Optional[Type[NodeParser]] = None,
+    parser_config: Optional[Dict] = None,
+) -> int:
+    """Parse one file and write its nodes to cache_file; runs in a worker process."""
+    if parser_cls is not None:
+        Settings.node_parser = parser_cls(**parser_config)
+    tmp_file = cache_file + f".{os.getpid()}.tmp"
+    count = 0
+    stats = CleaningStats()
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        for node in iter_nodes(Path(path), stats):
+            f.write(json.dumps(doc_to_json(node)) + "\n")
+            count += 1
+        f.write(json.dumps({_STATS_KEY: asdict(stats)}) + "\n")
+    os.replace(tmp_file, cache_file)
+    return count
+
+
+class ParseCache:
+    """Content-addressed cache of parsed nodes, filled by a process pool."""
+
+    def __init__(
+        self,
+        cache_dir: Path = DEFAULT_CACHE_DIR,
+        workers: int = PARSE_WORKERS,
+        min_pool_bytes: int = POOL_MIN_BYTES,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.workers = max(1, workers)
+        self.min_pool_bytes = min_pool_bytes
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def cache_file(self, path: Path, content_hash: str, signature: str) -> Path:
+        key = hashlib.sha256(
+            f"{content_hash}\0{os.path.abspath(path)}\0{signature}".encode("utf-8")
+        ).hexdigest()
+        return self.cache_dir / key[:2] / f"{key}.jsonl"
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: workers must not inherit the parent's threads and locks.
+            # They re-import the entry module, so entry modules (agent.py,
+            # livekit_rag) must not load or build the index at import: the
+            # parent may be holding the version lock while it waits on them
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def parse(
+        self,
+        files: Sequence[Tuple[Path, str]],
+        stats: Optional[CleaningStats] = None,
+    ) -> Iterator[Tuple[Path, Iterator[BaseNode]]]:
+        """Yield (path, nodes) for each (path, content_hash), in order.
+
+        Files missing from the cache are all submitted to the pool up front;
+        each file's nodes are yielded as soon as that file is ready. What
+        cleaning removed from the files is added to ``stats``.
+        """
+        node_parser = Settings.node_parser
+        signature = parser_signature(node_parser)
+        targets = [(Path(p), self.cache_file(p, h, signature)) for p, h in files]
+        misses = [(p, c) for p, c in targets if not c.exists()]
+        logger.info(
+            f"Parsing {len(misses)} of {len(targets)} files "
+            f"({len(targets) - len(misses)} cached)"
+        )
+
+        futures: Dict[Path, Future] = {}
+        miss_bytes = sum(path.stat().st_size for path, _ in misses)
+        if len(misses) > 1 and self.workers > 1 and miss_bytes >= self.min_pool_bytes:
+            pool = self._pool()
+            parser_cls, parser_config = type(node_parser), _parser_config(node_parser)
+            for path, cache_file in misses:
+                cache_file.parent.mkdir(parents=True, exist_ok=True)
+                futures[path] = pool.submit(
+                    _parse_into_cache,
+                    str(path),
+                    str(cache_file),
+                    parser_cls,
+                    parser_config,
+                )
+
+        for path, cache_file in targets:
+            if path in futures:
+                futures[path].result()
+            elif not cache_file.exists():
+                cache_file.parent.mkdir(parents=True, exist_ok=True)
+                _parse_into_cache(str(path), str(cache_file))
+            yield path, self._load(path, cache_file, stats)
+
+    @staticmethod
+    def _load(
+        path: Path, cache_file: Path, stats: Optional[CleaningStats] = None
+    ) -> Iterator[BaseNode]:
+        # dates change when a file is touched without changing its content
+        file_metadata = default_file_metadata_func(str(path))
+        with open(cache_file, encoding="utf-8") as f:
+            for line in f:
+                data = json.loads(line)
+                if _STATS_KEY in data:
+                    if stats is not None:
+                        stats.merge(CleaningStats(**data[_STATS_KEY]))
+                    continue
+                node = json_to_doc(data)
+                for key, value in file_metadata.items():
+                    if key in node.metadata:
+                        node.metadata[key] = value
+                yield node
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+# Global instance to share across modules
+parse_cache = ParseCache()
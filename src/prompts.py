@@ -63,3 +63,18 @@ I believe in your strength and resilience, even when you might not feel it yours
 
 What's been on your mind lately? I'm here to listen and support you however you need.
 """
+
+RAG_FILLER_INSTRUCTIONS = """
+Tell the user in one short, warm sentence that you are looking this up for them. Do not answer the question yet.
+"""
+
+EMERGENCY_NUMBERS = """🚨 EMERGENCY SERVICES:
+- National Suicide Prevention Lifeline: 988
+- Crisis Text Line: Text HOME to 741741
+- Emergency Services: 911
+
+If you're in immediate danger, please call 911 or go to your nearest emergency room."""
+
+STILL_RUNNING_FALLBACK = """
+This task is taking longer than expected and is still running in the background. Tell the user you will share the results as soon as they are ready, and keep helping them in the meantime.
+"""
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+int8 scalar quantization of the stored embeddings.
+
+Each L2-normalised row is stored as int8 codes with one float32 scale
+(``row ~= scale * codes``), a quarter of the float32 size. Scoring is
+asymmetric: the float32 query is multiplied with the dequantized codes, block by
+block, so the full-precision matrix is never materialised.
+
+By default only the codes are stored. Rescoring is opt-in: with
+``VECTOR_RESCORE_FACTOR`` > 0 the float32 matrix is kept on disk as well and
+the ``factor * k`` best approximate candidates are re-scored exactly. That wins
+back most of the recall lost to quantization, but the index then takes 1.25x
+the float32 size instead of a quarter of it; only the re-scored rows of the
+float32 matrix are paged in, so the page cache still mostly holds codes.
+
+Run this module against a persisted index to report the recall@k lost by
+quantization, with and without rescoring:
+
+    python src/quantization.py [persist_dir] [k]
+"""
+
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+
+CODES_FNAME = "vectors.i8.npy"
+SCALES_FNAME = "vector_scales.f32.npy"
+
+# "none" or "int8"
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+# Approximate candidates re-scored exactly per result; 0 (the default) stores no
+# float32 matrix next to the codes
+RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "0"))
+# Factor reported by the recall check when rescoring is off
+_REPORT_RESCORE_FACTOR = 4
+
+# Rows dequantized per step while scoring
+_SCORE_ROWS = 16384
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Codes and per-row scales for a float32 matrix."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales[:, None]
+
+
+def int8_scores(codes: np.ndarray, scales: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """Approximate dot products of every row with a float32 query."""
+    out = np.empty(codes.shape[0], dtype=np.float32)
+    for start in range(0, codes.shape[0], _SCORE_ROWS):
+        block = codes[start : start + _SCORE_ROWS]
+        out[start : start + len(block)] = block.astype(np.float32) @ q
+    return out * scales
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def evaluate_recall(
+    vectors: np.ndarray,
+    k: int = 10,
+    n_queries: int = 200,
+    rescore_factor: int = _REPORT_RESCORE_FACTOR,
+    seed: int = 0,
+) -> Dict[str, float]:
+    """Recall@k of int8 search against exact float32 search over ``vectors``.
+
+    Queries are stored rows mixed with another random row, so they resemble
+    the corpus without being in it.
+    """
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    codes, scales = quantize_int8(vectors)
+    k = min(k, len(vectors))
+    pairs = rng.integers(0, len(vectors), size=(n_queries, 2))
+    queries = vectors[pairs[:, 0]] + 0.5 * vectors[pairs[:, 1]]
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    approx_hits = rescored_hits = 0
+    for q in queries:
+        expected = set(_top(vectors @ q, k))
+        approx = int8_scores(codes, scales, q)
+        approx_hits += len(expected & set(_top(approx, k)))
+        if rescore_factor > 0:
+            candidates = _top(approx, min(len(vectors), k * rescore_factor))
+            exact = vectors[candidates] @ q
+            rescored_hits += len(expected & set(candidates[_top(exact, k)]))
+
+    total = k * n_queries
+    return {
+        "vectors": float(len(vectors)),
+        "float32_bytes": float(vectors.nbytes),
+        "int8_bytes": float(codes.nbytes + scales.nbytes),
+        "recall_int8": approx_hits / total,
+        "recall_int8_rescored": rescored_hits / total if rescore_factor > 0 else 0.0,
+    }
+
+
+def main() -> None:
+    from vector_store import MemmapVectorStore
+
+    persist_dir = Path(__file__).parent / "query-engine-storage"
+    if len(sys.argv) > 1:
+        persist_dir = Path(sys.argv[1])
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    store = MemmapVectorStore.from_persist_dir(persist_dir)
+    if not store.node_count:
+        print(f"No vectors in {persist_dir}")
+        return
+    # the reference is the float32 matrix where kept, else what the store holds
+    vectors = store._gather(np.flatnonzero(store._alive), exact=True)
+    factor = RESCORE_FACTOR or _REPORT_RESCORE_FACTOR
+    report = evaluate_recall(vectors, k=k, rescore_factor=factor)
+
+    print(f"Vectors:            {int(report['vectors'])} x {vectors.shape[1]}")
+    print(f"float32 size:       {report['float32_bytes'] / 2**20:.1f} MB")
+    print(f"int8 size:          {report['int8_bytes'] / 2**20:.1f} MB")
+    print(f"recall@{k} int8:      {report['recall_int8']:.3f}")
+    print(
+        f"recall@{k} rescored:  {report['recall_int8_rescored']:.3f} "
+        f"(top {factor * k} candidates re-scored, float32 matrix kept too)"
+    )
+    if not RESCORE_FACTOR:
+        print(f"Rescoring is off; set VECTOR_RESCORE_FACTOR={factor} to enable it")
+
+
+if __name__ == "__main__":
+    main()
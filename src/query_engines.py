@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Shared query engines and retrievers.
+
+Building a query engine sets up a retriever, a response synthesizer and its
+prompt helper, which costs more than a keyword lookup or a cached answer. The
+cache here builds each engine or retriever once per index and per construction
+arguments (top-k, query mode, filters...) and hands the same object to every
+caller. Engines keep no per-query state, so concurrent sessions can share them.
+
+``index.as_retriever`` also pins the ids of every node in the index at
+construction and sends them with each query, so a reused retriever would never
+see nodes inserted later, and the vector store has to resolve the whole list on
+every query. Retrievers built here leave node ids unset: each memory-mapped
+vector store backs exactly one index, so it already holds exactly its nodes.
+
+Entries hold their index; the registry invalidates them when it publishes a
+new index object, and the least recently used entries are dropped beyond
+``QUERY_ENGINE_CACHE_SIZE``.
+
+Run this module for a benchmark of per-query overhead with and without reuse:
+
+    python src/query_engines.py
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from enum import Enum
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.bridge.pydantic import BaseModel
+from llama_index.core.indices.vector_store.retrievers import VectorIndexRetriever
+from llama_index.core.query_engine import RetrieverQueryEngine
+
+QUERY_ENGINE_CACHE_SIZE = int(os.getenv("QUERY_ENGINE_CACHE_SIZE", "128"))
+
+
+def _freeze(value: Any) -> Hashable:
+    """Hashable form of a construction argument, e.g. MetadataFilters."""
+    if isinstance(value, BaseModel):
+        return (type(value).__name__, value.model_dump_json())
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def build_retriever(index: VectorStoreIndex, **kwargs: Any) -> VectorIndexRetriever:
+    """Like ``index.as_retriever(**kwargs)``, without pinning the index's node ids."""
+    return VectorIndexRetriever(
+        index,
+        callback_manager=index._callback_manager,
+        object_map=index._object_map,
+        **kwargs,
+    )
+
+
+def build_query_engine(
+    index: VectorStoreIndex, **kwargs: Any
+) -> RetrieverQueryEngine:
+    """Like ``index.as_query_engine(**kwargs)``, over ``build_retriever``."""
+    return RetrieverQueryEngine.from_args(
+        build_retriever(index, **kwargs), llm=Settings.llm, **kwargs
+    )
+
+
+class QueryEngineCache:
+    """LRU cache of query engines and retrievers per index and arguments."""
+
+    def __init__(self, max_entries: int = QUERY_ENGINE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple, Tuple[VectorStoreIndex, Any]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def _get(
+        self,
+        kind: str,
+        index: VectorStoreIndex,
+        build: Callable[..., Any],
+        kwargs: Dict[str, Any],
+    ) -> Any:
+        # the entry holds the index, so its id cannot be reused while cached
+        key = (kind, id(index), _freeze(kwargs))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            built = build(index, **kwargs)
+            self._entries[key] = (index, built)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return built
+
+    def query_engine(self, index: VectorStoreIndex, **kwargs: Any) -> BaseQueryEngine:
+        """A shared ``build_query_engine(index, **kwargs)``."""
+        return self._get("query_engine", index, build_query_engine, kwargs)
+
+    def retriever(self, index: VectorStoreIndex, **kwargs: Any) -> BaseRetriever:
+        """A shared ``build_retriever(index, **kwargs)``."""
+        return self._get("retriever", index, build_retriever, kwargs)
+
+    def invalidate(self, index: VectorStoreIndex) -> None:
+        """Drop everything built for ``index``."""
+        with self._lock:
+            for key in [k for k, (i, _) in self._entries.items() if i is index]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Global instance to share across modules
+query_engines = QueryEngineCache()
+
+
+def main() -> None:
+    from llama_index.core.embeddings import MockEmbedding
+    from llama_index.core.llms import MockLLM
+    from llama_index.core.schema import TextNode
+    from llama_index.core.vector_stores import MetadataFilters
+
+    from vector_store import new_storage_context
+
+    Settings.embed_model = MockEmbedding(embed_dim=64)
+    Settings.llm = MockLLM(max_tokens=8)
+    nodes = [
+        TextNode(
+            text=f"chunk {i}",
+            metadata={"file_name": f"file{i % 20}.pdf", "page_label": str(i % 30)},
+        )
+        for i in range(2000)
+    ]
+    index = VectorStoreIndex(nodes, storage_context=new_storage_context())
+    filters = MetadataFilters.from_dicts(
+        [
+            {"key": "file_name", "value": "file3.pdf"},
+            {"key": "page_label", "value": ["2", "3"], "operator": "in"},
+        ]
+    )
+    kwargs = {"similarity_top_k": 2, "filters": filters}
+    runs = 200
+
+    def per_call(fn: Callable[[], Any]) -> float:
+        start = time.perf_counter()
+        for _ in range(runs):
+            fn()
+        return (time.perf_counter() - start) / runs * 1000
+
+    cache = QueryEngineCache()
+    print(f"Per-call overhead over {runs} calls (ms):")
+    build_fresh = per_call(lambda: index.as_query_engine(**kwargs))
+    build_cached = per_call(lambda: cache.query_engine(index, **kwargs))
+    print(f"  build engine   fresh {build_fresh:8.3f}   cached {build_cached:8.3f}")
+    query_fresh = per_call(lambda: index.as_query_engine(**kwargs).query("sleep"))
+    query_cached = per_call(lambda: cache.query_engine(index, **kwargs).query("sleep"))
+    print(f"  build + query  fresh {query_fresh:8.3f}   cached {query_cached:8.3f}")
+
+
+if __name__ == "__main__":
+    main()
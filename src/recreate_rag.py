@@ -1,19 +1,18 @@
 #!/usr/bin/env python3
 """
 Script to recreate RAG embeddings after file uploads.
-This script deletes the existing query-engine-storage and recreates it with new documents.
+This script rebuilds query-engine-storage from the data folder into a new version
+directory and atomically publishes it, so running agents keep serving the previous
+version until they have reloaded the new one.
 """
 
-import shutil
 from dotenv import load_dotenv
-from llama_index.core import (
-    SimpleDirectoryReader,
-    VectorStoreIndex,
-    Settings,
-)
+from llama_index.core import Settings
 from llama_index.llms.google_genai import GoogleGenAI
 from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+from embedding_cache import CachedEmbedding
 from pathlib import Path
+from index_versions import rebuild_version
 import logging
 import os
 
@@ -31,15 +30,19 @@ Settings.llm = GoogleGenAI(
     temperature=0.7,
 )
 
-Settings.embed_model = GoogleGenAIEmbedding(
-    model="models/text-embedding-004",
-    api_key=os.getenv("GOOGLE_API_KEY"),
+# Chunk embeddings are cached on disk so rebuilds only embed text never seen before
+Settings.embed_model = CachedEmbedding(
+    GoogleGenAIEmbedding(
+        model="models/text-embedding-004",
+        api_key=os.getenv("GOOGLE_API_KEY"),
+    )
 )
 
 
 def recreate_rag_embeddings():
     """
-    Delete existing query-engine-storage and recreate RAG embeddings from data folder.
+    Rebuild RAG embeddings from the data folder and publish them as the new
+    query-engine-storage version.
     """
     try:
         logger.info("=== RAG RECREATION FUNCTION CALLED ===")
@@ -64,31 +67,12 @@ def recreate_rag_embeddings():
         for file in data_files:
             logger.info(f"  - {file.name}")
 
-        # Delete existing query-engine-storage directory
-        if PERSIST_DIR.exists():
-            logger.info(f"Deleting existing storage at {PERSIST_DIR}")
-            shutil.rmtree(PERSIST_DIR)
-            logger.info("Existing storage deleted successfully")
-        else:
-            logger.info("No existing storage found, creating new one")
-
-        # Create storage directory if it doesn't exist
-        PERSIST_DIR.mkdir(exist_ok=True)
-        logger.info(f"Storage directory ready: {PERSIST_DIR}")
-
-        # load the documents and create the index
-        logger.info("Loading documents from data directory...")
-        documents = SimpleDirectoryReader(DATA_DIR).load_data()
-        logger.info(f"Loaded {len(documents)} documents")
-
-        logger.info("Creating vector index...")
-        index = VectorStoreIndex.from_documents(documents)
-        logger.info("Vector index created successfully")
-
-        # store it for later
-        logger.info("Persisting index to storage...")
-        index.storage_context.persist(persist_dir=PERSIST_DIR)
-        logger.info("Index persisted successfully")
+        # Build into a fresh version directory and atomically publish it; the
+        # current index keeps serving queries until then, and running agents pick
+        # up the new version through IndexRegistry.watch (or right away on SIGHUP)
+        logger.info("Creating vector index from data directory...")
+        version_dir = rebuild_version(PERSIST_DIR, DATA_DIR)
+        logger.info(f"Index persisted and published as {version_dir.name}")
 
         logger.info("=== RAG RECREATION COMPLETED SUCCESSFULLY ===")
         return True
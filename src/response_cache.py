@@ -0,0 +1,200 @@
+"""
+Cache of knowledge-base answers for repeated questions.
+
+Voice users ask the same few questions over and over ("breathing exercise for
+panic", "what is CBT"). ResponseCache keeps the synthesized answers keyed by
+the normalized question, the retrieval parameters and the revision of the index
+that answered it, so a repeat costs neither a query embedding nor an LLM call.
+
+Entries expire after ``RESPONSE_CACHE_TTL`` seconds and the least recently
+used ones are evicted beyond ``RESPONSE_CACHE_MB``. When a different index
+revision is seen, every entry of the previous one is dropped. With
+``RESPONSE_CACHE_PATH`` set, entries are also written through to a SQLite file
+and survive restarts.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("response_cache")
+
+RESPONSE_CACHE_MB = float(os.getenv("RESPONSE_CACHE_MB", "16"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "")
+
+# Bookkeeping counted against the byte budget for every entry
+ENTRY_OVERHEAD_BYTES = 256
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase words only, so casing, punctuation and spacing do not matter."""
+    return " ".join(_WORD.findall(query.lower()))
+
+
+def cache_key(query: str, revision: str, **params: Any) -> str:
+    payload = json.dumps(
+        [normalize_query(query), revision, sorted(params.items())], default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CachedResponse:
+    response: str
+    revision: str
+    created: float
+
+    @property
+    def size(self) -> int:
+        return len(self.response.encode("utf-8")) + ENTRY_OVERHEAD_BYTES
+
+
+class ResponseCache:
+    """Byte-bounded LRU of answers with a TTL, optionally persisted to SQLite."""
+
+    def __init__(
+        self,
+        max_bytes: int = int(RESPONSE_CACHE_MB * 1024 * 1024),
+        ttl: float = RESPONSE_CACHE_TTL,
+        path: Optional[Path] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._revision: Optional[str] = None
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self._open(Path(path))
+
+    def _open(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                revision TEXT NOT NULL,
+                created REAL NOT NULL,
+                response TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)
+        )
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT key, revision, created, response FROM responses ORDER BY created"
+        )
+        for key, revision, created, response in rows:
+            self._store(key, CachedResponse(response, revision, created))
+        logger.info(f"Loaded {len(self._entries)} cached responses from {path}")
+
+    def _store(self, key: str, entry: CachedResponse) -> None:
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous.size
+        self._entries[key] = entry
+        self.bytes += entry.size
+        while self.bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _switch_revision(self, revision: str) -> None:
+        """Drop every entry that was answered by another index revision."""
+        if revision == self._revision:
+            return
+        if self._revision is not None:
+            logger.info(f"Index revision is now {revision}, dropping cached answers")
+        self._revision = revision
+        for key in [k for k, e in self._entries.items() if e.revision != revision]:
+            self._remove(key)
+
+    def get(self, query: str, revision: str, **params: Any) -> Optional[str]:
+        """The cached answer for this question, parameters and index revision."""
+        key = cache_key(query, revision, **params)
+        with self._lock:
+            self._switch_revision(revision)
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry.created > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.response
+
+    def put(self, query: str, revision: str, response: str, **params: Any) -> None:
+        key = cache_key(query, revision, **params)
+        entry = CachedResponse(response, revision, time.time())
+        with self._lock:
+            self._switch_revision(revision)
+            if entry.size > self.max_bytes:
+                return
+            self._store(key, entry)
+            if self._conn is not None and key in self._entries:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses "
+                    "(key, revision, created, response) VALUES (?, ?, ?, ?)",
+                    (key, revision, entry.created, response),
+                )
+                self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+        }
+
+    def log_stats(self, level: int = logging.INFO) -> None:
+        stats = self.stats
+        logger.log(
+            level,
+            f"Response cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"(hit rate {stats['hit_rate']:.1%}), {stats['entries']} answers, "
+            f"{stats['bytes'] / 1024:.1f} KiB",
+        )
+
+
+# Global instance to share across modules
+response_cache = ResponseCache(
+    path=Path(RESPONSE_CACHE_PATH) if RESPONSE_CACHE_PATH else None
+)
@@ -0,0 +1,106 @@
+"""
+Retrieval mode selection for knowledge-base queries.
+
+``RAG_RETRIEVAL_MODE`` picks how chunks are retrieved from the index:
+
+- ``vector``: dense retrieval only
+- ``bm25``: keyword (BM25) retrieval only; no query embedding is computed
+- ``hybrid``: both, fused with reciprocal rank fusion (the default)
+
+Whatever the mode, if retrieval fails or the query embedding takes longer than
+``RAG_EMBED_TIMEOUT`` seconds, the query is answered from the keyword index
+instead, which needs no API call.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, List, Optional, Tuple
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import VectorStoreQueryMode
+
+from coalescing import query_embeddings
+from query_engines import query_engines
+
+logger = logging.getLogger("retrieval")
+
+RETRIEVAL_MODES = {
+    "vector": VectorStoreQueryMode.DEFAULT,
+    "bm25": VectorStoreQueryMode.TEXT_SEARCH,
+    "hybrid": VectorStoreQueryMode.HYBRID,
+}
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid").lower()
+EMBED_TIMEOUT = float(os.getenv("RAG_EMBED_TIMEOUT", "2"))
+
+
+def query_mode(mode: str = RETRIEVAL_MODE) -> VectorStoreQueryMode:
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(
+            f"Unknown retrieval mode {mode!r}, expected one of {list(RETRIEVAL_MODES)}"
+        )
+    return RETRIEVAL_MODES[mode]
+
+
+async def aembed_query(
+    index: VectorStoreIndex, query: str, timeout: float = EMBED_TIMEOUT
+) -> Optional[List[float]]:
+    """The query embedding from the index's model, or None if it is too slow.
+
+    Concurrent queries are embedded together in one batched call.
+    """
+    try:
+        return await asyncio.wait_for(
+            query_embeddings.embed(index._embed_model, query), timeout
+        )
+    except Exception as e:
+        logger.warning(f"Query embedding failed ({type(e).__name__}: {e})")
+        return None
+
+
+async def aretrieve_with_mode(
+    index: VectorStoreIndex,
+    query: QueryBundle,
+    mode: str = RETRIEVAL_MODE,
+    timeout: float = EMBED_TIMEOUT,
+    **retriever_kwargs: Any,
+) -> Tuple[List[NodeWithScore], str]:
+    """Retrieve nodes like ``aretrieve``, and the mode that actually answered.
+
+    The mode is "bm25" when retrieval in ``mode`` failed or was too slow.
+    """
+    retriever = query_engines.retriever(
+        index, vector_store_query_mode=query_mode(mode), **retriever_kwargs
+    )
+    if mode == "bm25":
+        return await retriever.aretrieve(query), mode
+    try:
+        return await asyncio.wait_for(retriever.aretrieve(query), timeout), mode
+    except Exception as e:
+        logger.warning(
+            f"{mode} retrieval failed ({type(e).__name__}: {e}), using keyword search"
+        )
+    keyword_retriever = query_engines.retriever(
+        index,
+        vector_store_query_mode=VectorStoreQueryMode.TEXT_SEARCH,
+        **retriever_kwargs,
+    )
+    return await keyword_retriever.aretrieve(query), "bm25"
+
+
+async def aretrieve(
+    index: VectorStoreIndex,
+    query: QueryBundle,
+    mode: str = RETRIEVAL_MODE,
+    timeout: float = EMBED_TIMEOUT,
+    **retriever_kwargs: Any,
+) -> List[NodeWithScore]:
+    """Retrieve nodes in the given mode, falling back to BM25 if that is too slow.
+
+    A query bundle that already carries its embedding is not embedded again.
+    """
+    nodes, _ = await aretrieve_with_mode(
+        index, query, mode=mode, timeout=timeout, **retriever_kwargs
+    )
+    return nodes
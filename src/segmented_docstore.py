@@ -0,0 +1,293 @@
+"""
+Append-only, segmented document store for the persisted index.
+
+llama_index's SimpleDocumentStore keeps every node in memory and persists them
+all as one ``docstore.json``, so each incremental update rewrote the text of the
+whole corpus. Here node JSON is appended to segment files (``nodes-*.jsonl``) as
+nodes are inserted, and ``docstore.json`` only records where each node is plus
+the small ref-doc and metadata collections.
+
+A segment is never modified once written. A new index version hard-links the
+segments of the previous one (see index_versions) and only writes the nodes it
+added; a segment is rewritten only once most of it belongs to deleted nodes.
+Nodes are read back from the segments on demand, so neither ingestion nor
+serving keeps the corpus text in memory.
+
+A ``docstore.json`` written by SimpleDocumentStore is loaded into memory and
+converted to segments the next time the store is persisted.
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.docstore.types import (
+    DEFAULT_PERSIST_FNAME,
+    DEFAULT_PERSIST_PATH,
+)
+from llama_index.core.storage.kvstore.types import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_COLLECTION,
+    BaseKVStore,
+)
+
+logger = logging.getLogger("segmented_docstore")
+
+SEGMENT_PREFIX = "nodes-"
+SEGMENT_SUFFIX = ".jsonl"
+
+# KVDocumentStore collection holding the node JSON, the only one kept in segments
+NODE_COLLECTION = "docstore/data"
+
+# A segment is rewritten once its live nodes take less than this share of it
+COMPACT_RATIO = 0.5
+# Above this many segments the smallest are merged, so updates don't add files forever
+MAX_SEGMENTS = 16
+
+# segment name, byte offset, byte length
+Location = Tuple[str, int, int]
+
+
+def link_or_copy(source: Path, target: Path) -> None:
+    """Hard-link source to target, copying when the filesystem can't link."""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+class SegmentedKVStore(BaseKVStore):
+    """Key-value store keeping the node collection in append-only segment files.
+
+    New nodes are appended to a segment in ``segment_dir``; without one (an index
+    that has never been persisted) they are kept in memory until ``persist``.
+    Every other collection is small and kept in memory.
+    """
+
+    def __init__(self, segment_dir: Optional[Path] = None):
+        self.segment_dir = Path(segment_dir) if segment_dir is not None else None
+        self._collections: Dict[str, Dict[str, dict]] = {}
+        self._locations: Dict[str, Location] = {}
+        self._paths: Dict[str, Path] = {}
+        self._files: Dict[str, BinaryIO] = {}
+        self._writer: Optional[BinaryIO] = None
+        self._writer_name: Optional[str] = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: Path) -> "SegmentedKVStore":
+        persist_dir = Path(persist_dir)
+        store = cls(persist_dir)
+        path = persist_dir / DEFAULT_PERSIST_FNAME
+        if not path.exists():
+            return store
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if "segments" not in data:
+            # written by SimpleDocumentStore: collection -> key -> value
+            store._collections = data
+            return store
+        names = data["segments"]
+        for name in names:
+            store._paths[name] = persist_dir / name
+            # Opened now, so serving survives the version being pruned
+            store._files[name] = open(persist_dir / name, "rb")
+        store._locations = {
+            key: (names[segment], offset, length)
+            for key, (segment, offset, length) in data["nodes"].items()
+        }
+        store._collections = data["collections"]
+        return store
+
+    def _append(self, data: bytes) -> Location:
+        if self._writer is None:
+            self.segment_dir.mkdir(parents=True, exist_ok=True)
+            name = f"{SEGMENT_PREFIX}{uuid.uuid4().hex[:16]}{SEGMENT_SUFFIX}"
+            self._paths[name] = self.segment_dir / name
+            self._writer = open(self._paths[name], "ab")
+            self._writer_name = name
+        offset = self._writer.tell()
+        self._writer.write(data)
+        return self._writer_name, offset, len(data)
+
+    def _close_writer(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._writer_name = None
+
+    def _read(self, location: Location) -> bytes:
+        name, offset, length = location
+        with self._lock:
+            if name == self._writer_name:
+                self._writer.flush()
+            f = self._files.get(name)
+            if f is None:
+                f = self._files[name] = open(self._paths[name], "rb")
+            f.seek(offset)
+            return f.read(length)
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        with self._lock:
+            if collection == NODE_COLLECTION and self.segment_dir is not None:
+                self._collections.get(collection, {}).pop(key, None)
+                data = (json.dumps(val) + "\n").encode("utf-8")
+                self._locations[key] = self._append(data)
+            else:
+                if collection == NODE_COLLECTION:
+                    self._locations.pop(key, None)
+                self._collections.setdefault(collection, {})[key] = val.copy()
+
+    async def aput(
+        self, key: str, val: dict, collection: str = DEFAULT_COLLECTION
+    ) -> None:
+        self.put(key, val, collection)
+
+    def put_all(
+        self,
+        kv_pairs: List[Tuple[str, dict]],
+        collection: str = DEFAULT_COLLECTION,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> None:
+        with self._lock:
+            for key, val in kv_pairs:
+                self.put(key, val, collection)
+
+    async def aput_all(
+        self,
+        kv_pairs: List[Tuple[str, dict]],
+        collection: str = DEFAULT_COLLECTION,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> None:
+        self.put_all(kv_pairs, collection, batch_size)
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        value = self._collections.get(collection, {}).get(key)
+        if value is not None:
+            return value.copy()
+        if collection != NODE_COLLECTION:
+            return None
+        location = self._locations.get(key)
+        if location is None:
+            return None
+        return json.loads(self._read(location))
+
+    async def aget(
+        self, key: str, collection: str = DEFAULT_COLLECTION
+    ) -> Optional[dict]:
+        return self.get(key, collection)
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        values = {
+            key: value.copy()
+            for key, value in self._collections.get(collection, {}).items()
+        }
+        if collection == NODE_COLLECTION:
+            for key, location in list(self._locations.items()):
+                values[key] = json.loads(self._read(location))
+        return values
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return self.get_all(collection)
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock:
+            deleted = self._collections.get(collection, {}).pop(key, None) is not None
+            if collection == NODE_COLLECTION:
+                deleted = self._locations.pop(key, None) is not None or deleted
+            return deleted
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection)
+
+    def persist(self, persist_path: str) -> None:
+        """Write the node index to persist_path, sharing segments with its directory.
+
+        Segments still needed are hard-linked into the directory of persist_path
+        (unless already there) and later inserts are appended to new segments in it.
+        """
+        persist_dir = Path(os.path.dirname(os.path.abspath(persist_path)))
+        persist_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._close_writer()
+            self.segment_dir = persist_dir
+            # nodes inserted before there was a segment directory, or loaded
+            # from a SimpleDocumentStore file
+            for key, val in self._collections.pop(NODE_COLLECTION, {}).items():
+                self._locations[key] = self._append(
+                    (json.dumps(val) + "\n").encode("utf-8")
+                )
+            self._compact()
+            self._close_writer()
+
+            names = sorted({name for name, _, _ in self._locations.values()})
+            for name in names:
+                target = persist_dir / name
+                if self._paths[name] != target:
+                    if not target.exists():
+                        link_or_copy(self._paths[name], target)
+                    self._paths[name] = target
+            segment_of = {name: i for i, name in enumerate(names)}
+            data = {
+                "segments": names,
+                "nodes": {
+                    key: [segment_of[name], offset, length]
+                    for key, (name, offset, length) in self._locations.items()
+                },
+                "collections": self._collections,
+            }
+            tmp_path = f"{persist_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, persist_path)
+
+    def _compact(self) -> None:
+        live: Dict[str, int] = {}
+        for name, _, length in self._locations.values():
+            live[name] = live.get(name, 0) + length
+        sparse = {
+            name
+            for name, size in live.items()
+            if name != self._writer_name
+            and size < COMPACT_RATIO * self._paths[name].stat().st_size
+        }
+        rest = sorted(
+            (name for name in live if name not in sparse and name != self._writer_name),
+            key=live.get,
+        )
+        # the segment being written counts as one more
+        excess = len(rest) + 1 - MAX_SEGMENTS
+        merge = sparse | set(rest[: max(excess, 0)])
+        if not merge:
+            return
+        logger.info(f"Compacting {len(merge)} of {len(live)} docstore segments")
+        for key, location in list(self._locations.items()):
+            if location[0] in merge:
+                self._locations[key] = self._append(self._read(location))
+        for name in merge:
+            f = self._files.pop(name, None)
+            if f is not None:
+                f.close()
+
+
+class SegmentedDocumentStore(KVDocumentStore):
+    """Document store whose nodes live in append-only segment files."""
+
+    def __init__(self, segment_dir: Optional[Path] = None, **kwargs: Any):
+        kvstore = kwargs.pop("kvstore", None) or SegmentedKVStore(segment_dir)
+        super().__init__(kvstore, **kwargs)
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: Path) -> "SegmentedDocumentStore":
+        return cls(kvstore=SegmentedKVStore.from_persist_dir(persist_dir))
+
+    def persist(
+        self, persist_path: str = DEFAULT_PERSIST_PATH, fs: Optional[Any] = None
+    ) -> None:
+        self._kvstore.persist(persist_path)
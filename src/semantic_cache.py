@@ -0,0 +1,207 @@
+"""
+Semantic cache of knowledge-base answers for paraphrased questions.
+
+"How do I calm down before an exam" and "tips to relax before a test" need the
+same answer, but the exact-match response cache sees two different questions.
+SemanticCache keeps the embeddings of questions already answered in a small
+in-memory matrix. A new question whose embedding has cosine similarity of at
+least ``SEMANTIC_CACHE_THRESHOLD`` with one of them gets that answer, which
+skips the LLM synthesis call. The question embedding is computed anyway for
+retrieval, so on a miss the lookup costs one matrix-vector product.
+
+Questions that match the crisis guard list are never answered from the cache,
+and their answers are never stored: those must always go through the model.
+Entries are scoped per caller (answers of the quick RAG tool and of the
+workflow agent differ), expire after ``SEMANTIC_CACHE_TTL`` seconds, and are
+all dropped when a different index revision is seen. Beyond
+``SEMANTIC_CACHE_SIZE`` questions the least recently used one is replaced;
+a size of 0 disables the cache.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger("semantic_cache")
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+
+# Crisis-related intents; any question mentioning one bypasses every cache
+CRISIS_PATTERNS = (
+    r"suicid\w*",
+    r"(kill|killing|killed) (my|him|her|them)sel(f|ves)",
+    r"(end|ending|ended|take|taking|took) (it all|my (own )?life)",
+    r"(want|wanted|wish|going|ready|deserve) to die",
+    r"(feel|feeling|felt) like dying",
+    r"better off dead",
+    r"(don'?t|do not) want to (live|be alive|be here|wake up)",
+    r"no (reason|point) (to|in) (live|living|going on)",
+    r"not worth (living|it anymore)",
+    r"self[- ]?harm\w*",
+    r"(hurt|hurting|harm|harming) (my|him|her|them)sel(f|ves)",
+    r"(cut|cutting|burn|burning|starve|starving) (my|him|her|them)sel(f|ves)",
+    r"overdos\w*",
+    r"crisis",
+    r"emergency",
+    r"988",
+    r"abus(e|ed|ing|ive)",
+    r"(rape|raped|assault|assaulted)",
+    r"(being|been|get|got) (hit|beaten)",
+)
+_CRISIS = re.compile(r"\b(" + "|".join(CRISIS_PATTERNS) + r")\b", re.IGNORECASE)
+
+
+def is_guarded(query: str) -> bool:
+    """Whether ``query`` touches a crisis intent and must not use a cache."""
+    return _CRISIS.search(query) is not None
+
+
+def _unit(embedding: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Answers of previous questions, looked up by embedding similarity."""
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_SIZE,
+        ttl: float = SEMANTIC_CACHE_TTL,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.guarded = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._created = np.zeros(max(max_entries, 0))
+        self._last_used = np.zeros(max(max_entries, 0), dtype=np.int64)
+        self._clock = 0
+        self._scopes: List[Optional[str]] = [None] * max(max_entries, 0)
+        self._questions: List[str] = [""] * max(max_entries, 0)
+        self._answers: List[str] = [""] * max(max_entries, 0)
+        self._count = 0
+        self._revision: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _switch_revision(self, revision: str) -> None:
+        if revision != self._revision:
+            self._revision = revision
+            self._count = 0
+
+    def _best(self, vector: np.ndarray, scope: str) -> Optional[int]:
+        if self._vectors is None or self._count == 0:
+            return None
+        if vector.shape[0] != self._vectors.shape[1]:
+            # the embedding model changed; nothing cached is comparable
+            self._count = 0
+            return None
+        n = self._count
+        scores = self._vectors[:n] @ vector
+        usable = np.array([s == scope for s in self._scopes[:n]])
+        usable &= time.time() - self._created[:n] <= self.ttl
+        scores[~usable] = -np.inf
+        row = int(np.argmax(scores))
+        return row if scores[row] >= self.threshold else None
+
+    def lookup(
+        self,
+        query: str,
+        embedding: Optional[Sequence[float]],
+        revision: str,
+        scope: str = "default",
+    ) -> Optional[str]:
+        """The answer to a similar question already answered in ``scope``."""
+        if not self.enabled or embedding is None:
+            return None
+        if is_guarded(query):
+            self.guarded += 1
+            return None
+        vector = _unit(embedding)
+        with self._lock:
+            self._switch_revision(revision)
+            row = self._best(vector, scope)
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._clock += 1
+            self._last_used[row] = self._clock
+            logger.info(f"{query!r} answered as {self._questions[row]!r} from cache")
+            return self._answers[row]
+
+    def add(
+        self,
+        query: str,
+        embedding: Optional[Sequence[float]],
+        revision: str,
+        answer: str,
+        scope: str = "default",
+    ) -> None:
+        """Remember ``answer`` for questions similar to ``query``."""
+        if not self.enabled or embedding is None or is_guarded(query):
+            return
+        vector = _unit(embedding)
+        with self._lock:
+            self._switch_revision(revision)
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._vectors = np.zeros(
+                    (self.max_entries, vector.shape[0]), dtype=np.float32
+                )
+                self._count = 0
+            row = self._best(vector, scope)
+            if row is None and self._count < self.max_entries:
+                row = self._count
+                self._count += 1
+            elif row is None:
+                row = int(np.argmin(self._last_used[: self._count]))
+            self._clock += 1
+            self._vectors[row] = vector
+            self._created[row] = time.time()
+            self._last_used[row] = self._clock
+            self._scopes[row] = scope
+            self._questions[row] = query
+            self._answers[row] = answer
+
+    def clear(self) -> None:
+        with self._lock:
+            self._count = 0
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "guarded": self.guarded,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self._count,
+        }
+
+    def log_stats(self, level: int = logging.INFO) -> None:
+        stats = self.stats
+        logger.log(
+            level,
+            f"Semantic cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"(hit rate {stats['hit_rate']:.1%}), {stats['guarded']} guarded, "
+            f"{stats['entries']} questions",
+        )
+
+
+# Global instance to share across modules
+semantic_cache = SemanticCache()
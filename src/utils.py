@@ -1,70 +1,126 @@
-# TODO: abstract all of this into a function that takes in a PDF file name
-
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, SummaryIndex
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core.tools import FunctionTool, QueryEngineTool
-from llama_index.core.vector_stores import MetadataFilters, FilterCondition
+import asyncio
+from llama_index.core import VectorStoreIndex
+from llama_index.core.tools import FunctionTool
+from llama_index.core.vector_stores import (
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
 from typing import List, Optional
 
+from doc_summaries import SummaryStore, answer_from_summaries
+from file_catalog import FileCatalog
+from ingestion import IngestionManifest
+from query_engines import query_engines
+
+
+def file_query_engine(
+    index: VectorStoreIndex,
+    file_name: Optional[str] = None,
+    page_numbers: Optional[List[str]] = None,
+):
+    """Shared query engine over one file's nodes and/or pages, or the whole index."""
+    if file_name is None and not page_numbers:
+        return query_engines.query_engine(index)
 
-def get_doc_tools(
-    file_path: str,
-    name: str,
-) -> str:
-    """Get vector query and summary query tools from a document."""
+    filters = []
+    if file_name is not None:
+        # a chunk shared by several files lists them all, see ingestion
+        filters.append(
+            MetadataFilter(
+                key="file_names", value=file_name, operator=FilterOperator.CONTAINS
+            )
+        )
+    if page_numbers:
+        filters.append(
+            MetadataFilter(
+                key="page_label", value=page_numbers, operator=FilterOperator.IN
+            )
+        )
 
-    # load documents
-    documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
-    splitter = SentenceSplitter(chunk_size=1024)
-    nodes = splitter.get_nodes_from_documents(documents)
-    vector_index = VectorStoreIndex(nodes)
+    return query_engines.query_engine(
+        index,
+        similarity_top_k=2,
+        filters=MetadataFilters(filters=filters),
+    )
 
-    def vector_query(query: str, page_numbers: Optional[List[str]] = None) -> str:
-        """Use to answer questions over a given paper.
 
-        Useful if you have specific questions over the paper.
-        Always leave page_numbers as None UNLESS there is a specific page you want to search for.
+def get_routed_tools(
+    index: VectorStoreIndex,
+    catalog: FileCatalog,
+    manifest: IngestionManifest,
+    summaries: SummaryStore,
+) -> List[FunctionTool]:
+    """Get the retrieval, catalog and summary tools over every document.
+
+    The tools take the file as an argument, so the agent gets the same three
+    tools however many files are ingested.
+    """
+
+    def _unknown(file_name: str) -> str:
+        return (
+            f"No document matches {file_name!r}. "
+            "Use list_documents to find the exact file name."
+        )
+
+    async def search_documents(
+        query: str,
+        file_name: Optional[str] = None,
+        page_numbers: Optional[List[str]] = None,
+    ) -> str:
+        """Search the knowledge base and answer from the most relevant passages.
 
         Args:
-            query (str): the string query to be embedded.
-            page_numbers (Optional[List[str]]): Filter by set of pages. Leave as NONE
-                if we want to perform a vector search
-                over all pages. Otherwise, filter by the set of specified pages.
+            query (str): the question to answer.
+            file_name (Optional[str]): restrict the search to this document, as
+                listed by list_documents. Leave as None to search all documents.
+            page_numbers (Optional[List[str]]): restrict the search to these pages
+                of file_name, or of every document if file_name is None. Leave as
+                None to search all pages.
 
         """
+        if file_name is None:
+            return await file_query_engine(index, None, page_numbers).aquery(query)
+        resolved = catalog.resolve(file_name)
+        if resolved is None:
+            return _unknown(file_name)
+        return await file_query_engine(index, resolved, page_numbers).aquery(query)
 
-        page_numbers = page_numbers or []
-        metadata_dicts = [{"key": "page_label", "value": p} for p in page_numbers]
+    def list_documents(keywords: Optional[str] = None) -> str:
+        """List the documents in the knowledge base with a short description.
 
-        query_engine = vector_index.as_query_engine(
-            similarity_top_k=2,
-            filters=MetadataFilters.from_dicts(
-                metadata_dicts, condition=FilterCondition.OR
-            ),
-        )
-        response = query_engine.query(query)
-        return response
+        Args:
+            keywords (Optional[str]): only list documents whose name or
+                description match these keywords. Leave as None to list all.
 
-    # Create a shorter, sanitized name for the tool
-    # Remove special characters and limit length to ensure it fits within 64 chars
-    sanitized_name = "".join(c for c in name if c.isalnum() or c in (" ", "-", "_"))[
-        :30
-    ]
-    sanitized_name = sanitized_name.replace(" ", "_").lower()
+        """
+        return catalog.describe(keywords)
 
-    vector_query_tool = FunctionTool.from_defaults(
-        name=f"vector_{sanitized_name}", fn=vector_query
-    )
+    async def summarize_document(file_name: str, question: Optional[str] = None) -> str:
+        """Summarize one document, or answer a follow-up question about its summary.
 
-    summary_index = SummaryIndex(nodes)
-    summary_query_engine = summary_index.as_query_engine(
-        response_mode="tree_summarize",
-        use_async=True,
-    )
-    summary_tool = QueryEngineTool.from_defaults(
-        name=f"summary_{sanitized_name}",
-        query_engine=summary_query_engine,
-        description=(f"Useful for summarization questions related to {name}"),
-    )
+        Args:
+            file_name (str): the document, as listed by list_documents.
+            question (Optional[str]): Leave as None for the overall summary.
+                Otherwise, a follow-up question about the document's content.
 
-    return vector_query_tool, summary_tool
+        """
+        resolved = catalog.resolve(file_name)
+        entry = manifest.entries.get(resolved) if resolved else None
+        if entry is None:
+            return _unknown(file_name)
+        summary = await asyncio.to_thread(
+            summaries.get_or_create,
+            resolved,
+            entry.content_hash,
+            index.docstore.get_nodes(list(entry.node_ids)),
+        )
+        if not question:
+            return summary.summary
+        return await answer_from_summaries(question, summary)
+
+    return [
+        FunctionTool.from_defaults(async_fn=search_documents),
+        FunctionTool.from_defaults(fn=list_documents),
+        FunctionTool.from_defaults(async_fn=summarize_document),
+    ]
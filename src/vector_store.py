@@ -0,0 +1,708 @@
+"""
+Memory-mapped NumPy vector store for the persisted knowledge-base index.
+
+Embeddings are persisted as one contiguous, L2-normalised float32 matrix
+(``vectors.f32.npy``) plus a small id table (``vector_ids.json``), and opened
+with ``np.load(mmap_mode="r")``. Workers therefore map the file instead of
+parsing a JSON list of floats, the OS page cache is shared between processes,
+and cosine top-k is a single matrix-vector product.
+
+Rows added after loading live in an in-memory delta segment and deletions are
+tombstoned; ``persist`` compacts both into a fresh matrix file. A store that will
+be persisted to a directory (an index being built or a staged version) spills
+its delta there, as memory-mapped files, every ``SPILL_BYTES``, so ingesting a
+large batch does not hold all its vectors and keyword postings in memory.
+
+Once the store holds ``ANN_MIN_VECTORS`` vectors, ``persist`` also trains an
+IVF index (see ann_index) and writes the rows grouped by list, so a query only
+scores, and only pages in, the lists closest to it. Smaller stores, and queries
+restricted by node ids or metadata filters, are answered by exact search.
+
+With ``VECTOR_QUANTIZATION=int8`` the persisted rows are stored as int8 codes
+(see quantization) and searched through those; the float32 matrix is only kept,
+to re-score the best candidates, when rescoring is enabled.
+
+Every chunk's text is also indexed for BM25 (see keyword_index), so besides the
+default vector mode the store answers ``TEXT_SEARCH`` queries (keywords only, no
+query embedding needed) and ``HYBRID`` queries (vector and BM25 rankings fused
+with reciprocal rank fusion).
+
+Metadata filters are resolved through an inverted index over file, page, type
+and date fields (see metadata_index), so filtered queries only touch the rows
+that match.
+"""
+
+import json
+import logging
+import os
+import threading
+import uuid
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core import StorageContext
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import (
+    build_metadata_filter_fn,
+    node_to_metadata_dict,
+)
+
+from ann_index import ANN_MIN_VECTORS, ANN_NPROBE, IVFIndex
+from keyword_index import (
+    KEYWORDS_FNAME,
+    SPILL_PREFIX,
+    KeywordIndex,
+    reciprocal_rank_fusion,
+)
+from metadata_index import MetadataIndex
+from quantization import (
+    CODES_FNAME,
+    RESCORE_FACTOR,
+    SCALES_FNAME,
+    VECTOR_QUANTIZATION,
+    dequantize_int8,
+    int8_scores,
+    quantize_int8,
+)
+from segmented_docstore import SegmentedDocumentStore
+
+logger = logging.getLogger("vector_store")
+
+VECTORS_FNAME = "vectors.f32.npy"
+IDS_FNAME = "vector_ids.json"
+LEGACY_VECTOR_STORE_FNAME = "default__vector_store.json"
+
+# Rows copied per step when compacting, so persisting never holds the whole
+# matrix in memory
+_COPY_ROWS = 8192
+
+# In-memory delta rows are spilled to the store's directory once they take this
+# much; only per-row ids and metadata then stay in memory until persist
+SPILL_BYTES = int(os.getenv("VECTOR_SPILL_MB", "16")) * 1024 * 1024
+
+# Candidates taken from each ranking before fusing a hybrid query, per result
+HYBRID_CANDIDATES_PER_RESULT = 4
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+@dataclass(frozen=True)
+class _Matrices:
+    """The arrays holding a store's rows at one point in time.
+
+    Appends add delta parts and persist swaps in new files, but never modify
+    these arrays, so queries score a snapshot without holding the store lock.
+    """
+
+    base: np.ndarray
+    codes: Optional[np.ndarray]
+    scales: Optional[np.ndarray]
+    delta: Tuple[np.ndarray, ...]
+    dim: int
+
+    @property
+    def base_rows(self) -> int:
+        return self.codes.shape[0] if self.codes is not None else self.base.shape[0]
+
+    def gather(self, rows: np.ndarray, exact: bool = False) -> np.ndarray:
+        """Vectors for the given row numbers; only their memmap pages are read.
+
+        Quantized rows are dequantized unless ``exact`` is set and the float32
+        matrix was kept.
+        """
+        n_base = self.base_rows
+        in_base = rows < n_base
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        if in_base.any():
+            base_rows = rows[in_base]
+            if self.codes is not None and not (exact and self.base.shape[0]):
+                out[in_base] = dequantize_int8(
+                    self.codes[base_rows], self.scales[base_rows]
+                )
+            else:
+                out[in_base] = self.base[base_rows]
+        start = n_base
+        for part in self.delta:
+            in_part = (rows >= start) & (rows < start + len(part))
+            if in_part.any():
+                out[in_part] = part[rows[in_part] - start]
+            start += len(part)
+        return out
+
+    def scores(self, q: np.ndarray) -> np.ndarray:
+        """Cosine scores of every row against a normalised query vector."""
+        parts = []
+        if self.codes is not None:
+            parts.append(int8_scores(self.codes, self.scales, q))
+        elif self.base.shape[0]:
+            parts.append(np.asarray(self.base @ q))
+        parts.extend(np.asarray(part @ q) for part in self.delta)
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+
+
+class MemmapVectorStore(BasePydanticVectorStore):
+    """Vector store backed by a memory-mapped float32 matrix."""
+
+    stores_text: bool = False
+    ann_min_vectors: int = ANN_MIN_VECTORS
+    ann_nprobe: int = ANN_NPROBE
+    quantization: str = VECTOR_QUANTIZATION
+    rescore_factor: int = RESCORE_FACTOR
+
+    _persist_dir: Optional[Path] = PrivateAttr(default=None)
+    _spill_dir: Optional[Path] = PrivateAttr(default=None)
+    _base: np.ndarray = PrivateAttr()
+    _codes: Optional[np.ndarray] = PrivateAttr(default=None)
+    _scales: Optional[np.ndarray] = PrivateAttr(default=None)
+    _delta: List[np.ndarray] = PrivateAttr(default_factory=list)
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: List[str] = PrivateAttr(default_factory=list)
+    _metadata: List[Dict[str, Any]] = PrivateAttr(default_factory=list)
+    _row_of: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _alive: np.ndarray = PrivateAttr()
+    _dirty: bool = PrivateAttr(default=False)
+    _ivf: Optional[IVFIndex] = PrivateAttr(default=None)
+    _keywords: KeywordIndex = PrivateAttr(default_factory=KeywordIndex)
+    _metadata_index: MetadataIndex = PrivateAttr(default_factory=MetadataIndex)
+    _lock: Any = PrivateAttr(default_factory=threading.RLock)
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._base = np.zeros((0, 0), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MemmapVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def n_base(self) -> int:
+        """Rows in the persisted segment."""
+        if self._codes is not None:
+            return self._codes.shape[0]
+        return self._base.shape[0]
+
+    @property
+    def dim(self) -> int:
+        if self._codes is not None and self._codes.shape[0]:
+            return self._codes.shape[1]
+        if self._base.shape[0]:
+            return self._base.shape[1]
+        return self._delta[0].shape[1] if self._delta else 0
+
+    @property
+    def node_count(self) -> int:
+        return int(self._alive.sum())
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: Path, **kwargs: Any) -> "MemmapVectorStore":
+        """Open the matrix in persist_dir without writing to it.
+
+        A legacy JSON store is read into memory; see migrate_vector_store.
+        """
+        persist_dir = Path(persist_dir)
+        store = cls(**kwargs)
+        store._persist_dir = store._spill_dir = persist_dir
+        ids_path = persist_dir / IDS_FNAME
+        legacy_path = persist_dir / LEGACY_VECTOR_STORE_FNAME
+
+        if ids_path.exists():
+            with open(ids_path, encoding="utf-8") as f:
+                table = json.load(f)
+            store._ids = table["ids"]
+            store._ref_doc_ids = table["ref_doc_ids"]
+            store._metadata = table["metadata"]
+            store._row_of = {node_id: row for row, node_id in enumerate(store._ids)}
+            store._alive = np.ones(len(store._ids), dtype=bool)
+            if (persist_dir / VECTORS_FNAME).exists() and store._ids:
+                store._base = np.load(persist_dir / VECTORS_FNAME, mmap_mode="r")
+            if (persist_dir / CODES_FNAME).exists() and store._ids:
+                store._codes = np.load(persist_dir / CODES_FNAME, mmap_mode="r")
+                store._scales = np.load(persist_dir / SCALES_FNAME)
+            store._metadata_index = MetadataIndex.from_persist_dir(
+                persist_dir, store._metadata
+            )
+            store._keywords = KeywordIndex.from_persist_dir(
+                persist_dir, len(store._ids)
+            )
+            if store._ids:
+                store._ivf = IVFIndex.from_persist_dir(
+                    persist_dir, table.get("ivf_trained_rows", len(store._ids))
+                )
+        elif legacy_path.exists():
+            logger.info(f"Reading legacy vector store {legacy_path}")
+            legacy = SimpleVectorStore.from_persist_path(str(legacy_path))
+            data = legacy.data
+            store._append(
+                list(data.embedding_dict),
+                [data.text_id_to_ref_doc_id.get(i, "None") for i in data.embedding_dict],
+                [(data.metadata_dict or {}).get(i, {}) for i in data.embedding_dict],
+                np.asarray(list(data.embedding_dict.values()), dtype=np.float32),
+            )
+            # the legacy store has no text; see index_keywords
+            store._keywords.complete = False
+        return store
+
+    def _append(
+        self,
+        ids: List[str],
+        ref_doc_ids: List[str],
+        metadata: List[Dict[str, Any]],
+        vectors: np.ndarray,
+        texts: Optional[List[str]] = None,
+    ) -> None:
+        if not ids:
+            return
+        with self._lock:
+            # Re-adding a node id replaces its previous row
+            for node_id in ids:
+                if node_id in self._row_of:
+                    self._alive[self._row_of[node_id]] = False
+            start = len(self._ids)
+            vectors = _normalize(vectors)
+            self._delta.append(vectors)
+            if self._ivf is not None:
+                self._ivf.extend(vectors)
+            self._keywords.add(start, texts or [""] * len(ids))
+            self._metadata_index.add(start, metadata)
+            self._ids.extend(ids)
+            self._ref_doc_ids.extend(ref_doc_ids)
+            self._metadata.extend(metadata)
+            for offset, node_id in enumerate(ids):
+                self._row_of[node_id] = start + offset
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            self._dirty = True
+            if self._spill_dir is not None and self._delta_bytes() >= SPILL_BYTES:
+                self._spill()
+
+    def _delta_bytes(self) -> int:
+        """Bytes of delta rows held in memory, i.e. not spilled yet."""
+        return sum(p.nbytes for p in self._delta if not isinstance(p, np.memmap))
+
+    def _spill(self) -> None:
+        """Move the in-memory delta rows and keywords to files in the spill dir."""
+        spilled = [part for part in self._delta if isinstance(part, np.memmap)]
+        in_memory = self._delta[len(spilled) :]
+        self._spill_dir.mkdir(parents=True, exist_ok=True)
+        name = f"{SPILL_PREFIX}{uuid.uuid4().hex[:16]}.vectors.npy"
+        path = self._spill_dir / name
+        np.save(path, np.vstack(in_memory))
+        self._delta = spilled + [np.load(path, mmap_mode="r")]
+        self._keywords.spill(self._spill_dir)
+
+    def _remove_spilled(self) -> None:
+        for part in self._delta:
+            if isinstance(part, np.memmap) and os.path.exists(part.filename):
+                os.unlink(part.filename)
+        self._keywords.remove_spilled()
+
+    def _matrices(self) -> "_Matrices":
+        with self._lock:
+            return _Matrices(
+                self._base, self._codes, self._scales, tuple(self._delta), self.dim
+            )
+
+    def _gather(self, rows: np.ndarray, exact: bool = False) -> np.ndarray:
+        return self._matrices().gather(rows, exact)
+
+    def get(self, text_id: str) -> List[float]:
+        return self._gather(np.array([self._row_of[text_id]]))[0].tolist()
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        metadata = []
+        for node in nodes:
+            meta = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
+            meta.pop("_node_content", None)
+            metadata.append(meta)
+        self._append(
+            [node.node_id for node in nodes],
+            [node.ref_doc_id or "None" for node in nodes],
+            metadata,
+            np.asarray([node.get_embedding() for node in nodes], dtype=np.float32),
+            [node.get_content(metadata_mode=MetadataMode.NONE) for node in nodes],
+        )
+        return [node.node_id for node in nodes]
+
+    def _kill_rows(self, rows: Sequence[int]) -> None:
+        with self._lock:
+            for row in rows:
+                if self._alive[row]:
+                    self._alive[row] = False
+                    self._row_of.pop(self._ids[row], None)
+                    self._dirty = True
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._kill_rows(
+            [row for row, ref in enumerate(self._ref_doc_ids) if ref == ref_doc_id]
+        )
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        with self._lock:
+            self._kill_rows(self._matching_rows(node_ids, filters).tolist())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._kill_rows(list(np.flatnonzero(self._alive)))
+
+    def _matching_rows(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+    ) -> np.ndarray:
+        """Live rows among node_ids (default: all) that match filters."""
+        rows = None
+        exact = True
+        if filters:
+            rows, exact = self._metadata_index.candidates(filters)
+        if node_ids is not None:
+            id_rows = np.unique(
+                np.asarray(
+                    [self._row_of[i] for i in node_ids if i in self._row_of],
+                    dtype=np.int64,
+                )
+            )
+            rows = id_rows if rows is None else np.intersect1d(rows, id_rows)
+        rows = np.flatnonzero(self._alive) if rows is None else rows[self._alive[rows]]
+        if filters and not exact:
+            # what the metadata index could not resolve is checked row by row
+            filter_fn = build_metadata_filter_fn(
+                lambda row: self._metadata[row], filters
+            )
+            rows = rows[np.fromiter((filter_fn(row) for row in rows), bool, len(rows))]
+        return rows
+
+    def _candidate_rows(self, query: VectorStoreQuery) -> Optional[np.ndarray]:
+        """Rows a query may return, or None when every live row is a candidate."""
+        if query.node_ids is None and not query.filters:
+            return None
+        return self._matching_rows(query.node_ids, query.filters)
+
+    def _probed_rows(
+        self, q: np.ndarray, top_k: int, nprobe: int
+    ) -> Optional[np.ndarray]:
+        """Live rows in the IVF lists nearest to q, or None to search exactly."""
+        if self._ivf is None or self.node_count < self.ann_min_vectors:
+            return None
+        rows = self._ivf.probe(q, nprobe)
+        rows = rows[self._alive[rows]]
+        # too few rows in the probed lists to fill top_k
+        return rows if len(rows) >= top_k else None
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Top-k rows by cosine similarity, BM25 score, or both fused.
+
+        Accepts ``nprobe`` to override the number of IVF lists probed and
+        ``exact=True`` to skip the IVF index, e.g. through a retriever's
+        ``vector_store_kwargs``. A hybrid query without an embedding is
+        answered from the keyword index alone.
+        """
+        if query.mode not in (
+            VectorStoreQueryMode.DEFAULT,
+            VectorStoreQueryMode.TEXT_SEARCH,
+            VectorStoreQueryMode.HYBRID,
+        ):
+            raise ValueError(f"Invalid query mode: {query.mode}")
+        if not self.node_count:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        if query.mode == VectorStoreQueryMode.TEXT_SEARCH or (
+            query.mode == VectorStoreQueryMode.HYBRID and query.query_embedding is None
+        ):
+            return self._text_query(query)
+        if query.query_embedding is None:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        if query.mode == VectorStoreQueryMode.HYBRID:
+            return self._hybrid_query(query, **kwargs)
+        return self._vector_query(query, **kwargs)
+
+    def _hybrid_query(
+        self, query: VectorStoreQuery, **kwargs: Any
+    ) -> VectorStoreQueryResult:
+        top_k = query.hybrid_top_k or query.similarity_top_k
+        candidates = top_k * HYBRID_CANDIDATES_PER_RESULT
+        dense = self._vector_query(
+            replace(query, similarity_top_k=candidates), **kwargs
+        )
+        sparse = self._text_query(
+            replace(query, similarity_top_k=query.sparse_top_k or candidates)
+        )
+        fused = reciprocal_rank_fusion([dense.ids, sparse.ids])[:top_k]
+        return VectorStoreQueryResult(
+            similarities=[score for _, score in fused],
+            ids=[node_id for node_id, _ in fused],
+        )
+
+    def _text_query(self, query: VectorStoreQuery) -> VectorStoreQueryResult:
+        if not query.query_str:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        if not self._keywords.complete:
+            logger.warning("Keyword index not built for this store; no BM25 results")
+        with self._lock:
+            ids = self._ids
+            scores = self._keywords.scores(query.query_str, self._alive)
+            rows = self._candidate_rows(query)
+            if rows is not None:
+                scores = scores[rows]
+            else:
+                rows = np.arange(len(scores))
+        k = min(query.similarity_top_k, int((scores > 0).sum()))
+        if k <= 0:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return VectorStoreQueryResult(
+            similarities=[float(scores[i]) for i in top],
+            ids=[ids[rows[i]] for i in top],
+        )
+
+    def _vector_query(
+        self, query: VectorStoreQuery, **kwargs: Any
+    ) -> VectorStoreQueryResult:
+        q = _normalize(np.asarray(query.query_embedding, dtype=np.float32))
+        # pick the rows under the lock, score them outside it so a long scan
+        # does not block inserts, deletes or other queries
+        with self._lock:
+            ids = self._ids
+            matrices = self._matrices()
+            rows = self._candidate_rows(query)
+            if rows is None and not kwargs.get("exact", False):
+                rows = self._probed_rows(
+                    q, query.similarity_top_k, kwargs.get("nprobe", self.ann_nprobe)
+                )
+            alive = self._alive.copy() if rows is None else None
+        if rows is None:
+            scores = matrices.scores(q)
+            scores[~alive] = -np.inf
+            rows = np.arange(len(scores))
+        else:
+            scores = matrices.gather(rows) @ q
+
+        k = min(query.similarity_top_k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        rescore = matrices.codes is not None and matrices.base.shape[0]
+        if rescore and self.rescore_factor:
+            # re-score the best approximate candidates against the float32 rows
+            n = min(k * self.rescore_factor, int(np.isfinite(scores).sum()))
+            top = np.argpartition(-scores, n - 1)[:n]
+            rows, scores = rows[top], matrices.gather(rows[top], exact=True) @ q
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return VectorStoreQueryResult(
+            similarities=[float(scores[i]) for i in top],
+            ids=[ids[rows[i]] for i in top],
+        )
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """Write the live rows to persist_path's directory and remap them.
+
+        StorageContext passes the default JSON vector store path; only its
+        directory is used. Nothing is rewritten if the store is unchanged since
+        it was loaded from that same directory.
+        """
+        persist_dir = Path(os.path.dirname(persist_path))
+        if not self._dirty and persist_dir == self._persist_dir:
+            return
+        persist_dir.mkdir(parents=True, exist_ok=True)
+
+        with self._lock:
+            live_rows = np.flatnonzero(self._alive)
+            self._update_ivf(live_rows)
+            if self._ivf is not None:
+                # rows of a list are stored contiguously, so a probe reads few pages
+                order = np.argsort(self._ivf.lists[live_rows], kind="stable")
+                live_rows = live_rows[order]
+            self._write_matrices(persist_dir, live_rows)
+
+            table = {
+                "dim": self.dim,
+                "ids": [self._ids[row] for row in live_rows],
+                "ref_doc_ids": [self._ref_doc_ids[row] for row in live_rows],
+                "metadata": [self._metadata[row] for row in live_rows],
+            }
+            self._metadata_index.persist(persist_dir, table["metadata"])
+            if self._keywords.complete:
+                self._keywords.persist(persist_dir, live_rows)
+            elif (persist_dir / KEYWORDS_FNAME).exists():
+                (persist_dir / KEYWORDS_FNAME).unlink()
+            if self._ivf is not None:
+                self._ivf.persist(persist_dir, live_rows)
+                table["ivf_trained_rows"] = self._ivf.trained_rows
+            else:
+                IVFIndex.remove(persist_dir)
+            ids_tmp = persist_dir / (IDS_FNAME + ".tmp")
+            with open(ids_tmp, "w", encoding="utf-8") as f:
+                json.dump(table, f)
+            os.replace(ids_tmp, persist_dir / IDS_FNAME)
+
+            # Drop a legacy JSON store so it is not mistaken for the live data
+            legacy_path = persist_dir / LEGACY_VECTOR_STORE_FNAME
+            if legacy_path.exists():
+                legacy_path.unlink()
+
+            reopened = MemmapVectorStore.from_persist_dir(persist_dir)
+            self._remove_spilled()
+            self._base = reopened._base
+            self._codes = reopened._codes
+            self._scales = reopened._scales
+            self._ivf = reopened._ivf
+            self._keywords = reopened._keywords
+            self._metadata_index = reopened._metadata_index
+            self._delta = []
+            self._ids = reopened._ids
+            self._ref_doc_ids = reopened._ref_doc_ids
+            self._metadata = reopened._metadata
+            self._row_of = reopened._row_of
+            self._alive = reopened._alive
+            self._persist_dir = self._spill_dir = persist_dir
+            self._dirty = False
+
+    def index_keywords(self, docstore: BaseDocumentStore) -> None:
+        """Build the keyword index from the docstore's text.
+
+        For stores persisted before keywords were indexed; the index is written
+        with the next persist.
+        """
+        with self._lock:
+            texts = []
+            for row, node_id in enumerate(self._ids):
+                node = None
+                if self._alive[row]:
+                    node = docstore.get_node(node_id, raise_error=False)
+                texts.append(node.get_content(MetadataMode.NONE) if node else "")
+            self._keywords = KeywordIndex()
+            self._keywords.add(0, texts)
+            self._dirty = True
+        logger.info(f"Indexed keywords of {self.node_count} stored chunks")
+
+    def _write_matrices(self, persist_dir: Path, live_rows: np.ndarray) -> None:
+        """Write the float32 matrix and/or the int8 codes of the given rows."""
+        quantized = self.quantization == "int8"
+        shape = (len(live_rows), self.dim)
+        outputs: Dict[str, np.ndarray] = {}
+        if len(live_rows) and (not quantized or self.rescore_factor > 0):
+            outputs[VECTORS_FNAME] = np.lib.format.open_memmap(
+                persist_dir / (VECTORS_FNAME + ".tmp"),
+                mode="w+",
+                dtype=np.float32,
+                shape=shape,
+            )
+        if len(live_rows) and quantized:
+            outputs[CODES_FNAME] = np.lib.format.open_memmap(
+                persist_dir / (CODES_FNAME + ".tmp"),
+                mode="w+",
+                dtype=np.int8,
+                shape=shape,
+            )
+            outputs[SCALES_FNAME] = np.empty(len(live_rows), dtype=np.float32)
+
+        for start in range(0, len(live_rows), _COPY_ROWS):
+            chunk = live_rows[start : start + _COPY_ROWS]
+            vectors = self._gather(chunk, exact=True)
+            end = start + len(chunk)
+            if VECTORS_FNAME in outputs:
+                outputs[VECTORS_FNAME][start:end] = vectors
+            if CODES_FNAME in outputs:
+                codes, scales = quantize_int8(vectors)
+                outputs[CODES_FNAME][start:end] = codes
+                outputs[SCALES_FNAME][start:end] = scales
+
+        for fname in (VECTORS_FNAME, CODES_FNAME, SCALES_FNAME):
+            path = persist_dir / fname
+            if fname not in outputs:
+                # left over from a store written in the other mode
+                if path.exists():
+                    path.unlink()
+                continue
+            array = outputs.pop(fname)
+            tmp = persist_dir / (fname + ".tmp")
+            if isinstance(array, np.memmap):
+                array.flush()
+            else:
+                with open(tmp, "wb") as f:
+                    np.save(f, array)
+            del array
+            os.replace(tmp, path)
+
+    def _update_ivf(self, live_rows: np.ndarray) -> None:
+        """Train the IVF index once the store is large enough, or has outgrown it."""
+        if len(live_rows) < self.ann_min_vectors:
+            self._ivf = None
+            return
+        if self._ivf is not None and not self._ivf.needs_retrain(len(live_rows)):
+            return
+        trained = IVFIndex.train(len(live_rows), lambda i: self._gather(live_rows[i]))
+        lists = np.zeros(len(self._ids), dtype=np.int32)
+        lists[live_rows] = trained.lists
+        self._ivf = IVFIndex(trained.centroids, lists, trained.trained_rows)
+
+
+def new_storage_context(persist_dir: Optional[Path] = None) -> StorageContext:
+    """Storage context for building a new index on the memory-mapped store.
+
+    Node text is written to docstore segments in persist_dir as it is inserted
+    (see segmented_docstore) and vectors are spilled there; without one both
+    are kept in memory until persisted.
+    """
+    vector_store = MemmapVectorStore()
+    vector_store._spill_dir = persist_dir
+    return StorageContext.from_defaults(
+        vector_store=vector_store, docstore=SegmentedDocumentStore(persist_dir)
+    )
+
+
+def load_storage_context(persist_dir: Path) -> StorageContext:
+    """Storage context for a persisted index, with its vectors memory-mapped."""
+    vector_store = MemmapVectorStore.from_persist_dir(persist_dir)
+    storage_context = StorageContext.from_defaults(
+        persist_dir=str(persist_dir),
+        vector_store=vector_store,
+        docstore=SegmentedDocumentStore.from_persist_dir(persist_dir),
+    )
+    if not vector_store._keywords.complete:
+        vector_store.index_keywords(storage_context.docstore)
+    return storage_context
+
+
+def migrate_vector_store(persist_dir: Path) -> bool:
+    """Convert a legacy JSON vector store in persist_dir to the memory-mapped one.
+
+    This rewrites persist_dir, so it is only run on a staged index version,
+    never on the one being served. Returns whether anything was converted.
+    """
+    persist_dir = Path(persist_dir)
+    legacy_path = persist_dir / LEGACY_VECTOR_STORE_FNAME
+    if (persist_dir / IDS_FNAME).exists() or not legacy_path.exists():
+        return False
+    logger.info(f"Converting {legacy_path} to a memory-mapped vector store")
+    storage_context = load_storage_context(persist_dir)
+    storage_context.vector_store.persist(str(legacy_path))
+    return True
@@ -0,0 +1,63 @@
+import os
+import sys
+from typing import List
+
+import pytest
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import MockLLM
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+
+class CountingEmbedding(MockEmbedding):
+    """Mock embedding model that records every document (not query) text."""
+
+    embedded: List[str] = []
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        self.embedded.append(text)
+        return super()._get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embedding(text)
+
+
+@pytest.fixture(autouse=True)
+def isolated_parse_cache(tmp_path, monkeypatch):
+    """Keep parsed-node cache files of test corpora out of src/.cache."""
+    from parse_cache import parse_cache
+
+    monkeypatch.setattr(parse_cache, "cache_dir", tmp_path / "parse-cache")
+
+
+@pytest.fixture
+def embed_model():
+    """Install a CountingEmbedding and a mock LLM as the global models."""
+    model = CountingEmbedding(embed_dim=8, embedded=[])
+    previous_embed, previous_llm = Settings._embed_model, Settings._llm
+    Settings.embed_model = model
+    Settings.llm = MockLLM()
+    yield model
+    Settings._embed_model, Settings._llm = previous_embed, previous_llm
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """A data directory with two short documents, and where to index it."""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "cbt.txt").write_text("Cognitive behavioural therapy basics.")
+    (data_dir / "breathing.txt").write_text("Box breathing: in four, hold four.")
+    return data_dir, tmp_path / "storage"
+
+
+@pytest.fixture
+def corpus_index(corpus, embed_model):
+    """The corpus built into an index, with the embedding count reset."""
+    from ingestion import build_index
+
+    data_dir, persist_dir = corpus
+    index = build_index(data_dir, persist_dir)
+    embed_model.embedded.clear()
+    return index, data_dir, persist_dir
@@ -1,13 +1,9 @@
 import pytest
-import sys
-import os
 from livekit.agents import AgentSession, llm
 from livekit.agents.voice.run_result import mock_tools
 from livekit.plugins import google
 from google.genai import types
 
-# Add src directory to path so we can import agent
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 from agent import Assistant
 
 
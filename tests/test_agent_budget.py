@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+from llama_index.core.llms import MockFunctionCallingLLM
+from llama_index.core.tools import FunctionTool
+
+from agent_budget import BudgetedFunctionAgent, run_traced
+
+
+def _document_tool(i: int, calls: list) -> FunctionTool:
+    async def lookup() -> str:
+        """Look up the document."""
+        calls.append(i)
+        await asyncio.sleep(0.2)
+        return f"document {i}"
+
+    return FunctionTool.from_defaults(async_fn=lookup, name=f"vector_doc{i}")
+
+
+async def test_tool_calls_of_one_step_run_concurrently_within_budget() -> None:
+    calls = []
+    # the mock LLM requests every tool in its first step, then answers
+    agent = BudgetedFunctionAgent(
+        tools=[_document_tool(i, calls) for i in range(6)],
+        llm=MockFunctionCallingLLM(),
+        max_tool_calls=5,
+    )
+
+    start = time.perf_counter()
+    answer, trace = await run_traced(agent, "compare the documents")
+    elapsed = time.perf_counter() - start
+
+    assert answer == "Tool calls complete."
+    assert len(calls) == 5
+    # one round of tool latency rather than five
+    assert elapsed < 0.6
+    results = [step.detail for step in trace if step.kind == "tool_result"]
+    assert sum(detail.endswith("(ok)") for detail in results) == 5
+    assert sum(detail.endswith("(error)") for detail in results) == 1
+    assert [step.kind for step in trace][0] == "llm_step"
+    assert trace[-1].detail == "answered"
+
+
+async def test_step_limit_answers_instead_of_failing() -> None:
+    calls = []
+    agent = BudgetedFunctionAgent(
+        tools=[_document_tool(0, calls)], llm=MockFunctionCallingLLM()
+    )
+
+    answer, _ = await run_traced(agent, "compare the documents", max_steps=1)
+
+    assert calls == []
+    assert "maximum number of iterations" in answer
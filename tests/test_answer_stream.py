@@ -0,0 +1,92 @@
+import asyncio
+import functools
+
+import pytest
+
+import answer_stream
+import retrieval
+from answer_stream import collect_answer, shared_answer_stream
+from coalescing import SingleFlight
+from index_registry import IndexRegistry
+from response_cache import ResponseCache
+from semantic_cache import SemanticCache
+
+
+pytestmark = pytest.mark.usefixtures("embed_model")
+
+
+@pytest.fixture
+def flight(monkeypatch):
+    flight = SingleFlight()
+    monkeypatch.setattr(answer_stream, "in_flight", flight)
+    monkeypatch.setattr(answer_stream, "response_cache", ResponseCache())
+    monkeypatch.setattr(answer_stream, "semantic_cache", SemanticCache())
+    return flight
+
+
+@pytest.fixture
+def handle(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "breathing.txt").write_text("Box breathing: in four, hold four.")
+    return IndexRegistry().get(tmp_path / "storage", data_dir)
+
+
+async def _join(chunks) -> str:
+    return "".join([chunk async for chunk in chunks])
+
+
+async def test_concurrent_identical_questions_share_one_stream(flight, handle) -> None:
+    answers = await asyncio.gather(
+        _join(shared_answer_stream(handle, "How does box breathing work?")),
+        _join(shared_answer_stream(handle, "how does box breathing work")),
+    )
+
+    assert answers[0] and answers[0] == answers[1]
+    assert (flight.started, flight.shared) == (1, 1)
+    mode = answer_stream.RETRIEVAL_MODE
+    cached = answer_stream.response_cache.get(
+        "how does box breathing work", handle.revision, mode=mode
+    )
+    assert cached == answers[0]
+
+
+async def test_crisis_questions_are_neither_shared_nor_cached(flight, handle) -> None:
+    query = "I keep thinking about ending my life"
+    streams = [shared_answer_stream(handle, query) for _ in range(2)]
+    await asyncio.gather(*(_join(stream) for stream in streams))
+
+    assert flight.started == 0
+    assert answer_stream.response_cache.stats["entries"] == 0
+
+
+async def test_filler_is_said_only_when_the_first_chunk_is_late() -> None:
+    async def chunks(first_delay: float):
+        await asyncio.sleep(first_delay)
+        yield "Breathe "
+        await asyncio.sleep(0.05)
+        yield "slowly."
+
+    fillers = []
+    answer = await collect_answer(chunks(0.0), lambda: fillers.append(1), delay=0.03)
+    assert answer == "Breathe slowly." and fillers == []
+
+    answer = await collect_answer(chunks(0.05), lambda: fillers.append(1), delay=0.01)
+    assert answer == "Breathe slowly." and fillers == [1]
+
+
+async def test_answers_from_fallback_retrieval_are_not_cached(
+    flight, handle, monkeypatch
+) -> None:
+    if answer_stream.RETRIEVAL_MODE == "bm25":
+        pytest.skip("keyword-only retrieval has no fallback")
+    # hybrid retrieval times out at once and falls back to keyword search
+    monkeypatch.setattr(
+        answer_stream,
+        "aretrieve_with_mode",
+        functools.partial(retrieval.aretrieve_with_mode, timeout=0),
+    )
+
+    assert await _join(shared_answer_stream(handle, "box breathing"))
+    assert answer_stream.response_cache.stats["entries"] == 0
+    assert answer_stream.semantic_cache.stats["entries"] == 0
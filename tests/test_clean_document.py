@@ -0,0 +1,116 @@
+import random
+
+import pytest
+from llama_index.core import Settings
+from llama_index.core.node_parser import SentenceSplitter
+
+from clean_document import BoilerplateFilter, ChunkDeduplicator, CleaningStats
+from ingestion import IngestionManifest, build_index, incremental_update
+from utils import file_query_engine
+
+
+pytestmark = pytest.mark.usefixtures("embed_model")
+
+
+def _handout(seed: int, words: int = 300) -> str:
+    vocabulary = "notice breathe thought feeling body calm name slowly write ground".split()
+    rng = random.Random(seed)
+    return " ".join(rng.choice(vocabulary) + str(rng.randint(0, 50)) for _ in range(words))
+
+
+def test_lines_repeated_across_pages_are_stripped() -> None:
+    pages = [
+        f"MindCure Handout   Page {n} of 4\nStep {n}: {_handout(n, 20)}\n"
+        "Not a substitute for professional care."
+        for n in range(1, 5)
+    ]
+    stats = CleaningStats()
+    boilerplate = BoilerplateFilter(pages)
+
+    cleaned = boilerplate.clean(pages[1], stats)
+
+    assert cleaned == f"Step 2: {_handout(2, 20)}"
+    assert stats.boilerplate_lines == 2
+    assert stats.boilerplate_tokens > 0
+
+
+def test_exact_and_near_duplicates_are_detected() -> None:
+    dedup = ChunkDeduplicator()
+    original = _handout(1)
+    edited = original.replace(original.split()[100], "changed", 1)
+    stats = CleaningStats()
+
+    assert dedup.check(original, stats) is None
+    assert dedup.check(_handout(2), stats) is None
+    assert dedup.check(original.upper(), stats) == 0
+    assert dedup.check(edited, stats) == 0
+    assert (stats.exact_duplicates, stats.near_duplicates) == (1, 1)
+
+
+def test_reuploaded_handout_shares_the_node_of_the_original(
+    tmp_path, embed_model
+) -> None:
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    original = _handout(1)
+    (data_dir / "handout.txt").write_text(original)
+    (data_dir / "handout_v2.txt").write_text(original.replace(" ", "  ", 3) + " thanks")
+    persist_dir = tmp_path / "storage"
+
+    index = build_index(data_dir, persist_dir)
+    manifest = IngestionManifest.load(persist_dir)
+    [node_id] = manifest.entries["handout.txt"].node_ids
+    assert manifest.entries["handout_v2.txt"].node_ids == [node_id]
+    assert len(embed_model.embedded) == 1
+    node = index.docstore.get_node(node_id)
+    assert node.metadata["file_names"] == ["handout.txt", "handout_v2.txt"]
+    # the copy is found by searches scoped to either file
+    for file_name in ("handout.txt", "handout_v2.txt"):
+        retriever = file_query_engine(index, file_name).retriever
+        assert [r.node.node_id for r in retriever.retrieve("breathe")] == [node_id]
+
+    (data_dir / "handout.txt").unlink()
+    stats = incremental_update(index, data_dir, persist_dir)
+
+    assert (stats.removed, stats.nodes_deleted) == (1, 0)
+    assert len(embed_model.embedded) == 1
+    node = index.docstore.get_node(node_id)
+    assert node.metadata["file_names"] == ["handout_v2.txt"]
+    assert node.metadata["file_name"] == "handout_v2.txt"
+    assert IngestionManifest.load(persist_dir).entries["handout_v2.txt"].node_ids == [
+        node_id
+    ]
+
+    (data_dir / "handout_v2.txt").unlink()
+    stats = incremental_update(index, data_dir, persist_dir)
+    assert stats.nodes_deleted == 1
+    assert index.docstore.get_node(node_id, raise_error=False) is None
+
+
+def test_changed_file_keeps_the_chunks_it_shares(tmp_path, monkeypatch) -> None:
+    splitter = SentenceSplitter(chunk_size=200, chunk_overlap=0)
+    monkeypatch.setattr(Settings, "_node_parser", splitter)
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    shared, unique = _handout(1, 60), _handout(2, 60)
+    (data_dir / "a.txt").write_text(f"{shared}.\n\n{_handout(3, 60)}.\n\n{shared}.")
+    (data_dir / "b.txt").write_text(f"{shared}.\n\n{unique}.")
+    persist_dir = tmp_path / "storage"
+
+    index = build_index(data_dir, persist_dir)
+    manifest = IngestionManifest.load(persist_dir)
+    a_ids, b_ids = (manifest.entries[f].node_ids for f in ("a.txt", "b.txt"))
+    assert len(a_ids) == 2 and len(b_ids) == 2
+    assert a_ids[0] == b_ids[0]
+    assert len(index.index_struct.nodes_dict) == 3
+
+    # a.txt no longer has the shared chunk; b.txt keeps it
+    (data_dir / "a.txt").write_text(f"{_handout(4, 60)}.")
+    stats = incremental_update(index, data_dir, persist_dir)
+
+    assert (stats.updated, stats.unchanged) == (1, 1)
+    assert IngestionManifest.load(persist_dir).entries["b.txt"].node_ids == b_ids
+    shared_node = index.docstore.get_node(b_ids[0])
+    assert shared_node.metadata["file_names"] == ["b.txt"]
+    retrieved = index.as_retriever(similarity_top_k=10).retrieve("breathe")
+    assert {r.node.node_id for r in retrieved} >= set(b_ids)
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from llama_index.core.embeddings import MockEmbedding
+
+from coalescing import QueryEmbeddingBatcher, SingleFlight
+
+
+class BatchCountingEmbedding(MockEmbedding):
+    async def _aembed_texts(self, texts, task_type=None):
+        self.__dict__.setdefault("batches", []).append((list(texts), task_type))
+        await asyncio.sleep(0.01)
+        return [[float(len(text))] * self.embed_dim for text in texts]
+
+
+async def test_identical_requests_share_one_call() -> None:
+    flight = SingleFlight()
+    calls = []
+
+    async def answer():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    waiting = asyncio.ensure_future(flight.do("q", answer))
+    await asyncio.sleep(0)
+    waiting.cancel()
+    results = await asyncio.gather(*(flight.do("q", answer) for _ in range(5)))
+
+    # the cancelled caller did not cancel the shared call
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert await flight.do("q", answer) == "answer"
+    assert (flight.started, flight.shared) == (2, 5)
+
+
+async def test_concurrent_query_embeddings_are_batched() -> None:
+    model = BatchCountingEmbedding(embed_dim=2)
+    batcher = QueryEmbeddingBatcher(window=0.005, max_batch=3)
+    queries = ["a", "bb", "a", "cccc"]
+
+    vectors = await asyncio.gather(*(batcher.embed(model, q) for q in queries))
+
+    assert vectors == [[1.0, 1.0], [2.0, 2.0], [1.0, 1.0], [4.0, 4.0]]
+    assert model.batches == [
+        (["a", "bb"], "RETRIEVAL_QUERY"),
+        (["cccc"], "RETRIEVAL_QUERY"),
+    ]
+
+    model.batches.clear()
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(batcher.embed(model, "slow"), 0.001)
+    assert await batcher.embed(model, "ok") == [2.0, 2.0]
+    # the query whose caller gave up is not sent
+    assert model.batches == [(["ok"], "RETRIEVAL_QUERY")]
+
+
+async def test_streams_are_shared_and_replayed_to_late_callers() -> None:
+    flight = SingleFlight()
+    produced = []
+
+    async def answer():
+        for word in ["Breathe ", "in ", "slowly."]:
+            produced.append(word)
+            await asyncio.sleep(0.01)
+            yield word
+
+    async def read(limit=None):
+        words = []
+        async for word in flight.stream("q", answer):
+            words.append(word)
+            if len(words) == limit:
+                break
+        return "".join(words)
+
+    first = asyncio.ensure_future(read())
+    await asyncio.sleep(0.015)
+    # joins after the first word and stops reading after one word
+    late, quitter = await asyncio.gather(read(), read(limit=1))
+
+    assert await first == late == "Breathe in slowly."
+    assert quitter == "Breathe "
+    assert len(produced) == 3
+    assert (flight.started, flight.shared) == (1, 2)
+
+
+async def test_stream_errors_reach_every_caller() -> None:
+    flight = SingleFlight()
+
+    async def failing():
+        yield "partial"
+        raise RuntimeError("LLM unavailable")
+
+    async def read():
+        return [word async for word in flight.stream("q", failing)]
+
+    results = await asyncio.gather(read(), read(), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+from pathlib import Path
+from typing import List, Set
+
+import pytest
+
+from data_watcher import watch_data_dir
+from index_versions import rebuild_version, update_version
+from ingestion import IngestionManifest
+
+
+pytestmark = pytest.mark.usefixtures("embed_model")
+
+
+async def test_polling_watcher_debounces_changes_and_deletions(tmp_path) -> None:
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "old.txt").write_text("to be deleted")
+    batches: List[Set[Path]] = []
+
+    async def on_change(paths: Set[Path]) -> None:
+        batches.append({p.name for p in paths})
+
+    task = asyncio.create_task(
+        watch_data_dir(
+            data_dir, on_change, debounce=0.3, poll_interval=0.05, use_watchfiles=False
+        )
+    )
+    await asyncio.sleep(0.1)
+    (data_dir / "a.txt").write_text("first upload")
+    await asyncio.sleep(0.1)
+    (data_dir / "b.txt").write_text("second upload")
+    (data_dir / "old.txt").unlink()
+    (data_dir / ".hidden").write_text("ignored")
+
+    for _ in range(40):
+        if batches:
+            break
+        await asyncio.sleep(0.05)
+    task.cancel()
+
+    assert batches == [{"a.txt", "b.txt", "old.txt"}]
+
+
+def test_only_changed_paths_are_ingested(tmp_path) -> None:
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "cbt.txt").write_text("Cognitive behavioural therapy basics.")
+    (data_dir / "old.txt").write_text("Outdated worksheet.")
+    persist_dir = tmp_path / "storage"
+    rebuild_version(persist_dir, data_dir)
+
+    (data_dir / "old.txt").unlink()
+    (data_dir / "new.txt").write_text("Grounding: name five things you can see.")
+    version_dir, stats = update_version(
+        persist_dir, data_dir, paths=[data_dir / "old.txt", data_dir / "new.txt"]
+    )
+
+    assert version_dir is not None
+    assert (stats.added, stats.removed, stats.unchanged) == (1, 1, 0)
+    manifest = IngestionManifest.load(persist_dir)
+    assert sorted(manifest.entries) == ["cbt.txt", "new.txt"]
+
+
+def test_auto_ingest_runs_one_watcher_per_process(tmp_path, monkeypatch) -> None:
+    import data_watcher
+
+    started = []
+    stop = threading.Event()
+
+    async def fake_watch(data_dir, on_change):
+        started.append(threading.current_thread())
+        await asyncio.to_thread(stop.wait)
+
+    monkeypatch.setattr(data_watcher, "watch_data_dir", fake_watch)
+    monkeypatch.setattr(data_watcher, "_auto_ingest_thread", None)
+
+    first = data_watcher.start_auto_ingest(tmp_path / "storage", tmp_path / "data")
+    # e.g. the next job of the same worker process, on another event loop
+    second = asyncio.run(
+        asyncio.to_thread(
+            data_watcher.start_auto_ingest, tmp_path / "storage", tmp_path / "data"
+        )
+    )
+    stop.set()
+    first.join(timeout=5)
+
+    assert second is first
+    assert started == [first]
+    assert not first.is_alive()
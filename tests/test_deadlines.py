@@ -0,0 +1,46 @@
+import asyncio
+
+from deadlines import ToolDeadlines, format_late_results
+
+
+async def _answer(text: str, delay: float) -> str:
+    await asyncio.sleep(delay)
+    return text
+
+
+async def test_slow_tool_answers_partially_and_delivers_later() -> None:
+    deadlines = ToolDeadlines()
+
+    async def passages():
+        return "passages"
+
+    fast = await deadlines.run("rag", _answer("full", 0), "unused", budget=0.05)
+    assert fast == "full"
+
+    partial = await deadlines.run("rag", _answer("full", 0.1), passages, budget=0.02)
+    assert partial == "passages"
+    assert deadlines.take_late_results() == []
+
+    await asyncio.sleep(0.15)
+    result = await deadlines.run("other", _answer("now", 0), "unused", budget=0.05)
+    assert result == format_late_results([("rag", "full")]) + "\n\nnow"
+    assert deadlines.take_late_results() == []
+    assert deadlines.timeouts == 1
+
+
+async def test_tools_in_one_turn_share_its_deadline() -> None:
+    deadlines = ToolDeadlines(turn_deadline=0.1)
+
+    first = await deadlines.run(
+        "a", _answer("a", 0.06), "late", turn="turn-1", budget=1.0
+    )
+    second = await deadlines.run(
+        "b", _answer("b", 0.06), "late", turn="turn-1", budget=1.0
+    )
+    other_turn = await deadlines.run(
+        "c", _answer("c", 0.06), "late", turn="turn-2", budget=1.0
+    )
+
+    assert (first, second) == ("a", "late")
+    # "b" finished while "c" ran, in a turn of its own
+    assert other_turn == format_late_results([("b", "b")]) + "\n\nc"
@@ -0,0 +1,79 @@
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import TextNode
+
+from doc_summaries import SummaryStore, refresh_summaries
+from file_catalog import FileCatalog
+from ingestion import IngestionManifest
+from utils import file_query_engine, get_routed_tools
+
+
+def routed_tools(index, persist_dir):
+    manifest = IngestionManifest.load(persist_dir)
+    summaries = SummaryStore(persist_dir)
+    catalog = FileCatalog.build(index, manifest, summaries)
+    search, _, summarize = get_routed_tools(index, catalog, manifest, summaries)
+    return search, summarize
+
+
+async def test_file_searches_are_filtered_views_without_embedding(
+    corpus_index, embed_model
+) -> None:
+    index, _, persist_dir = corpus_index
+    search, _ = routed_tools(index, persist_dir)
+
+    output = await search.acall(query="what is cbt?", file_name="cbt.txt")
+    response = output.raw_output
+
+    assert embed_model.embedded == []
+    assert [n.node.metadata["file_name"] for n in response.source_nodes] == ["cbt.txt"]
+
+
+async def test_summaries_are_generated_once_and_invalidated_by_hash(
+    corpus_index, monkeypatch
+) -> None:
+    index, _, persist_dir = corpus_index
+    assert refresh_summaries(index, persist_dir) == 2
+    assert refresh_summaries(index, persist_dir) == 0
+
+    entry = IngestionManifest.load(persist_dir).entries["cbt.txt"]
+    store = SummaryStore(persist_dir)
+    cached = store.get("cbt.txt", entry.content_hash)
+    assert cached is not None
+    assert store.get("cbt.txt", "stale-hash") is None
+
+    # The summary tool answers from the persisted summary without calling the LLM
+    def fail(*args, **kwargs):
+        raise AssertionError("summary tool must not summarize at query time")
+
+    monkeypatch.setattr("doc_summaries.summarize_document", fail)
+    _, summarize = routed_tools(index, persist_dir)
+    output = await summarize.acall(file_name="cbt.txt")
+    assert output.content == cached.summary
+
+
+async def test_query_time_summaries_are_not_written_to_the_index(corpus_index) -> None:
+    index, _, persist_dir = corpus_index
+    _, summarize = routed_tools(index, persist_dir)
+
+    first = await summarize.acall(file_name="cbt.txt")
+    again = await summarize.acall(file_name="cbt.txt")
+
+    assert first.content == again.content
+    assert not (persist_dir / "doc_summaries.json").exists()
+
+
+def test_page_numbers_without_a_file_filter_every_document(embed_model) -> None:
+    nodes = [
+        TextNode(
+            text=f"{file_name} page {page}",
+            metadata={"file_name": file_name, "page_label": page},
+        )
+        for file_name in ("a.pdf", "b.pdf")
+        for page in ("1", "2")
+    ]
+    index = VectorStoreIndex(nodes)
+
+    retriever = file_query_engine(index, None, ["2"]).retriever
+    retrieved = retriever.retrieve("page")
+
+    assert sorted(r.node.text for r in retrieved) == ["a.pdf page 2", "b.pdf page 2"]
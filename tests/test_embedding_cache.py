@@ -0,0 +1,48 @@
+from typing import List
+
+from llama_index.core.embeddings import MockEmbedding
+
+from embedding_cache import CachedEmbedding
+
+
+class LengthEmbedding(MockEmbedding):
+    """Mock embedding model that records every text and embeds it as its length."""
+
+    embedded: List[str] = []
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        self.embedded.append(text)
+        return [float(len(text))] * self.embed_dim
+
+
+def test_restart_only_embeds_unseen_text(tmp_path) -> None:
+    cache_path = tmp_path / "embeddings.sqlite3"
+    first = LengthEmbedding(embed_dim=4, model_name="m", embedded=[])
+    vectors = CachedEmbedding(first, cache_path=cache_path).get_text_embedding_batch(
+        ["calm", "breathe", "calm"]
+    )
+    assert first.embedded == ["calm", "breathe"]
+    assert vectors[0] == vectors[2] == [4.0] * 4
+
+    # A new process (fresh wrapper, same file) only pays for the new chunk
+    second = LengthEmbedding(embed_dim=4, model_name="m", embedded=[])
+    cached = CachedEmbedding(second, cache_path=cache_path)
+    assert cached.get_text_embedding_batch(["breathe", "ground"]) == [
+        [7.0] * 4,
+        [6.0] * 4,
+    ]
+    assert second.embedded == ["ground"]
+    assert cached.stats["hits"] == 1
+    assert cached.stats["entries"] == 3
+    assert cached.stats["bytes"] == 3 * 4 * 4
+
+
+def test_cache_is_keyed_by_model(tmp_path) -> None:
+    cache_path = tmp_path / "embeddings.sqlite3"
+    CachedEmbedding(
+        LengthEmbedding(embed_dim=4, model_name="a", embedded=[]), cache_path=cache_path
+    ).get_text_embedding("calm")
+
+    other = LengthEmbedding(embed_dim=4, model_name="b", embedded=[])
+    CachedEmbedding(other, cache_path=cache_path).get_text_embedding("calm")
+    assert other.embedded == ["calm"]
@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import aiohttp
+import pytest
+from llama_index.core import StorageContext, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import TextNode
+
+from embedding_pipeline import EmbeddingPipelineConfig, aembed_nodes
+
+
+class FakeEmbeddingServer(ThreadingHTTPServer):
+    """Local embedding endpoint with fixed per-request latency and a concurrency quota.
+
+    Requests beyond max_concurrent get a 429, like a provider enforcing quota.
+    """
+
+    def __init__(self, latency: float, max_concurrent: int):
+        super().__init__(("127.0.0.1", 0), _FakeEmbeddingHandler)
+        self.latency = latency
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.requests = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/embed"
+
+
+class _FakeEmbeddingHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        server = self.server
+        texts = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.requests += 1
+            if server.active >= server.max_concurrent:
+                server.throttled += 1
+                self.send_response(429)
+                self.end_headers()
+                return
+            server.active += 1
+        try:
+            time.sleep(server.latency)
+            body = json.dumps([[float(len(t)), 1.0] for t in texts]).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+class HTTPError429(Exception):
+    status_code = 429
+
+
+class FakeServerEmbedding(BaseEmbedding):
+    """Embedding client for FakeEmbeddingServer, one HTTP request per batch."""
+
+    url: str
+
+    def _post(self, texts: List[str]) -> List[List[float]]:
+        request = urllib.request.Request(self.url, data=json.dumps(texts).encode())
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    async def _apost(self, texts: List[str]) -> List[List[float]]:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(self.url, data=json.dumps(texts)) as response:
+                if response.status == 429:
+                    raise HTTPError429("429 Too Many Requests")
+                return json.loads(await response.read())
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._post([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._apost([query]))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._post([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._post(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self._apost(texts)
+
+
+@pytest.fixture
+def fake_server():
+    servers = []
+
+    def start(latency: float, max_concurrent: int) -> FakeEmbeddingServer:
+        server = FakeEmbeddingServer(latency, max_concurrent)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _nodes(count: int) -> List[TextNode]:
+    return [TextNode(text=f"chunk number {i}") for i in range(count)]
+
+
+async def test_throttled_batches_are_retried(fake_server) -> None:
+    server = fake_server(latency=0.02, max_concurrent=2)
+    nodes = _nodes(120)
+    config = EmbeddingPipelineConfig(
+        batch_size=10,
+        max_in_flight=6,
+        requests_per_second=1000,
+        backoff_seconds=0.01,
+        max_backoff_seconds=0.05,
+    )
+
+    stats = await aembed_nodes(
+        nodes, FakeServerEmbedding(url=server.url), config=config
+    )
+
+    assert server.throttled > 0
+    assert stats.throttled == server.throttled
+    assert stats.chunks == 120
+    assert all(node.embedding == [float(len(node.text)), 1.0] for node in nodes)
+
+
+async def test_pipeline_outperforms_default_index_build(fake_server) -> None:
+    server = fake_server(latency=0.03, max_concurrent=8)
+    embed_model = FakeServerEmbedding(url=server.url)
+
+    baseline_nodes = _nodes(200)
+    started = time.perf_counter()
+    VectorStoreIndex(
+        baseline_nodes,
+        storage_context=StorageContext.from_defaults(),
+        embed_model=embed_model,
+    )
+    baseline_rate = len(baseline_nodes) / (time.perf_counter() - started)
+
+    config = EmbeddingPipelineConfig(
+        batch_size=50, max_in_flight=4, requests_per_second=1000
+    )
+    stats = await aembed_nodes(_nodes(200), embed_model, config=config)
+
+    assert stats.chunks_per_second > 3 * baseline_rate
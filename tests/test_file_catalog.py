@@ -0,0 +1,49 @@
+import pytest
+
+from doc_summaries import SummaryStore
+from file_catalog import FileCatalog
+from ingestion import IngestionManifest, build_index
+from utils import get_routed_tools
+
+
+@pytest.fixture
+def catalog_index(corpus, embed_model):
+    data_dir, persist_dir = corpus
+    (data_dir / "sleep_hygiene.txt").write_text("Keep a regular bedtime routine.")
+    index = build_index(data_dir, persist_dir)
+    manifest = IngestionManifest.load(persist_dir)
+    summaries = SummaryStore(persist_dir)
+    return index, FileCatalog.build(index, manifest, summaries), manifest, summaries
+
+
+def test_catalog_resolves_and_searches_files(catalog_index) -> None:
+    _, catalog, _, _ = catalog_index
+
+    assert catalog.resolve("cbt.txt") == "cbt.txt"
+    assert catalog.resolve("Box Breathing") == "breathing.txt"
+    assert catalog.resolve("the sleep document") == "sleep_hygiene.txt"
+    assert catalog.resolve("mindfulness") is None
+
+    assert [e.file_name for e in catalog.search("bedtime routine")] == [
+        "sleep_hygiene.txt"
+    ]
+    listing = catalog.describe()
+    assert listing.splitlines()[0].startswith("- breathing.txt (1 chunks): Box")
+
+
+async def test_routed_tools_filter_by_file_and_stay_constant(catalog_index) -> None:
+    index, catalog, manifest, summaries = catalog_index
+    tools = get_routed_tools(index, catalog, manifest, summaries)
+    assert [t.metadata.name for t in tools] == [
+        "search_documents",
+        "list_documents",
+        "summarize_document",
+    ]
+    search = tools[0]
+
+    output = await search.acall(query="how to breathe", file_name="breathing")
+    sources = output.raw_output.source_nodes
+    assert {n.node.metadata["file_name"] for n in sources} == {"breathing.txt"}
+
+    output = await search.acall(query="anything", file_name="unknown.pdf")
+    assert "list_documents" in output.content
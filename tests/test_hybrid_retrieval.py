@@ -0,0 +1,75 @@
+import asyncio
+from typing import List
+
+import pytest
+from llama_index.core import Settings, load_index_from_storage
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import QueryBundle
+
+from ingestion import build_index, incremental_update
+from keyword_index import KEYWORDS_FNAME
+from retrieval import aretrieve
+from vector_store import load_storage_context
+
+
+class SlowEmbedding(MockEmbedding):
+    """Mock embedding model whose query embeddings never arrive in time."""
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        await asyncio.sleep(10)
+        return self._get_query_embedding(query)
+
+
+pytestmark = pytest.mark.usefixtures("embed_model")
+
+
+@pytest.fixture
+def dirs(corpus):
+    data_dir, persist_dir = corpus
+    (data_dir / "medication.txt").write_text("Sertraline is an SSRI antidepressant.")
+    return data_dir, persist_dir
+
+
+def _files(index, query, mode):
+    retriever = index.as_retriever(vector_store_query_mode=mode, similarity_top_k=2)
+    return [n.node.metadata["file_name"] for n in retriever.retrieve(query)]
+
+
+def test_keyword_and_hybrid_modes_find_exact_terms(dirs) -> None:
+    data_dir, persist_dir = dirs
+    build_index(data_dir, persist_dir)
+    index = load_index_from_storage(load_storage_context(persist_dir))
+
+    assert _files(index, "what is sertraline?", "text_search") == ["medication.txt"]
+    assert _files(index, "sertraline", "hybrid")[0] == "medication.txt"
+
+    # incremental updates keep the keyword index in step with the vectors
+    (data_dir / "medication.txt").unlink()
+    (data_dir / "hotline.txt").write_text("Call the 988 Lifeline any time.")
+    incremental_update(index, data_dir, persist_dir)
+    reloaded = load_index_from_storage(load_storage_context(persist_dir))
+    assert _files(reloaded, "sertraline", "text_search") == []
+    assert _files(reloaded, "988 lifeline", "text_search") == ["hotline.txt"]
+
+
+def test_store_without_keywords_is_backfilled_from_docstore(dirs) -> None:
+    data_dir, persist_dir = dirs
+    build_index(data_dir, persist_dir)
+    (persist_dir / KEYWORDS_FNAME).unlink()
+
+    index = load_index_from_storage(load_storage_context(persist_dir))
+
+    assert _files(index, "box breathing", "text_search") == ["breathing.txt"]
+
+
+async def test_slow_embedding_falls_back_to_keyword_search(dirs) -> None:
+    data_dir, persist_dir = dirs
+    build_index(data_dir, persist_dir)
+    Settings.embed_model = SlowEmbedding(embed_dim=8)
+    index = load_index_from_storage(load_storage_context(persist_dir))
+
+    nodes = await aretrieve(
+        index, QueryBundle("sertraline"), mode="hybrid", timeout=0.05
+    )
+
+    assert [n.node.metadata["file_name"] for n in nodes] == ["medication.txt"]
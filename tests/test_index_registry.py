@@ -0,0 +1,194 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from llama_index.core import Document, StorageContext, VectorStoreIndex
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+
+from index_registry import IndexRegistry
+from index_versions import (
+    current_version_dir,
+    new_version_dir,
+    prune_versions,
+    publish_version,
+    update_version,
+)
+import doc_summaries
+from doc_summaries import DocumentSummary, SummaryStore
+from ingestion import IngestionManifest, build_index
+
+
+pytestmark = pytest.mark.usefixtures("embed_model")
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "cbt.txt").write_text("Cognitive behavioural therapy basics.")
+    return data_dir, tmp_path / "storage"
+
+
+def content_hash_of(version_dir) -> str:
+    return IngestionManifest.load(version_dir).entries["cbt.txt"].content_hash
+
+
+def test_index_is_loaded_once_and_shared(dirs) -> None:
+    data_dir, persist_dir = dirs
+    registry = IndexRegistry()
+
+    first = registry.get(persist_dir, data_dir)
+    second = registry.get(persist_dir, data_dir)
+
+    assert first is second
+    assert registry.version(persist_dir) == 1
+
+
+def test_update_publishes_a_new_version_only_when_something_changed(dirs) -> None:
+    data_dir, persist_dir = dirs
+    registry = IndexRegistry()
+    registry.get(persist_dir, data_dir)
+    # the first update summarizes the freshly built index
+    registry.update(persist_dir, data_dir)
+    old = registry.get(persist_dir, data_dir)
+    old_files = sorted(p.name for p in old.storage_dir.iterdir())
+
+    registry.update(persist_dir, data_dir)
+    assert registry.version(persist_dir) == old.version
+
+    (data_dir / "grounding.txt").write_text("Name five things you can see.")
+    registry.update(persist_dir, data_dir)
+
+    new = registry.get(persist_dir, data_dir)
+    # searchable first, then again once the new document has its summary
+    assert new.version == old.version + 2
+    assert new.storage_dir != old.storage_dir and new.revision != old.revision
+    assert len(new.index.index_struct.nodes_dict) == 2
+    # the version readers were using was left untouched
+    assert len(old.index.index_struct.nodes_dict) == 1
+    assert sorted(p.name for p in old.storage_dir.iterdir()) == old_files
+    # other processes notice the update like any other published version
+    other = IndexRegistry()
+    other.get(persist_dir, data_dir)
+    assert other.get(persist_dir, data_dir).storage_dir == new.storage_dir
+
+
+def test_rebuild_is_published_atomically_and_hot_swapped(dirs) -> None:
+    data_dir, persist_dir = dirs
+    registry = IndexRegistry()
+    old = registry.get(persist_dir, data_dir)
+    assert persist_dir.is_symlink()
+
+    (data_dir / "grounding.txt").write_text("Name five things you can see.")
+    version_dir = new_version_dir(persist_dir)
+    build_index(data_dir, version_dir)
+
+    # Nothing changes for readers until the new version is published
+    assert not registry.reload_if_changed(persist_dir)
+    assert len(registry.get(persist_dir, data_dir).index.index_struct.nodes_dict) == 1
+
+    publish_version(persist_dir, version_dir)
+    assert registry.reload_if_changed(persist_dir)
+
+    new = registry.get(persist_dir, data_dir)
+    assert new.version == 2 and new.storage_dir == version_dir
+    assert len(new.index.index_struct.nodes_dict) == 2
+    # the old handle keeps serving from the previous version
+    assert old.index.as_retriever().retrieve("therapy")
+
+    assert prune_versions(persist_dir, keep=1) == [old.storage_dir]
+    assert not old.storage_dir.exists()
+
+
+def test_concurrent_updates_are_published_one_after_the_other(dirs) -> None:
+    data_dir, persist_dir = dirs
+    IndexRegistry().get(persist_dir, data_dir)
+    update_version(persist_dir, data_dir)
+    (data_dir / "grounding.txt").write_text("Name five things you can see.")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = list(
+            pool.map(
+                lambda _: update_version(persist_dir, data_dir, summarize=False), "ab"
+            )
+        )
+
+    # the second update starts from the first one's version and finds nothing to do
+    published = [version_dir for version_dir, _ in results if version_dir is not None]
+    assert len(published) == 1
+    assert current_version_dir(persist_dir) == published[0]
+
+
+def test_legacy_vector_store_is_migrated_in_a_new_version(dirs) -> None:
+    data_dir, persist_dir = dirs
+    # nothing to ingest, so the conversion alone makes the new version
+    (data_dir / "cbt.txt").unlink()
+    storage_context = StorageContext.from_defaults(vector_store=SimpleVectorStore())
+    VectorStoreIndex.from_documents(
+        [Document(text="Cognitive behavioural therapy basics.")],
+        storage_context=storage_context,
+    )
+    storage_context.persist(persist_dir=str(persist_dir))
+    files = sorted(os.listdir(persist_dir))
+
+    registry = IndexRegistry()
+    assert registry.get(persist_dir, data_dir).index.as_retriever().retrieve("therapy")
+    assert sorted(os.listdir(persist_dir)) == files
+
+    version_dir, _ = update_version(persist_dir, data_dir)
+    assert version_dir is not None
+    assert not (version_dir / "default__vector_store.json").exists()
+    assert (version_dir / "vector_ids.json").exists()
+
+
+def test_update_is_published_before_documents_are_summarized(
+    dirs, monkeypatch
+) -> None:
+    data_dir, persist_dir = dirs
+    searchable = []
+
+    def summarize(nodes, content_hash):
+        # the document is already served while its summary is being made
+        manifest = IngestionManifest.load(current_version_dir(persist_dir))
+        hashes = {entry.content_hash for entry in manifest.entries.values()}
+        searchable.append(content_hash in hashes)
+        return DocumentSummary(content_hash=content_hash, summary="Summary.")
+
+    monkeypatch.setattr(doc_summaries, "summarize_document", summarize)
+    version_dir, stats = update_version(persist_dir, data_dir)
+
+    assert searchable == [True]
+    # without a published version the update is a rebuild, with its real stats
+    assert stats.added == 1 and stats.nodes_inserted == 1
+    assert SummaryStore(version_dir).get("cbt.txt", content_hash_of(version_dir))
+
+
+def test_summarization_failure_does_not_fail_ingestion(dirs, monkeypatch) -> None:
+    data_dir, persist_dir = dirs
+
+    def fail(nodes, content_hash):
+        raise RuntimeError("LLM unavailable")
+
+    monkeypatch.setattr(doc_summaries, "summarize_document", fail)
+    version_dir, stats = update_version(persist_dir, data_dir)
+
+    assert stats.added == 1
+    assert current_version_dir(persist_dir) == version_dir
+    summaries = SummaryStore(version_dir)
+    assert summaries.get("cbt.txt", content_hash_of(version_dir)) is None
+    handle = IndexRegistry().get(persist_dir, data_dir)
+    assert handle.index.as_retriever().retrieve("therapy")
+
+
+def test_update_shares_unchanged_files_with_the_previous_version(dirs) -> None:
+    data_dir, persist_dir = dirs
+    old_dir, _ = update_version(persist_dir, data_dir, summarize=False)
+    (data_dir / "grounding.txt").write_text("Name five things you can see.")
+    new_dir, _ = update_version(persist_dir, data_dir, summarize=False)
+
+    old_segments = sorted(old_dir.glob("nodes-*.jsonl"))
+    assert old_segments
+    for segment in old_segments:
+        assert os.path.samefile(segment, new_dir / segment.name)
+    # the new document went to a segment of its own
+    assert len(list(new_dir.glob("nodes-*.jsonl"))) == len(old_segments) + 1
@@ -0,0 +1,105 @@
+import os
+
+from llama_index.core import load_index_from_storage
+
+import ingestion
+from ingestion import (
+    IngestionManifest,
+    build_index,
+    incremental_update,
+)
+from vector_store import load_storage_context
+
+
+def _load(persist_dir):
+    return load_index_from_storage(load_storage_context(persist_dir))
+
+
+def test_build_records_manifest(corpus, embed_model) -> None:
+    data_dir, persist_dir = corpus
+    index = build_index(data_dir, persist_dir)
+
+    manifest = IngestionManifest.load(persist_dir)
+    assert set(manifest.entries) == {"cbt.txt", "breathing.txt"}
+    assert len(index.index_struct.nodes_dict) == 2
+    assert len(embed_model.embedded) == 2
+
+
+def test_unchanged_files_are_not_reembedded(corpus, embed_model) -> None:
+    data_dir, persist_dir = corpus
+    build_index(data_dir, persist_dir)
+    embed_model.embedded.clear()
+
+    stats = incremental_update(_load(persist_dir), data_dir, persist_dir)
+
+    assert stats.unchanged == 2
+    assert not stats.changed
+    assert embed_model.embedded == []
+
+
+def test_new_changed_and_deleted_files(corpus, embed_model) -> None:
+    data_dir, persist_dir = corpus
+    build_index(data_dir, persist_dir)
+    embed_model.embedded.clear()
+
+    (data_dir / "grounding.txt").write_text("Name five things you can see.")
+    (data_dir / "cbt.txt").write_text("CBT links thoughts, feelings and actions.")
+    (data_dir / "breathing.txt").unlink()
+
+    stats = incremental_update(_load(persist_dir), data_dir, persist_dir)
+
+    assert (stats.added, stats.updated, stats.removed) == (1, 1, 1)
+    # embedded text carries the file_path metadata header, so match on content
+    assert len(embed_model.embedded) == 2
+    assert any(t.endswith("CBT links thoughts, feelings and actions.") for t in embed_model.embedded)
+    assert any(t.endswith("Name five things you can see.") for t in embed_model.embedded)
+
+    index = _load(persist_dir)
+    texts = sorted(
+        index.docstore.get_node(node_id).get_content()
+        for node_id in index.index_struct.nodes_dict.values()
+    )
+    assert texts == [
+        "CBT links thoughts, feelings and actions.",
+        "Name five things you can see.",
+    ]
+    assert index.vector_store.node_count == 2
+
+
+def test_legacy_index_is_adopted_without_reembedding(corpus, embed_model) -> None:
+    data_dir, persist_dir = corpus
+    build_index(data_dir, persist_dir)
+    os.remove(persist_dir / "ingestion_manifest.json")
+    embed_model.embedded.clear()
+
+    stats = incremental_update(_load(persist_dir), data_dir, persist_dir)
+
+    assert stats.unchanged == 2
+    assert embed_model.embedded == []
+
+
+def test_large_files_are_streamed_in_bounded_batches(
+    corpus, embed_model, monkeypatch
+) -> None:
+    data_dir, persist_dir = corpus
+    paragraphs = [f"Journal entry {i}. " + "Noticing thoughts. " * 300 for i in range(12)]
+    (data_dir / "journal.txt").write_text("\n\n".join(paragraphs))
+
+    batch_sizes = []
+    embed_nodes = ingestion.embed_nodes
+
+    def recording_embed_nodes(nodes, **kwargs):
+        batch_sizes.append(len(nodes))
+        return embed_nodes(nodes, **kwargs)
+
+    monkeypatch.setattr(ingestion, "embed_nodes", recording_embed_nodes)
+    monkeypatch.setattr(
+        ingestion, "MAX_BUFFER_BYTES", 3 * ingestion.NODE_OVERHEAD_BYTES
+    )
+    index = build_index(data_dir, persist_dir)
+
+    manifest = IngestionManifest.load(persist_dir)
+    total = sum(len(entry.node_ids) for entry in manifest.entries.values())
+    assert len(manifest.entries["journal.txt"].node_ids) > 3
+    assert max(batch_sizes) <= 3
+    assert sum(batch_sizes) == total == len(index.index_struct.nodes_dict)
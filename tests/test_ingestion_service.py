@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from index_versions import current_version_dir
+from ingestion import IngestionManifest
+from ingestion_service import IngestionService, create_app
+
+
+pytestmark = pytest.mark.usefixtures("embed_model")
+
+
+@pytest.fixture
+def service(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "cbt.txt").write_text("Cognitive behavioural therapy basics.")
+    return IngestionService(tmp_path / "storage", data_dir)
+
+
+async def test_back_to_back_requests_are_coalesced(service) -> None:
+    first = service.submit("update")
+    assert service.submit("update") is first
+    assert service.submit("rebuild") is first
+    assert first.requests == 3 and first.kind == "rebuild"
+
+    assert await service.run_next() is first
+    assert first.state == "succeeded"
+    assert current_version_dir(service.persist_dir).name == first.version
+
+    # the next upload is ingested incrementally into a new version
+    (service.data_dir / "breathing.txt").write_text("Box breathing: in four.")
+    second = service.submit("update")
+    assert second is not first
+    assert await service.run_next() is second
+
+    assert second.stats["added"] == 1 and second.stats["unchanged"] == 1
+    manifest = IngestionManifest.load(service.persist_dir)
+    assert sorted(manifest.entries) == ["breathing.txt", "cbt.txt"]
+
+
+async def test_jobs_are_run_and_reported_over_http(service) -> None:
+    async with TestClient(TestServer(create_app(service))) as client:
+        response = await client.post("/jobs", json={"kind": "update"})
+        assert response.status == 202
+        job_id = (await response.json())["id"]
+
+        for _ in range(200):
+            job = await (await client.get(f"/jobs/{job_id}")).json()
+            if job["state"] in ("succeeded", "failed"):
+                break
+            await asyncio.sleep(0.05)
+
+        assert job["state"] == "succeeded", job["error"]
+        health = await (await client.get("/health")).json()
+        assert health["version"] == job["version"]
+        assert (await client.post("/jobs", json={"kind": "bogus"})).status == 400
+
+
+@pytest.mark.parametrize("body", ["not json", "   ", '["update"]', "null"])
+async def test_malformed_job_requests_are_rejected(service, body) -> None:
+    async with TestClient(TestServer(create_app(service))) as client:
+        response = await client.post("/jobs", data=body)
+        assert response.status == 400
+        assert "error" in await response.json()
+    assert not service.jobs
@@ -0,0 +1,80 @@
+import pytest
+from llama_index.core.schema import MetadataMode
+
+import parse_cache as parse_cache_module
+from document_loader import iter_nodes
+from ingestion import file_content_hash
+from parse_cache import ParseCache
+
+
+@pytest.fixture
+def files(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    paths = []
+    for name, text in [
+        ("cbt.txt", "Cognitive behavioural therapy basics. " * 200),
+        ("breathing.txt", "Box breathing: in four, hold four. " * 200),
+        ("grounding.txt", "Name five things you can see."),
+    ]:
+        path = data_dir / name
+        path.write_text(text)
+        paths.append((path, file_content_hash(path)))
+    return paths
+
+
+def _texts(nodes):
+    return [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+
+
+def test_pool_parses_like_the_loader_and_caches_results(
+    tmp_path, files, monkeypatch
+) -> None:
+    cache = ParseCache(tmp_path / "cache", workers=2, min_pool_bytes=0)
+    try:
+        first = {path: list(nodes) for path, nodes in cache.parse(files)}
+    finally:
+        cache.shutdown()
+
+    assert list(first) == [path for path, _ in files]
+    for path, _ in files:
+        assert _texts(first[path]) == _texts(iter_nodes(path))
+
+    # a restart reads everything back from the cache, with the same node ids
+    def fail(path):
+        raise AssertionError(f"{path} should not be parsed again")
+
+    monkeypatch.setattr(parse_cache_module, "iter_nodes", fail)
+    restarted = ParseCache(tmp_path / "cache", workers=1)
+    second = {path: list(nodes) for path, nodes in restarted.parse(files)}
+
+    for path, _ in files:
+        assert [n.node_id for n in second[path]] == [n.node_id for n in first[path]]
+        assert _texts(second[path]) == _texts(first[path])
+
+
+def test_changed_content_is_parsed_again(tmp_path, files) -> None:
+    cache = ParseCache(tmp_path / "cache", workers=1)
+    path, content_hash = files[2]
+    list(next(cache.parse([(path, content_hash)]))[1])
+
+    path.write_text("Name five things you can hear.")
+    (_, nodes), = cache.parse([(path, file_content_hash(path))])
+
+    assert "hear" in list(nodes)[0].text
+
+
+def test_cleaning_settings_are_part_of_the_cache_key(monkeypatch) -> None:
+    from llama_index.core import Settings
+
+    import clean_document
+
+    def signature():
+        return parse_cache_module.parser_signature(Settings.node_parser)
+
+    cleaned = signature()
+    monkeypatch.setattr(clean_document, "CLEANING_ENABLED", False)
+    raw = signature()
+    monkeypatch.setattr(clean_document, "BOILERPLATE_MIN_PAGES", 5)
+
+    assert len({cleaned, raw, signature()}) == 3
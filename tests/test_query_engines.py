@@ -0,0 +1,49 @@
+import pytest
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import MetadataFilters
+
+from query_engines import QueryEngineCache
+from vector_store import new_storage_context
+
+
+pytestmark = pytest.mark.usefixtures("embed_model")
+
+
+def _index(texts):
+    nodes = [TextNode(text=text, metadata={"file_name": "a.pdf"}) for text in texts]
+    return VectorStoreIndex(nodes, storage_context=new_storage_context())
+
+
+def _filters(file_name):
+    return MetadataFilters.from_dicts([{"key": "file_name", "value": file_name}])
+
+
+def test_engines_are_shared_per_index_and_filter_shape() -> None:
+    cache = QueryEngineCache()
+    index = _index(["grounding", "breathing"])
+
+    def engine_for(target, file_name):
+        filters = _filters(file_name)
+        return cache.query_engine(target, similarity_top_k=2, filters=filters)
+
+    engine = engine_for(index, "a.pdf")
+    assert engine_for(index, "a.pdf") is engine
+    assert engine_for(index, "b.pdf") is not engine
+    assert engine_for(_index(["sleep"]), "a.pdf") is not engine
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    cache.invalidate(index)
+    assert engine_for(index, "a.pdf") is not engine
+
+
+def test_reused_retriever_sees_nodes_inserted_later() -> None:
+    cache = QueryEngineCache()
+    index = _index(["grounding"])
+    retriever = cache.retriever(index, similarity_top_k=5)
+
+    index.insert_nodes([TextNode(text="breathing", metadata={"file_name": "a.pdf"})])
+
+    assert cache.retriever(index, similarity_top_k=5) is retriever
+    texts = {n.node.get_content() for n in retriever.retrieve("exercise")}
+    assert texts == {"grounding", "breathing"}
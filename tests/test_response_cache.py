@@ -0,0 +1,40 @@
+import response_cache as rc
+from response_cache import ENTRY_OVERHEAD_BYTES, ResponseCache
+
+
+def test_lookup_expiry_eviction_and_revision_change(monkeypatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr(rc.time, "time", lambda: now[0])
+    cache = ResponseCache(max_bytes=2 * (ENTRY_OVERHEAD_BYTES + 10), ttl=60)
+
+    cache.put("What is CBT?", "v1", "answer one", mode="hybrid")
+    assert cache.get("  what is   CBT ", "v1", mode="hybrid") == "answer one"
+    assert cache.get("what is cbt", "v1", mode="bm25") is None
+
+    cache.put("breathing", "v1", "answer two", mode="hybrid")
+    cache.get("what is cbt", "v1", mode="hybrid")
+    cache.put("grounding", "v1", "answer 3!!", mode="hybrid")
+    # "breathing" was the least recently used
+    assert cache.get("breathing", "v1", mode="hybrid") is None
+    assert cache.stats["evictions"] == 1
+
+    now[0] += 61
+    assert cache.get("grounding", "v1", mode="hybrid") is None
+
+    cache.put("grounding", "v1", "answer 3!!", mode="hybrid")
+    assert cache.get("grounding", "v2", mode="hybrid") is None
+    assert cache.stats["entries"] == 0
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_answers_survive_restart(tmp_path) -> None:
+    path = tmp_path / "responses.sqlite"
+    cache = ResponseCache(path=path)
+    cache.put("what is cbt", "v1", "answer", mode="hybrid")
+    cache.put("sleep", "v1", "dropped", mode="hybrid")
+    cache.get("sleep", "v2", mode="hybrid")
+    cache.put("what is cbt", "v2", "new answer", mode="hybrid")
+
+    restarted = ResponseCache(path=path)
+    assert restarted.get("What is CBT?", "v2", mode="hybrid") == "new answer"
+    assert restarted.stats["entries"] == 1
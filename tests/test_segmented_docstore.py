@@ -0,0 +1,68 @@
+import json
+
+from llama_index.core.schema import TextNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+
+from segmented_docstore import SegmentedDocumentStore
+
+
+def _nodes(prefix, count):
+    return [
+        TextNode(id_=f"{prefix}-{i}", text=f"{prefix} text {i}") for i in range(count)
+    ]
+
+
+def test_nodes_are_appended_to_segments_and_shared_by_later_versions(tmp_path) -> None:
+    first, second = tmp_path / "v1", tmp_path / "v2"
+    docstore = SegmentedDocumentStore(first)
+    docstore.add_documents(_nodes("a", 3))
+    docstore.persist(str(first / "docstore.json"))
+    # the index file only locates nodes, their text is in the segment
+    index = json.loads((first / "docstore.json").read_text())
+    assert "a text 0" not in json.dumps(index)
+    (segment,) = first.glob("nodes-*.jsonl")
+
+    reopened = SegmentedDocumentStore.from_persist_dir(first)
+    reopened.add_documents(_nodes("b", 1))
+    reopened.delete_document("a-1")
+    reopened.persist(str(second / "docstore.json"))
+
+    loaded = SegmentedDocumentStore.from_persist_dir(second)
+    assert sorted(loaded.docs) == ["a-0", "a-2", "b-0"]
+    assert loaded.get_node("a-2").text == "a text 2"
+    # the first version's segment was linked, not rewritten
+    assert (second / segment.name).samefile(segment)
+    assert sorted(SegmentedDocumentStore.from_persist_dir(first).docs) == [
+        "a-0",
+        "a-1",
+        "a-2",
+    ]
+
+
+def test_mostly_deleted_segments_are_compacted(tmp_path) -> None:
+    docstore = SegmentedDocumentStore(tmp_path / "v1")
+    docstore.add_documents(_nodes("a", 4))
+    docstore.persist(str(tmp_path / "v1" / "docstore.json"))
+    for i in range(3):
+        docstore.delete_document(f"a-{i}")
+    docstore.persist(str(tmp_path / "v2" / "docstore.json"))
+
+    (segment,) = (tmp_path / "v2").glob("nodes-*.jsonl")
+    assert segment.read_text().count("\n") == 1
+    assert SegmentedDocumentStore.from_persist_dir(tmp_path / "v2").get_node("a-3")
+
+
+def test_simple_docstore_file_is_converted_to_segments(tmp_path) -> None:
+    legacy = SimpleDocumentStore()
+    legacy.add_documents(_nodes("a", 2))
+    legacy.persist(str(tmp_path / "v1" / "docstore.json"))
+
+    docstore = SegmentedDocumentStore.from_persist_dir(tmp_path / "v1")
+    assert docstore.get_node("a-1").text == "a text 1"
+    docstore.persist(str(tmp_path / "v2" / "docstore.json"))
+
+    assert len(list((tmp_path / "v2").glob("nodes-*.jsonl"))) == 1
+    assert sorted(SegmentedDocumentStore.from_persist_dir(tmp_path / "v2").docs) == [
+        "a-0",
+        "a-1",
+    ]
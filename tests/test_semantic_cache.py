@@ -0,0 +1,65 @@
+import pytest
+
+from semantic_cache import SemanticCache, is_guarded
+
+
+def test_paraphrase_hits_within_scope_and_revision() -> None:
+    cache = SemanticCache(threshold=0.9, max_entries=2)
+    cache.add("how do I relax before an exam", [1.0, 0.0, 0.1], "v1", "breathe")
+
+    # cosine ~0.99 with the stored question
+    assert cache.lookup("tips to calm down for a test", [0.9, 0.05, 0.1], "v1")
+    assert cache.lookup("what is CBT", [0.0, 1.0, 0.0], "v1") is None
+    assert cache.lookup("relax before exam", [1.0, 0.0, 0.1], "v1", "other") is None
+
+    cache.add("what is CBT", [0.0, 1.0, 0.0], "v1", "therapy")
+    assert cache.lookup("exam stress", [1.0, 0.0, 0.1], "v1") == "breathe"
+    cache.add("sleep hygiene", [0.0, 0.0, 1.0], "v1", "routine")
+    # the exam question was used most recently, so CBT was replaced
+    assert cache.lookup("what is CBT", [0.0, 1.0, 0.0], "v1") is None
+    assert cache.lookup("exam nerves", [1.0, 0.0, 0.1], "v1") == "breathe"
+
+    assert cache.lookup("exam nerves", [1.0, 0.0, 0.1], "v2") is None
+    assert cache.stats["entries"] == 0
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "I keep thinking about ending my life",
+        "I want to end my life",
+        "how do I stop hurting myself",
+        "I have been harming myself again",
+        "sometimes I want to take my own life",
+        "life is not worth living",
+        "I feel like dying",
+        "everyone would be better off dead without me",
+        "I don't want to be alive",
+        "I keep cutting myself",
+    ],
+)
+def test_crisis_phrasings_are_guarded(query) -> None:
+    assert is_guarded(query)
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["how can I sleep better", "what is the end of a CBT session like"],
+)
+def test_everyday_questions_are_not_guarded(query) -> None:
+    assert not is_guarded(query)
+
+
+def test_crisis_questions_bypass_the_cache() -> None:
+    assert is_guarded("I want to kill myself")
+    assert is_guarded("Is SUICIDE common?")
+    assert not is_guarded("how can I sleep better")
+
+    cache = SemanticCache(threshold=0.9)
+    cache.add("I feel like I want to die", [1.0, 0.0], "v1", "answer")
+    assert cache.stats["entries"] == 0
+
+    cache.add("I feel very low", [1.0, 0.0], "v1", "answer")
+    guarded = cache.lookup("I feel low and want to end it all", [1.0, 0.0], "v1")
+    assert guarded is None
+    assert cache.stats["guarded"] == 1
@@ -0,0 +1,247 @@
+import os
+import threading
+
+import numpy as np
+from llama_index.core import StorageContext
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores import MetadataFilters
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryMode
+
+from ann_index import CENTROIDS_FNAME as IVF_CENTROIDS_FNAME
+import vector_store
+from metadata_index import METADATA_INDEX_FNAME
+from quantization import evaluate_recall
+from vector_store import VECTORS_FNAME, MemmapVectorStore, migrate_vector_store
+
+
+def _nodes(vectors, file_name="a.pdf", doc_id="doc-a"):
+    nodes = []
+    for i, vector in enumerate(vectors):
+        node = TextNode(
+            id_=f"{doc_id}-{i}",
+            text=f"text {i}",
+            embedding=list(map(float, vector)),
+            metadata={"file_name": file_name, "page_label": str(i + 1)},
+        )
+        node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=doc_id)
+        nodes.append(node)
+    return nodes
+
+
+def _top_ids(store, vector, k=3, exact=False, nprobe=None, **kwargs):
+    query = VectorStoreQuery(query_embedding=list(vector), similarity_top_k=k, **kwargs)
+    options = {"exact": exact} if nprobe is None else {"exact": exact, "nprobe": nprobe}
+    return store.query(query, **options).ids
+
+
+def _persist(store, persist_dir):
+    store.persist(str(persist_dir / "default__vector_store.json"))
+
+
+def test_topk_matches_brute_force_after_reload(tmp_path) -> None:
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 16)).astype(np.float32)
+    store = MemmapVectorStore()
+    store.add(_nodes(vectors))
+    _persist(store, tmp_path)
+
+    loaded = MemmapVectorStore.from_persist_dir(tmp_path)
+    assert isinstance(loaded._base, np.memmap)
+
+    query = rng.normal(size=16)
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = [f"doc-a-{i}" for i in np.argsort(-(normed @ query))[:3]]
+    assert _top_ids(loaded, query) == expected
+
+
+def test_delete_and_add_survive_compaction(tmp_path) -> None:
+    store = MemmapVectorStore()
+    store.add(_nodes(np.eye(4)))
+    _persist(store, tmp_path)
+
+    loaded = MemmapVectorStore.from_persist_dir(tmp_path)
+    loaded.delete("doc-a")
+    loaded.add(_nodes(np.eye(4)[:2], file_name="b.pdf", doc_id="doc-b"))
+    assert _top_ids(loaded, [1, 0, 0, 0], k=1) == ["doc-b-0"]
+    _persist(loaded, tmp_path)
+
+    reloaded = MemmapVectorStore.from_persist_dir(tmp_path)
+    assert reloaded.node_count == 2
+    assert np.load(tmp_path / VECTORS_FNAME).shape == (2, 4)
+    assert _top_ids(reloaded, [0, 1, 0, 0], k=1) == ["doc-b-1"]
+
+
+def test_metadata_filters_restrict_candidates() -> None:
+    store = MemmapVectorStore()
+    store.add(_nodes(np.eye(3)))
+    store.add(_nodes(np.eye(3), file_name="b.pdf", doc_id="doc-b"))
+
+    filters = MetadataFilters.from_dicts([{"key": "file_name", "value": "b.pdf"}])
+    assert _top_ids(store, [0, 0, 1], k=1, filters=filters) == ["doc-b-2"]
+
+
+def test_legacy_json_store_is_read_without_writing_and_migrated_offline(
+    tmp_path,
+) -> None:
+    nodes = _nodes(np.eye(3))
+    legacy = StorageContext.from_defaults(vector_store=SimpleVectorStore())
+    legacy.docstore.add_documents(nodes)
+    legacy.vector_store.add(nodes)
+    legacy.persist(persist_dir=str(tmp_path))
+    files = sorted(os.listdir(tmp_path))
+
+    store = MemmapVectorStore.from_persist_dir(tmp_path)
+    assert store.node_count == 3
+    assert _top_ids(store, [0, 1, 0], k=1) == ["doc-a-1"]
+    # loading the index to serve it leaves the directory alone
+    assert sorted(os.listdir(tmp_path)) == files
+
+    assert migrate_vector_store(tmp_path)
+    assert not (tmp_path / "default__vector_store.json").exists()
+    assert not migrate_vector_store(tmp_path)
+    store = MemmapVectorStore.from_persist_dir(tmp_path)
+    assert _top_ids(store, [0, 1, 0], k=1) == ["doc-a-1"]
+    assert store._keywords.complete
+
+
+def test_ivf_index_recall_and_incremental_insert(tmp_path) -> None:
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(40, 32))
+    vectors = centers[rng.integers(0, 40, size=3000)] + rng.normal(
+        scale=0.3, size=(3000, 32)
+    )
+    store = MemmapVectorStore(ann_min_vectors=1000)
+    store.add(_nodes(vectors))
+    _persist(store, tmp_path)
+    assert (tmp_path / IVF_CENTROIDS_FNAME).exists()
+
+    loaded = MemmapVectorStore.from_persist_dir(tmp_path, ann_min_vectors=1000)
+    queries = centers[:20] + rng.normal(scale=0.3, size=(20, 32))
+    hits = 0
+    for query in queries:
+        expected = _top_ids(loaded, query, k=10, exact=True)
+        hits += len(set(_top_ids(loaded, query, k=10, nprobe=8)) & set(expected))
+    assert hits / (10 * len(queries)) >= 0.9
+
+    # rows inserted after loading are assigned to a list and found by the probe
+    loaded.add(_nodes([centers[0] * 10], doc_id="doc-new"))
+    assert _top_ids(loaded, centers[0], k=1) == ["doc-new-0"]
+
+    # a store below the threshold drops the index and searches exactly
+    loaded.delete("doc-a")
+    _persist(loaded, tmp_path)
+    assert not (tmp_path / IVF_CENTROIDS_FNAME).exists()
+    assert _top_ids(loaded, centers[0], k=1) == ["doc-new-0"]
+
+
+def test_int8_store_rescoring_and_recall_report(tmp_path) -> None:
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(500, 64)).astype(np.float32)
+    queries = rng.normal(size=(10, 64))
+
+    rescored = MemmapVectorStore(quantization="int8", rescore_factor=4)
+    rescored.add(_nodes(vectors))
+    _persist(rescored, tmp_path / "rescored")
+    exact = MemmapVectorStore()
+    exact.add(_nodes(vectors))
+    for query in queries:
+        assert _top_ids(rescored, query, k=5) == _top_ids(exact, query, k=5)
+
+    # rescoring is opt-in, so by default only the codes are stored
+    codes_only = MemmapVectorStore(quantization="int8")
+    codes_only.add(_nodes(vectors))
+    _persist(codes_only, tmp_path / "codes")
+    assert not (tmp_path / "codes" / VECTORS_FNAME).exists()
+    reloaded = MemmapVectorStore.from_persist_dir(tmp_path / "codes")
+    assert reloaded._codes.nbytes * 4 == vectors.nbytes
+    assert _top_ids(reloaded, vectors[7], k=1) == ["doc-a-7"]
+
+    report = evaluate_recall(vectors, k=10, n_queries=50)
+    assert report["int8_bytes"] < report["float32_bytes"] / 3
+    assert report["recall_int8"] >= 0.9
+    assert report["recall_int8_rescored"] >= report["recall_int8"]
+
+
+def test_indexed_filters_skip_the_metadata_scan(tmp_path, monkeypatch) -> None:
+    store = MemmapVectorStore()
+    store.add(_nodes(np.eye(4)))
+    b_nodes = _nodes(np.eye(4), file_name="b.pdf", doc_id="doc-b")
+    b_nodes[2].metadata["topic"] = "sleep"
+    store.add(b_nodes)
+    _persist(store, tmp_path)
+    assert (tmp_path / METADATA_INDEX_FNAME).exists()
+    loaded = MemmapVectorStore.from_persist_dir(tmp_path)
+
+    pages = MetadataFilters.from_dicts(
+        [
+            {"key": "file_name", "value": "b.pdf"},
+            {"key": "page_label", "value": ["2", "3"], "operator": "in"},
+        ]
+    )
+    topic = MetadataFilters.from_dicts(
+        [{"key": "file_name", "value": "b.pdf"}, {"key": "topic", "value": "sleep"}]
+    )
+    with monkeypatch.context() as patched:
+        patched.setattr(vector_store, "build_metadata_filter_fn", None)
+        assert _top_ids(loaded, [0, 0, 1, 0], k=2, filters=pages) == [
+            "doc-b-2",
+            "doc-b-1",
+        ]
+    # a filter on an unindexed field is scanned over the indexed matches only
+    assert _top_ids(loaded, [1, 0, 0, 0], k=4, filters=topic) == ["doc-b-2"]
+
+    loaded.delete("doc-b")
+    assert _top_ids(loaded, [0, 0, 1, 0], k=2, filters=pages) == []
+
+
+def test_delta_is_spilled_to_disk_while_ingesting(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(vector_store, "SPILL_BYTES", 1)
+    rng = np.random.default_rng(3)
+    vectors = rng.normal(size=(40, 8)).astype(np.float32)
+    spilled = vector_store.new_storage_context(tmp_path).vector_store
+    in_memory = MemmapVectorStore()
+    for start in range(0, 40, 5):
+        batch = _nodes(vectors[start : start + 5], doc_id=f"doc-{start}")
+        spilled.add(batch)
+        in_memory.add(batch)
+
+    assert all(isinstance(part, np.memmap) for part in spilled._delta)
+    assert list(tmp_path.glob("spill-*"))
+    for query in rng.normal(size=(5, 8)):
+        assert _top_ids(spilled, query, k=5) == _top_ids(in_memory, query, k=5)
+    text_query = VectorStoreQuery(
+        query_str="text 3", similarity_top_k=8, mode=VectorStoreQueryMode.TEXT_SEARCH
+    )
+    assert spilled.query(text_query).ids == in_memory.query(text_query).ids
+
+    _persist(spilled, tmp_path)
+    assert not list(tmp_path.glob("spill-*"))
+    reloaded = MemmapVectorStore.from_persist_dir(tmp_path)
+    assert reloaded.query(text_query).ids == in_memory.query(text_query).ids
+    assert _top_ids(reloaded, vectors[7], k=1) == ["doc-5-2"]
+
+
+def test_vectors_are_scored_without_holding_the_store_lock(monkeypatch) -> None:
+    store = MemmapVectorStore()
+    store.add(_nodes(np.eye(4)))
+    scores = vector_store._Matrices.scores
+    added = []
+
+    def add_while_scoring(matrices, q):
+        # another thread inserts while this query is scoring its snapshot
+        def add():
+            if store._lock.acquire(timeout=5):
+                store._lock.release()
+                added.extend(store.add(_nodes([[1, 0, 0, 0]], doc_id="doc-b")))
+
+        thread = threading.Thread(target=add)
+        thread.start()
+        thread.join()
+        return scores(matrices, q)
+
+    monkeypatch.setattr(vector_store._Matrices, "scores", add_while_scoring)
+
+    assert _top_ids(store, [1, 0, 0, 0], k=1, exact=True) == ["doc-a-0"]
+    assert added == ["doc-b-0"]
+    assert store.node_count == 5